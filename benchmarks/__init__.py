@@ -0,0 +1,10 @@
+"""Benchmarks of the shortener.
+
+They are not run by pytest. Run them from the project root, e.g.:
+
+    python -m benchmarks.micro --rows 100000
+    python -m benchmarks.load --app wsgi --scenario resolve --requests 10000 --concurrency 16
+
+Both use a separate database (`benchmark.sqlite3` by default), so the development database is never touched. Pass
+`--keepdb` to keep seeded rows between runs, which matters when benchmarking big tables.
+"""
@@ -0,0 +1,105 @@
+"""Compare plain and compact storage of original URLs (SHORTENER_COMPACT_ORIGINALS): bytes per row and lookup latency.
+
+The table is filled with the same realistic URLs in both modes: a few hundred hosts, with popular ones much more common,
+dated article paths, search and video links, and tracking parameters. Bytes per row count the stored original, its
+compressed rest and the id of its prefix, and the prefix table shared by all rows. Lookups read URLs by random
+shortcuts, the way redirects do when their cache misses.
+"""
+import argparse
+import random
+
+from benchmarks import utils
+
+WORDS = (
+    "news world politics business tech science health sports travel style food video live update report guide review "
+    "how why best new top first last day week year city election market climate study launch"
+).split()
+CAMPAIGNS = ("spring_sale", "weekly_digest", "launch", "black_friday", "newsletter_42")
+
+
+def generate_originals(count: int, hosts: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    host_names = [f"https://www.{rng.choice(WORDS)}{index}.com" for index in range(hosts)]
+    originals = []
+    for _ in range(count):
+        # Zipf-like popularity of hosts.
+        host = host_names[min(int(rng.paretovariate(1.0)) - 1, hosts - 1)]
+        kind = rng.random()
+        if kind < 0.5:
+            slug = "-".join(rng.choices(WORDS, k=rng.randint(3, 8)))
+            path = f"/{rng.randint(2021, 2026)}/{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/{slug}.html"
+        elif kind < 0.7:
+            path = f"/watch?v={rng.getrandbits(64):x}"
+        elif kind < 0.85:
+            path = f"/search?q={'+'.join(rng.choices(WORDS, k=rng.randint(1, 4)))}"
+        else:
+            path = f"/products/{rng.getrandbits(32):x}/{rng.choice(WORDS)}"
+        if rng.random() < 0.4:
+            separator = "&" if "?" in path else "?"
+            path += (
+                f"{separator}utm_source={rng.choice(('twitter', 'facebook', 'newsletter'))}"
+                f"&utm_medium={rng.choice(('social', 'email'))}&utm_campaign={rng.choice(CAMPAIGNS)}"
+            )
+        originals.append(host + path)
+    return originals
+
+
+def fill_table(originals: list[str], batch_size: int = 5000) -> None:
+    from shortener import shortcuts
+    from shortener.models import URL, URLPrefix, clear_url_prefix_cache
+
+    URL.objects.all().delete()
+    URLPrefix.objects.all().delete()
+    clear_url_prefix_cache()
+    rng = random.Random(0)
+    for start in range(0, len(originals), batch_size):
+        urls = []
+        for index, original in enumerate(originals[start : start + batch_size], start=start):
+            url = URL(shortcut=f"{index:x}{''.join(rng.choices(shortcuts.CHARSET, k=5))}", original=original)
+            url.update_original_hash()
+            urls.append(url)
+        URL.objects.bulk_create(urls)
+
+
+def measure_bytes() -> tuple[float, float]:
+    """Get average bytes per row used by the original, and by the prefix table."""
+    from shortener.models import URL, URLPrefix
+
+    rows = 0
+    stored = 0
+    for original, prefix_id, rest in URL.objects.values_list("original", "original_prefix", "original_rest").iterator():
+        rows += 1
+        stored += len(original.encode()) + (len(rest) if rest is not None else 0) + (8 if prefix_id is not None else 0)
+    prefixes = sum(len(prefix.encode()) + 8 for prefix in URLPrefix.objects.values_list("prefix", flat=True))
+    return stored / rows, prefixes / rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    utils.add_database_arguments(parser)
+    parser.add_argument("--rows", type=int, default=50_000, help="Number of URLs in the table.")
+    parser.add_argument("--hosts", type=int, default=500, help="Number of distinct hosts of URLs.")
+    parser.add_argument("--iterations", type=int, default=2000, help="Number of lookups in every mode.")
+    args = parser.parse_args()
+
+    utils.setup_django()
+    from django.test.utils import override_settings
+
+    from shortener import resolvers
+
+    originals = generate_originals(args.rows, args.hosts)
+    with utils.benchmark_database(args.db, args.keepdb):
+        for mode, enabled in (("plain", False), ("compact", True)):
+            with override_settings(SHORTENER_COMPACT_ORIGINALS=enabled):
+                fill_table(originals)
+                row_bytes, prefix_bytes = measure_bytes()
+                shortcuts = utils.sample_shortcuts(1000)
+                timings = utils.measure(lambda: resolvers.get_url(random.choice(shortcuts)), args.iterations)
+            print(
+                f"{mode:<8} bytes/row={row_bytes + prefix_bytes:.1f} (prefix table {prefix_bytes:.1f}) "
+                f"get_url {utils.format_timings(timings)}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""Load driver for the create and resolve paths.
+
+By default requests are sent straight to the WSGI or ASGI application of the project, in-process, which allows to
+count database queries per request. With `--url` requests are sent over HTTP to an already running server instead.
+"""
+import argparse
+import asyncio
+import collections
+import http.client
+import io
+import json
+import os
+import random
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import utils
+
+HOST = "testserver"
+EXPECTED_STATUS = {"resolve": 302, "detail": 200, "create": 201}
+
+
+def build_request(scenario: str, shortcuts: list[str]) -> tuple[str, str, bytes]:
+    """Get method, path and body of a random request of given scenario."""
+    if scenario == "resolve":
+        return "GET", f"/{random.choice(shortcuts)}/", b""
+    if scenario == "detail":
+        return "GET", f"/urls/{random.choice(shortcuts)}/", b""
+    body = json.dumps({"url": f"https://example.com/{random.getrandbits(64):x}"}).encode()
+    return "POST", "/urls/", body
+
+
+class WSGIDriver:
+    def __init__(self):
+        from drf_url_shortener.wsgi import application
+
+        self.application = application
+
+    def request(self, method: str, path: str, body: bytes) -> int:
+        environ = {
+            "REQUEST_METHOD": method,
+            "PATH_INFO": path,
+            "QUERY_STRING": "",
+            "SERVER_NAME": HOST,
+            "SERVER_PORT": "80",
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "CONTENT_TYPE": "application/json",
+            "CONTENT_LENGTH": str(len(body)),
+            "HTTP_HOST": HOST,
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": io.StringIO(),
+            "wsgi.url_scheme": "http",
+            "wsgi.version": (1, 0),
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        statuses = []
+        result = self.application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+        try:
+            for _ in result:
+                pass
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        return int(statuses[0].split()[0])
+
+
+class ASGIDriver:
+    def __init__(self):
+        from drf_url_shortener.asgi import application
+
+        self.application = application
+
+    async def request(self, method: str, path: str, body: bytes) -> int:
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": b"",
+            "headers": [
+                (b"host", HOST.encode()),
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+            "server": (HOST, 80),
+            "client": ("127.0.0.1", 12345),
+        }
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+        statuses = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await asyncio.Event().wait()  # Client never disconnects.
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                statuses.append(message["status"])
+
+        await self.application(scope, receive, send)
+        return statuses[0]
+
+
+class HTTPDriver:
+    def __init__(self, url: str):
+        parsed = urllib.parse.urlsplit(url)
+        if not parsed.hostname:
+            raise ValueError(f"URL of the server must include its host, e.g. http://localhost:8000, got {url!r}.")
+        self.host: str = parsed.hostname
+        self.port = parsed.port or 80
+        self.local = threading.local()
+
+    def request(self, method: str, path: str, body: bytes) -> int:
+        if not hasattr(self.local, "connection"):
+            self.local.connection = http.client.HTTPConnection(self.host, self.port)
+        connection = self.local.connection
+        connection.request(method, path, body=body or None, headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        response.read()
+        return response.status
+
+
+Result = tuple[float, int]  # Duration of the request and its response status.
+
+
+def run_threads(driver, scenario: str, shortcuts: list[str], requests: int, concurrency: int) -> list[Result]:
+    def send() -> Result:
+        method, path, body = build_request(scenario, shortcuts)
+        started = time.perf_counter()
+        status = driver.request(method, path, body)
+        return time.perf_counter() - started, status
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(lambda _: send(), range(requests)))
+
+
+def run_async(driver: ASGIDriver, scenario: str, shortcuts: list[str], requests: int, concurrency: int) -> list[Result]:
+    async def worker(count: int, results: list[Result]) -> None:
+        for _ in range(count):
+            method, path, body = build_request(scenario, shortcuts)
+            started = time.perf_counter()
+            status = await driver.request(method, path, body)
+            results.append((time.perf_counter() - started, status))
+
+    async def main() -> list[Result]:
+        results: list[Result] = []
+        counts = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+        await asyncio.gather(*(worker(count, results) for count in counts))
+        return results
+
+    return asyncio.run(main())
+
+
+def create_shortcuts_over_http(driver: HTTPDriver, count: int) -> list[str]:
+    """Shorten URLs through the bulk API of a running server, to have shortcuts to resolve."""
+    body = json.dumps([{"url": f"https://example.com/{i}"} for i in range(count)]).encode()
+    connection = http.client.HTTPConnection(driver.host, driver.port)
+    connection.request("POST", "/urls/bulk/", body=body, headers={"Content-Type": "application/json"})
+    return [item["shortcut"] for item in json.loads(connection.getresponse().read())]
+
+
+def report(scenario: str, results: list[Result], elapsed: float, queries: utils.QueryCounter | None) -> None:
+    timings = [duration for duration, _ in results]
+    errors = collections.Counter(status for _, status in results if status != EXPECTED_STATUS[scenario])
+    print(f"requests={len(timings)} throughput={len(timings) / elapsed:.0f} req/s")
+    print(f"latency {utils.format_timings(timings)}")
+    if errors:
+        print("unexpected responses: " + ", ".join(f"{status} x{count}" for status, count in sorted(errors.items())))
+    if queries is not None:
+        print(
+            f"queries/request={queries.count / len(timings):.2f} "
+            f"query time/request={queries.time / len(timings) * 1000:.3f}ms"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    utils.add_database_arguments(parser)
+    parser.add_argument("--app", choices=["wsgi", "asgi"], default="wsgi", help="Application to send requests to.")
+    parser.add_argument("--url", help="Base URL of a running server. If given, requests are sent over HTTP.")
+    parser.add_argument("--scenario", choices=list(EXPECTED_STATUS), default="resolve")
+    parser.add_argument("--requests", type=int, default=5000, help="Total number of requests.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Number of requests in flight.")
+    parser.add_argument("--rows", type=int, default=10_000, help="Minimal number of URLs in the table.")
+    parser.add_argument("--hot", type=int, default=1000, help="Number of distinct shortcuts requested.")
+    args = parser.parse_args()
+
+    if args.url:
+        try:
+            driver = HTTPDriver(args.url)
+        except ValueError as e:
+            parser.error(str(e))
+        shortcuts = create_shortcuts_over_http(driver, args.hot)
+        started = time.perf_counter()
+        results = run_threads(driver, args.scenario, shortcuts, args.requests, args.concurrency)
+        report(args.scenario, results, time.perf_counter() - started, None)
+        return
+
+    if args.app == "asgi":
+        # The same default as in asgi.py, which is imported only after settings are already configured here.
+        os.environ.setdefault("SHORTENER_ASYNC_RESOLVE", "true")
+    utils.setup_django()
+    with utils.benchmark_database(args.db, args.keepdb):
+        utils.seed(args.rows)
+        shortcuts = utils.sample_shortcuts(args.hot)
+        queries = utils.QueryCounter()
+        queries.install()
+
+        started = time.perf_counter()
+        if args.app == "asgi":
+            results = run_async(ASGIDriver(), args.scenario, shortcuts, args.requests, args.concurrency)
+        else:
+            results = run_threads(WSGIDriver(), args.scenario, shortcuts, args.requests, args.concurrency)
+        report(args.scenario, results, time.perf_counter() - started, queries)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Micro-benchmarks of single functions on the create and resolve paths.
+
+Every benchmark reports the distribution of call durations and the average number of queries per call.
+"""
+import argparse
+import os
+import random
+import tempfile
+from unittest import mock
+
+from benchmarks import utils
+
+
+def bench_random_shortcut():
+    from shortener import shortcuts
+
+    return shortcuts.get_random_shortcut
+
+
+def bench_sequence_shortcut():
+    from shortener import shortcuts
+
+    allocator = shortcuts.SequenceAllocator(block_size=100)
+    return allocator.allocate
+
+
+def bench_serializer_create():
+    from shortener.serializers import URLSerializer
+
+    def create():
+        serializer = URLSerializer(data={"url": f"https://example.com/{random.getrandbits(64):x}"})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+    return create
+
+
+def bench_serializer_representation():
+    from shortener.models import URL
+    from shortener.serializers import URLSerializer
+
+    urls = list(URL.objects.order_by("?")[:1000])
+
+    def represent():
+        URLSerializer(random.choice(urls)).data
+
+    return represent
+
+
+def _resolve_view(clear_cache: bool):
+    from django.test import RequestFactory
+
+    from shortener import resolvers
+    from shortener.cache import get_url_cache
+    from shortener.views import ResolveURLView
+
+    view = ResolveURLView.as_view()
+    factory = RequestFactory()
+    shortcuts = utils.sample_shortcuts(1000)
+    if not clear_cache:
+        # Every shortcut is cached before timing, so that no call reads the URL from the database.
+        for shortcut in shortcuts:
+            resolvers.resolve_shortcut(shortcut)
+        assert all(get_url_cache().get(shortcut) is not None for shortcut in shortcuts)
+
+    def resolve():
+        shortcut = random.choice(shortcuts)
+        if clear_cache:
+            get_url_cache().delete(shortcut)
+        response = view(factory.get(f"/{shortcut}/"), shortcut=shortcut)
+        assert response.status_code == 302, response.status_code
+
+    return resolve
+
+
+def bench_resolve_view_cold():
+    return _resolve_view(clear_cache=True)
+
+
+def bench_resolve_view_cached():
+    return _resolve_view(clear_cache=False)
+
+
+def bench_detail_endpoint():
+    from django.test import Client
+
+    client = Client()
+    shortcuts = utils.sample_shortcuts(1000)
+
+    def retrieve():
+        response = client.get(f"/urls/{random.choice(shortcuts)}/")
+        assert response.status_code == 200, response.status_code
+
+    return retrieve
+
+
+def bench_snapshot_lookup():
+    from shortener import snapshot
+
+    path = os.path.join(tempfile.mkdtemp(), "urls.snapshot")
+    snapshot.build_snapshot(path)
+    urls = snapshot.Snapshot(path)
+    shortcuts = utils.sample_shortcuts(1000)
+
+    def lookup():
+        assert urls.get(random.choice(shortcuts)) is not None
+
+    return lookup
+
+
+BENCHMARKS = {
+    "random_shortcut": bench_random_shortcut,
+    "sequence_shortcut": bench_sequence_shortcut,
+    "serializer_create": bench_serializer_create,
+    "serializer_representation": bench_serializer_representation,
+    "resolve_view_cold": bench_resolve_view_cold,
+    "resolve_view_cached": bench_resolve_view_cached,
+    "detail_endpoint": bench_detail_endpoint,
+    "snapshot_lookup": bench_snapshot_lookup,
+}
+
+
+# Queries per call some benchmarks must stay at with `sync` counting, or they don't measure what they're named after.
+EXPECTED_QUERIES = {"resolve_view_cached": 1}  # Only the UPDATE of usage data.
+
+
+def run_degradation(iterations: int, steps: list[float]) -> None:
+    """Measure how `get_random_shortcut` slows down as the keyspace of the shortest shortcuts fills up.
+
+    Filling the real 5-character keyspace (62 ** 5 shortcuts) isn't feasible, so the charset is reduced to 4
+    characters (4 ** 5 = 1024 shortcuts) and the table is filled up to given fractions of that keyspace.
+    """
+    import itertools
+
+    from shortener import constants, shortcuts
+    from shortener.models import URL
+
+    charset = "abcd"
+    keyspace = list("".join(chars) for chars in itertools.product(charset, repeat=constants.MIN_SHORTCUT_LENGTH))
+    random.shuffle(keyspace)
+    counter = utils.QueryCounter()
+    counter.install()
+
+    with mock.patch.object(shortcuts, "CHARSET", charset):
+        for occupancy in steps:
+            URL.objects.filter(shortcut__in=keyspace).delete()
+            taken = keyspace[: int(len(keyspace) * occupancy)]
+            URL.objects.bulk_create(URL(shortcut=shortcut, original="https://example.com/") for shortcut in taken)
+
+            created = []
+
+            def generate():
+                created.append(shortcuts.get_random_shortcut())
+
+            counter.reset()
+            timings = utils.measure(generate, iterations, warmup=0)
+            lengths = [len(shortcut) for shortcut in created]
+            escalations = sum(length > constants.MIN_SHORTCUT_LENGTH for length in lengths)
+            print(
+                f"occupancy={occupancy:>4.0%} {utils.format_timings(timings)} "
+                f"queries/call={counter.count / iterations:.2f} escalated={escalations}/{iterations}"
+            )
+            URL.objects.filter(shortcut__in=created).delete()
+        URL.objects.filter(shortcut__in=keyspace).delete()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    utils.add_database_arguments(parser)
+    parser.add_argument("--rows", type=int, default=10_000, help="Minimal number of URLs in the table.")
+    parser.add_argument("--iterations", type=int, default=1000, help="Number of calls of every benchmark.")
+    parser.add_argument("--only", nargs="*", choices=[*BENCHMARKS, "degradation"], help="Benchmarks to run.")
+    args = parser.parse_args()
+
+    utils.setup_django()
+    from django.conf import settings
+
+    with utils.benchmark_database(args.db, args.keepdb):
+        utils.seed(args.rows)
+        counter = utils.QueryCounter()
+        counter.install()
+
+        for name, setup in BENCHMARKS.items():
+            if args.only and name not in args.only:
+                continue
+            func = setup()
+            counter.reset()
+            timings = utils.measure(func, args.iterations, warmup=0)
+            queries = counter.count / args.iterations
+            print(f"{name:<26} {utils.format_timings(timings)} queries/call={queries:.2f}")
+            expected = EXPECTED_QUERIES.get(name)
+            if expected is not None and settings.SHORTENER_ACCESS_COUNTING == "sync" and queries != expected:
+                print(f"{'':<26} unexpected number of queries, should be {expected}/call")
+
+        if not args.only or "degradation" in args.only:
+            print("get_random_shortcut degradation:")
+            run_degradation(min(args.iterations, 200), [0, 0.5, 0.75, 0.9, 0.95, 0.99])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Compare throughput of the default and the tuned sqlite3 mode (SHORTENER_SQLITE_TUNING) under concurrent load.
+
+Settings are read once per process, so `benchmarks.load` is run in a subprocess for every mode. Usage is saved with
+every redirect (SHORTENER_ACCESS_COUNTING=sync), so concurrent redirects compete for the write lock. Requests which fail
+with "database is locked" are reported as unexpected 500 responses.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+from benchmarks import utils
+
+MODES = {
+    "default": {"SHORTENER_SQLITE_TUNING": "false"},
+    "tuned": {"SHORTENER_SQLITE_TUNING": "true"},
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", default=str(utils.DEFAULT_DATABASE), help="Path of the sqlite3 database.")
+    parser.add_argument("--scenario", choices=["resolve", "detail", "create"], default="resolve")
+    parser.add_argument("--requests", type=int, default=5000, help="Total number of requests in every mode.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Number of requests in flight.")
+    parser.add_argument("--rows", type=int, default=10_000, help="Number of URLs in the table.")
+    args = parser.parse_args()
+
+    # The database is recreated for every mode: WAL journal mode, once set, is stored in the database file.
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.load",
+        f"--db={args.db}",
+        f"--scenario={args.scenario}",
+        f"--requests={args.requests}",
+        f"--concurrency={args.concurrency}",
+        f"--rows={args.rows}",
+    ]
+    for mode, variables in MODES.items():
+        print(f"{mode}:", flush=True)
+        env = {**os.environ, "SHORTENER_ACCESS_COUNTING": "sync", **variables}
+        subprocess.run(command, env=env, check=True)
+
+
+if __name__ == "__main__":
+    main()
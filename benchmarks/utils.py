@@ -0,0 +1,153 @@
+import contextlib
+import os
+import random
+import statistics
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+DEFAULT_DATABASE = Path(__file__).resolve().parent.parent / "benchmark.sqlite3"
+
+
+def setup_django() -> None:
+    """Configure Django for benchmarking: with DEBUG disabled, as it's slower and it keeps all queries in memory."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "drf_url_shortener.settings")
+    import django
+    from django.conf import settings
+
+    django.setup()
+    settings.DEBUG = False
+
+
+def add_database_arguments(parser) -> None:
+    parser.add_argument("--db", default=str(DEFAULT_DATABASE), help="Path of the sqlite3 database used for benchmarks.")
+    parser.add_argument("--keepdb", action="store_true", help="Keep the database (and seeded rows) after benchmarks.")
+
+
+@contextlib.contextmanager
+def benchmark_database(name: str, keepdb: bool):
+    """Create a separate database for benchmarks, the same way Django creates one for tests.
+
+    Replicas of the default database (e.g. the read-only sqlite3 connection) are pointed at it as well.
+    """
+    from django.db import DEFAULT_DB_ALIAS, connection, connections
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment(debug=False)
+    connection.settings_dict["TEST"]["NAME"] = name
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+    for alias in connections:
+        if connections[alias].settings_dict["TEST"].get("MIRROR") == DEFAULT_DB_ALIAS:
+            connections[alias].creation.set_as_test_mirror(connection.settings_dict)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+        teardown_test_environment()
+
+
+def seed(rows: int, length: int | None = None) -> None:
+    """Make sure that there are at least `rows` URLs in the database."""
+    from django.core.management import call_command
+
+    from shortener import constants
+    from shortener.models import URL
+
+    missing = rows - URL.objects.count()
+    if missing > 0:
+        call_command("seed_urls", missing, length=length or constants.MIN_SHORTCUT_LENGTH, verbosity=0)
+
+
+def sample_shortcuts(count: int, attempts: int = 10) -> list[str]:
+    """Get shortcuts of random existing URLs.
+
+    Random ids from the range of existing ones are looked up by the primary key, rather than sorting the whole table
+    randomly. Ids missing because of gaps are drawn again, up to `attempts` times.
+    """
+    from django.db.models import Max, Min
+
+    from shortener.models import URL
+
+    bounds = URL.objects.aggregate(start=Min("id"), end=Max("id"))
+    if bounds["start"] is None:
+        return []
+    ids = range(bounds["start"], bounds["end"] + 1)
+    if len(ids) <= count:
+        return list(URL.objects.values_list("shortcut", flat=True))
+    shortcuts: dict[int, str] = {}
+    for _ in range(attempts):
+        if len(shortcuts) >= count:
+            break
+        sample = random.sample(ids, count - len(shortcuts))
+        shortcuts.update(URL.objects.filter(id__in=sample).values_list("id", "shortcut"))
+    return list(shortcuts.values())[:count]
+
+
+class QueryCounter:
+    """Execute wrapper counting queries executed on all database connections."""
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.count += 1
+                self.time += elapsed
+
+    def reset(self) -> None:
+        with self._lock:
+            self.count = 0
+            self.time = 0.0
+
+    def install(self) -> None:
+        """Wrap the current and all future connections of all threads."""
+        from django.db import connections
+        from django.db.backends.signals import connection_created
+
+        connection_created.connect(self._on_connection_created, weak=False)
+        for connection in connections.all():
+            if self not in connection.execute_wrappers:
+                connection.execute_wrappers.append(self)
+
+    def _on_connection_created(self, connection, **kwargs) -> None:
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+def percentile(sorted_values: list[float], percent: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(percent / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def format_timings(timings: list[float]) -> str:
+    """Summary of timings (in seconds) in milliseconds."""
+    ordered = sorted(timings)
+    return (
+        f"mean={statistics.fmean(ordered) * 1000:.3f}ms "
+        f"p50={percentile(ordered, 50) * 1000:.3f}ms "
+        f"p90={percentile(ordered, 90) * 1000:.3f}ms "
+        f"p99={percentile(ordered, 99) * 1000:.3f}ms "
+        f"max={ordered[-1] * 1000:.3f}ms"
+    )
+
+
+def measure(func: Callable[[], object], iterations: int, warmup: int = 10) -> list[float]:
+    """Run `func` many times and return duration of every call."""
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return timings
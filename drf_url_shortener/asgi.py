@@ -12,5 +12,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "drf_url_shortener.settings")
+# Under ASGI shortcuts are resolved with the native async view, unless explicitly disabled.
+os.environ.setdefault("SHORTENER_ASYNC_RESOLVE", "true")
 
 application = get_asgi_application()
+
+# Imported only after Django is set up by get_asgi_application().
+from shortener.fastpath import wrap_asgi_application  # noqa: E402
+
+application = wrap_asgi_application(application)
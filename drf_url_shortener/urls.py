@@ -14,6 +14,7 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
 from rest_framework import routers
@@ -23,8 +24,11 @@ from shortener import views
 router = routers.SimpleRouter()
 router.register("urls", views.CreateRetrieveURLViewSet)
 
+resolve_view = views.AsyncResolveURLView if settings.SHORTENER_ASYNC_RESOLVE else views.ResolveURLView
+
 urlpatterns = [
     *router.urls,
     path("admin/", admin.site.urls),
-    path("<slug:shortcut>/", views.ResolveURLView.as_view(), name="resolve-url"),
+    path("metrics/", views.MetricsView.as_view(), name="metrics"),
+    path("<slug:shortcut>/", resolve_view.as_view(), name="resolve-url"),
 ]
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "drf_url_shortener.settings")
 
 application = get_wsgi_application()
+
+# Imported only after Django is set up by get_wsgi_application().
+from shortener.fastpath import wrap_wsgi_application  # noqa: E402
+
+application = wrap_wsgi_application(application)
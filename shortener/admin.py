@@ -1,9 +1,54 @@
+from django.conf import settings
 from django.contrib import admin
+from django.db import connections
+from django.db.models import Q
 
-from shortener.models import URL
+from shortener.models import URL, URLPrefix
+from shortener.normalization import hash_url
+from shortener.pagination import EstimatedCountPaginator
+
+
+def get_shortcut_prefix_filter(prefix: str, using: str) -> Q:
+    """Get filter of shortcuts starting with `prefix` (case-sensitive) which can be served by the index on shortcuts.
+
+    PostgreSQL uses its `varchar_pattern_ops` index for `LIKE 'prefix%'`. LIKE of sqlite3 is case-insensitive and never
+    uses the index, so shortcuts are looked up by range instead. It's exact, as shortcuts are made of ASCII letters and
+    digits only, which all sort below DEL.
+    """
+    if connections[using].vendor == "postgresql":
+        return Q(shortcut__startswith=prefix)
+    return Q(shortcut__gte=prefix, shortcut__lt=prefix + "\x7f")
 
 
 @admin.register(URL)
 class URLAdmin(admin.ModelAdmin):
     search_fields = ("shortcut", "original")
+    search_help_text = "Shortcut or its beginning, or the whole original URL."
     list_display = ("shortcut", "original", "shortened_url", "created", "last_accessed", "use_count")
+    # Only columns backed by indexes.
+    sortable_by = ("shortcut", "created", "last_accessed", "use_count")
+    ordering = ("-created",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term: str):
+        """Search by shortcut prefix or by the whole original URL, using indexes rather than scanning the table.
+
+        With `SHORTENER_ADMIN_SEARCH_ORIGINAL`, URLs whose originals contain the term are found too, which is fast on
+        PostgreSQL only, with the trigram index created by `original_search_index` command. Compact originals (see
+        `shortener.compact`) are found only by their prefixes, i.e. by scheme and host, as the rest is compressed.
+        """
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        search = get_shortcut_prefix_filter(term, queryset.db)
+        if "://" in term:
+            try:
+                search |= Q(original_hash=hash_url(term))
+            except ValueError:  # Not a valid URL after all.
+                pass
+        if settings.SHORTENER_ADMIN_SEARCH_ORIGINAL:
+            search |= Q(original__contains=term) | Q(
+                original_prefix__in=URLPrefix.objects.filter(prefix__contains=term)
+            )
+        return queryset.filter(search), False
@@ -0,0 +1,228 @@
+"""Click analytics.
+
+Every redirect appends a lightweight event (shortcut and timestamp) to a local click log, in batches. The log is
+periodically rolled up into `ClickBucket` rows with per-shortcut hourly and daily counts (see `rollup_clicks`), which
+are served by the stats endpoint without scanning raw events.
+"""
+import atexit
+import collections
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+
+from shortener.models import ClickBucket
+
+logger = logging.getLogger(__name__)
+
+PROCESSING_SUFFIX = ".processing"
+# Max number of buckets looked up with a single query during rollup.
+ROLLUP_BATCH_SIZE = 500
+
+
+class ClickLog:
+    """Buffer of click events appended to a file in batches.
+
+    Every flush opens the file in append mode and writes all pending events with a single `write`, so that many
+    processes can share the same file and the file can be rotated at any time (see `rollup_clicks`). Once started, a
+    background thread flushes pending events every `flush_interval` seconds, even if no new clicks are recorded.
+    """
+
+    def __init__(self, path: Path | str, max_pending: int, flush_interval: float):
+        self.path = Path(path)
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self._pending: list[str] = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def record(self, shortcut: str, timestamp: float | None = None, background: bool = False) -> None:
+        """Add click event. Events are written to the file once there are enough of them or enough time passed.
+
+        With `background`, the write is left to the background thread, so that e.g. the event loop isn't blocked.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            self._pending.append(f"{shortcut} {int(timestamp)}\n")
+            should_flush = (
+                len(self._pending) >= self.max_pending or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        if should_flush:
+            if background:
+                self._wake.set()
+            else:
+                self.flush()
+
+    def flush(self) -> int:
+        """Write all pending events. Returns number of written events."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+        with open(self.path, "a", encoding="ascii") as file:
+            file.write("".join(pending))
+        return len(pending)
+
+    def start(self) -> None:
+        """Start a daemon thread which writes pending events periodically and when it's woken up by `record`."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="shortener-click-log", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread and write what's left."""
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self) -> None:
+        while True:
+            woken = self._wake.wait(self.flush_interval if self.flush_interval > 0 else None)
+            self._wake.clear()
+            if self._stopped.is_set():
+                return
+            if woken or time.monotonic() - self._last_flush >= self.flush_interval:
+                try:
+                    self.flush()
+                except OSError:
+                    logger.exception("Failed to write click events to %s.", self.path)
+
+
+_click_log: ClickLog | None = None
+_click_log_lock = threading.Lock()
+
+
+def get_click_log() -> ClickLog | None:
+    """Get process-wide click log, or `None` if click analytics is disabled. It's started on the first use."""
+    global _click_log
+    if _click_log is None and settings.SHORTENER_CLICK_LOG:
+        with _click_log_lock:
+            if _click_log is None:
+                click_log = ClickLog(
+                    settings.SHORTENER_CLICK_LOG,
+                    settings.SHORTENER_CLICK_LOG_MAX_PENDING,
+                    settings.SHORTENER_CLICK_LOG_FLUSH_INTERVAL,
+                )
+                click_log.start()
+                atexit.register(click_log.stop)
+                _click_log = click_log
+    return _click_log
+
+
+def record_click(shortcut: str, background: bool = False) -> None:
+    """Add click event of the shortcut to the click log, if click analytics is enabled.
+
+    Async code should pass `background`, so that the file is written by the background thread of the log.
+    """
+    click_log = get_click_log()
+    if click_log is not None:
+        click_log.record(shortcut, background=background)
+
+
+@receiver(setting_changed)
+def reset_click_log(setting: str, **kwargs) -> None:
+    global _click_log
+    if setting.startswith("SHORTENER_CLICK_LOG") and _click_log is not None:
+        click_log, _click_log = _click_log, None
+        atexit.unregister(click_log.stop)
+        click_log.stop()
+
+
+def bucket_start(timestamp: int, granularity: str) -> datetime:
+    """Get start of the hour or day (in UTC) which contains given timestamp."""
+    seconds = 3600 if granularity == ClickBucket.HOUR else 86400
+    return datetime.fromtimestamp(timestamp - timestamp % seconds, tz=dt_timezone.utc)
+
+
+def read_click_counts(path: Path) -> collections.Counter:
+    """Count clicks from the log file per (shortcut, granularity, bucket start). Malformed lines are skipped."""
+    counts: collections.Counter = collections.Counter()
+    with open(path, encoding="ascii", errors="replace") as file:
+        for line in file:
+            try:
+                shortcut, timestamp = line.split()
+                seconds = int(timestamp)
+            except ValueError:
+                continue
+            for granularity in (ClickBucket.HOUR, ClickBucket.DAY):
+                counts[(shortcut, granularity, bucket_start(seconds, granularity))] += 1
+    return counts
+
+
+def save_click_counts(counts: collections.Counter) -> None:
+    """Add counts to the existing buckets and create missing ones."""
+    keys = list(counts)
+    for start in range(0, len(keys), ROLLUP_BATCH_SIZE):
+        batch = keys[start : start + ROLLUP_BATCH_SIZE]
+        existing = {
+            (bucket.shortcut, bucket.granularity, bucket.start): bucket
+            for bucket in ClickBucket.objects.filter(
+                shortcut__in={shortcut for shortcut, _, _ in batch},
+                start__in={period_start for _, _, period_start in batch},
+            )
+        }
+        to_update, to_create = [], []
+        for key in batch:
+            if key in existing:
+                bucket = existing[key]
+                bucket.count += counts[key]
+                to_update.append(bucket)
+            else:
+                shortcut, granularity, period_start = key
+                to_create.append(
+                    ClickBucket(shortcut=shortcut, granularity=granularity, start=period_start, count=counts[key])
+                )
+        ClickBucket.objects.bulk_update(to_update, ["count"])
+        ClickBucket.objects.bulk_create(to_create)
+
+
+def rollup_clicks(path: Path | str, grace_period: float = 1.0) -> int:
+    """Roll up events from the click log into hourly and daily buckets. Returns number of processed events.
+
+    The log is first renamed, so that new events go to a new file. Processes which opened the log just before the
+    rename may still append to the renamed file, so it's read only after `grace_period` seconds. If the previous
+    rollup failed, its renamed file is processed first.
+    """
+    path = Path(path)
+    processing = path.with_name(path.name + PROCESSING_SUFFIX)
+    if not processing.exists():
+        if not path.exists():
+            return 0
+        os.replace(path, processing)
+        time.sleep(grace_period)
+
+    counts = read_click_counts(processing)
+    with transaction.atomic():
+        save_click_counts(counts)
+    processing.unlink()
+    # Every event is counted in an hourly and in a daily bucket.
+    return sum(count for (_, granularity, _), count in counts.items() if granularity == ClickBucket.HOUR)
+
+
+def get_stats(shortcut: str, granularity: str, since: datetime, until: datetime | None = None):
+    """Get buckets of the shortcut from given period, ordered by their start."""
+    buckets = ClickBucket.objects.filter(shortcut=shortcut, granularity=granularity, start__gte=since)
+    if until is not None:
+        buckets = buckets.filter(start__lt=until)
+    return buckets.order_by("start").values("start", "count")
+
+
+def default_since(granularity: str) -> datetime:
+    """Start of the default stats period: the last 24 hours or the last 30 days."""
+    period = timedelta(hours=24) if granularity == ClickBucket.HOUR else timedelta(days=30)
+    return bucket_start(int(time.time() - period.total_seconds()), granularity)
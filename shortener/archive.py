@@ -0,0 +1,86 @@
+"""Archive of URLs which haven't been used for a long time, enabled with `SHORTENER_ARCHIVE_ENABLED`.
+
+Cold URLs are moved by the `archive_urls` command to a separate table, so that the table and indexes every redirect and
+every existence check of a new shortcut hit stay small. Shortcuts missing in the table of URLs are looked up in the
+archive, and found URLs are moved back, under their original ids. Uniqueness of shortcuts across both tables isn't
+enforced by the database, so allocated shortcuts are checked against the archive too (see `shortener.shortcuts`).
+"""
+import datetime
+from typing import Iterable
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from shortener import routers
+from shortener.models import URL, ArchivedURL, get_shortcut_lookup
+
+# Fields of URL kept in the archive, besides its id.
+ARCHIVED_FIELDS = (
+    "shortcut",
+    "original",
+    "original_hash",
+    "created",
+    "last_accessed",
+    "use_count",
+    "expires_at",
+    "max_uses",
+    "redirect_permanent",
+    "redirect_max_age",
+)
+
+
+def get_cold_filter(accessed_before: datetime.datetime, created_before: datetime.datetime) -> Q:
+    """Get filter of URLs last used before `accessed_before`, or never used and created before `created_before`."""
+    return Q(last_accessed__lt=accessed_before) | Q(last_accessed__isnull=True, created__lt=created_before)
+
+
+def get_usable_filter() -> Q:
+    """Get filter of URLs which haven't expired or been used up."""
+    return (Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now())) & (
+        Q(max_uses__isnull=True) | Q(use_count__lt=F("max_uses"))
+    )
+
+
+def archive_urls(cold: Q, after_id: int, batch_size: int) -> list[int]:
+    """Move a batch of cold URLs with ids greater than `after_id` to the archive. Returns ids of the moved URLs.
+
+    URLs are locked while they're being moved, so that changes made to them in the meantime aren't lost.
+    """
+    with transaction.atomic():
+        urls = list(URL.objects.filter(cold, id__gt=after_id).order_by("id").select_for_update()[:batch_size])
+        ArchivedURL.objects.bulk_create(
+            ArchivedURL(id=url.id, **{name: getattr(url, name) for name in ARCHIVED_FIELDS}) for url in urls
+        )
+        # Deleting with signals drops the URLs from the cache too.
+        URL.objects.filter(id__in=[url.id for url in urls]).delete()
+    return [url.id for url in urls]
+
+
+def restore_url(shortcut: str) -> URL | None:
+    """Move URL back from the archive. Returns `None` if it's in neither of the tables, or if it can't be used anymore.
+
+    Expired or used up URLs stay in the archive until `purge_expired_urls` deletes them. URL restored by another
+    process in the meantime is read from the table of URLs.
+    """
+    try:
+        with transaction.atomic():
+            archived = ArchivedURL.objects.select_for_update().filter(get_usable_filter(), shortcut=shortcut).first()
+            if archived is not None:
+                url = URL(id=archived.id, **{name: getattr(archived, name) for name in ARCHIVED_FIELDS})
+                url.save(force_insert=True)
+                archived.delete()
+                return url
+    except IntegrityError:
+        pass
+    return URL.objects.using(routers.PRIMARY).filter(**get_shortcut_lookup(shortcut)).first()
+
+
+def get_archived_urls(shortcuts: Iterable[str]) -> list[ArchivedURL]:
+    """Read archived URLs of many shortcuts without restoring them."""
+    return list(ArchivedURL.objects.filter(shortcut__in=list(shortcuts)))
+
+
+def get_archived_shortcuts(shortcuts: Iterable[str]) -> set[str]:
+    """Get subset of given shortcuts which are archived."""
+    return set(ArchivedURL.objects.filter(shortcut__in=list(shortcuts)).values_list("shortcut", flat=True))
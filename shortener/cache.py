@@ -0,0 +1,255 @@
+import collections
+import threading
+import time
+from typing import NamedTuple, Union
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+NOT_FOUND = "__not_found__"
+
+
+class ResolvedURL(NamedTuple):
+    """Minimal data required to redirect user to the original URL, with the right cache policy, and to check if the
+    URL can still be used.
+
+    Expiration date is kept as a POSIX timestamp, so that it survives any cache serializer.
+    """
+
+    id: int
+    original: str
+    expires_at: float | None = None
+    max_uses: int | None = None
+    redirect_permanent: bool | None = None
+    redirect_max_age: int | None = None
+
+    def is_expired(self, now: float | None = None) -> bool:
+        return self.expires_at is not None and self.expires_at <= (time.time() if now is None else now)
+
+
+CachedValue = Union[ResolvedURL, str]
+
+
+class BaseURLCache:
+    """Interface of a shortcut -> original URL cache.
+
+    `get` returns `None` on a cache miss, `NOT_FOUND` if shortcut is known not to exist (negative caching) or
+    `ResolvedURL` otherwise.
+    """
+
+    def get(self, shortcut: str) -> CachedValue | None:
+        raise NotImplementedError
+
+    def set(self, shortcut: str, value: CachedValue) -> None:
+        raise NotImplementedError
+
+    def delete(self, shortcut: str) -> None:
+        raise NotImplementedError
+
+    def delete_many(self, shortcuts) -> None:
+        for shortcut in shortcuts:
+            self.delete(shortcut)
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    async def aget(self, shortcut: str) -> CachedValue | None:
+        """Asynchronous version of `get`. In-memory caches don't do any I/O, so they can simply call `get`."""
+        return self.get(shortcut)
+
+    async def aset(self, shortcut: str, value: CachedValue) -> None:
+        """Asynchronous version of `set`."""
+        self.set(shortcut, value)
+
+
+class DummyURLCache(BaseURLCache):
+    """Cache which doesn't store anything. Used when caching is disabled."""
+
+    def get(self, shortcut: str) -> CachedValue | None:
+        return None
+
+    def set(self, shortcut: str, value: CachedValue) -> None:
+        pass
+
+    def delete(self, shortcut: str) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+
+class LocalURLCache(BaseURLCache):
+    """In-process LRU cache with separate time-to-live for positive and negative entries."""
+
+    def __init__(self, max_size: int, ttl: float, negative_ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: collections.OrderedDict[str, tuple[CachedValue, float]] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, shortcut: str) -> CachedValue | None:
+        with self._lock:
+            entry = self._entries.get(shortcut)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[shortcut]
+                return None
+            self._entries.move_to_end(shortcut)
+            return value
+
+    def set(self, shortcut: str, value: CachedValue) -> None:
+        ttl = self.negative_ttl if value == NOT_FOUND else self.ttl
+        if ttl <= 0 or self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[shortcut] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(shortcut)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, shortcut: str) -> None:
+        with self._lock:
+            self._entries.pop(shortcut, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DjangoURLCache(BaseURLCache):
+    """Cache stored in one of the Django cache backends, so that it can be shared between processes."""
+
+    def __init__(self, alias: str, ttl: float, negative_ttl: float, key_prefix: str = "shortener:url:"):
+        self.alias = alias
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.key_prefix = key_prefix
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def make_key(self, shortcut: str) -> str:
+        return self.key_prefix + shortcut
+
+    def get(self, shortcut: str) -> CachedValue | None:
+        return self._from_backend(self.backend.get(self.make_key(shortcut)))
+
+    def set(self, shortcut: str, value: CachedValue) -> None:
+        ttl = self.negative_ttl if value == NOT_FOUND else self.ttl
+        if ttl > 0:
+            self.backend.set(self.make_key(shortcut), value, timeout=ttl)
+
+    async def aget(self, shortcut: str) -> CachedValue | None:
+        return self._from_backend(await self.backend.aget(self.make_key(shortcut)))
+
+    async def aset(self, shortcut: str, value: CachedValue) -> None:
+        ttl = self.negative_ttl if value == NOT_FOUND else self.ttl
+        if ttl > 0:
+            await self.backend.aset(self.make_key(shortcut), value, timeout=ttl)
+
+    @staticmethod
+    def _from_backend(value) -> CachedValue | None:
+        # Backends which don't pickle values (e.g. with JSON serializer) return named tuples as plain lists.
+        if isinstance(value, (list, tuple)) and not isinstance(value, ResolvedURL):
+            return ResolvedURL(*value)
+        return value
+
+    def delete(self, shortcut: str) -> None:
+        self.backend.delete(self.make_key(shortcut))
+
+    def delete_many(self, shortcuts) -> None:
+        self.backend.delete_many([self.make_key(shortcut) for shortcut in shortcuts])
+
+    def clear(self) -> None:
+        # Clearing the whole backend could remove unrelated data, so entries are left to expire on their own.
+        pass
+
+
+class TieredURLCache(BaseURLCache):
+    """Chain of caches checked in order. A hit in a slower tier populates all the faster ones."""
+
+    def __init__(self, *tiers: BaseURLCache):
+        self.tiers = tiers
+
+    def get(self, shortcut: str) -> CachedValue | None:
+        for index, tier in enumerate(self.tiers):
+            value = tier.get(shortcut)
+            if value is not None:
+                for faster_tier in self.tiers[:index]:
+                    faster_tier.set(shortcut, value)
+                return value
+        return None
+
+    def set(self, shortcut: str, value: CachedValue) -> None:
+        for tier in self.tiers:
+            tier.set(shortcut, value)
+
+    async def aget(self, shortcut: str) -> CachedValue | None:
+        for index, tier in enumerate(self.tiers):
+            value = await tier.aget(shortcut)
+            if value is not None:
+                for faster_tier in self.tiers[:index]:
+                    await faster_tier.aset(shortcut, value)
+                return value
+        return None
+
+    async def aset(self, shortcut: str, value: CachedValue) -> None:
+        for tier in self.tiers:
+            await tier.aset(shortcut, value)
+
+    def delete(self, shortcut: str) -> None:
+        for tier in self.tiers:
+            tier.delete(shortcut)
+
+    def delete_many(self, shortcuts) -> None:
+        shortcuts = list(shortcuts)
+        for tier in self.tiers:
+            tier.delete_many(shortcuts)
+
+    def clear(self) -> None:
+        for tier in self.tiers:
+            tier.clear()
+
+
+_url_cache: BaseURLCache | None = None
+_url_cache_lock = threading.Lock()
+
+
+def build_url_cache() -> BaseURLCache:
+    """Build cache according to `SHORTENER_URL_CACHE_*` settings."""
+    if not settings.SHORTENER_URL_CACHE_ENABLED:
+        return DummyURLCache()
+
+    ttl = settings.SHORTENER_URL_CACHE_TTL
+    negative_ttl = settings.SHORTENER_URL_CACHE_NEGATIVE_TTL
+    tiers: list[BaseURLCache] = [LocalURLCache(settings.SHORTENER_URL_CACHE_SIZE, ttl, negative_ttl)]
+    if settings.SHORTENER_URL_CACHE_BACKEND:
+        tiers.append(DjangoURLCache(settings.SHORTENER_URL_CACHE_BACKEND, ttl, negative_ttl))
+    return tiers[0] if len(tiers) == 1 else TieredURLCache(*tiers)
+
+
+def get_url_cache() -> BaseURLCache:
+    """Get process-wide shortcut cache, building it on the first use."""
+    global _url_cache
+    if _url_cache is None:
+        with _url_cache_lock:
+            if _url_cache is None:
+                _url_cache = build_url_cache()
+    return _url_cache
+
+
+@receiver(setting_changed)
+def reset_url_cache(setting: str, **kwargs) -> None:
+    """Rebuild the cache next time it's used if any of its settings has changed."""
+    global _url_cache
+    if setting.startswith("SHORTENER_URL_CACHE"):
+        _url_cache = None
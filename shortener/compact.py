@@ -0,0 +1,80 @@
+"""Compact storage of original URLs, enabled with `SHORTENER_COMPACT_ORIGINALS`.
+
+Original URL is split into its prefix (scheme and host), stored once in the `URLPrefix` table and referenced by id, and
+the rest (path, query and fragment), compressed by zlib with a shared preset dictionary of tokens common in URLs. Even
+short strings, which zlib alone can't make any smaller, are compressed then, as their tokens are found in the
+dictionary.
+
+Compressed data starts with a byte identifying the codec, so that a better dictionary (e.g. one trained on real URLs)
+can be added later without breaking stored rows. Rest which doesn't get any smaller is stored as is.
+"""
+import zlib
+
+# Longest prefix kept in the dictionary table. URLs with longer ones (e.g. with credentials) are stored whole.
+MAX_PREFIX_LENGTH = 255
+
+RAW = 0
+DEFLATE_V1 = 1
+
+# Tokens common in paths and queries. Deflate finds closer matches cheaper, so the most common tokens are at the end.
+PRESET_DICTIONARY_V1 = (
+    b".php.asp.aspx.jsp.cgi.pdf.jpg.png.gif.svg.mp4.zip.json.xml.rss.txt"
+    b"/feed/rss/api/v1/v2/static/assets/images/img/media/uploads/files/download/docs/doc/wiki/help/support/"
+    b"/about/contact/login/signup/register/account/profile/settings/dashboard/admin/search?q=/shop/cart/checkout/"
+    b"/category/categories/tags/tag/posts/post/blog/news/articles/article/products/product/items/item/"
+    b"/watch?v=/status/user/users/events/event/page/pages/en/en-us/de/fr/es/index.html/index.php"
+    b"&ref=&source=&lang=&hl=en&page=&sort=&id=&fbclid=&gclid=&mc_cid=&mc_eid=&igshid="
+    b"&utm_source=newsletter&utm_medium=email&utm_source=twitter&utm_source=facebook&utm_medium=social"
+    b"&utm_content=&utm_term=&utm_campaign=?utm_source=&utm_medium=&utm_campaign="
+    b".html/2021/2022/2023/2024/2025/2026/"
+)
+
+# Raw deflate (no header and checksum) with 2 KiB window, which fits the dictionary along with the longest URLs. Small
+# window and memory level make setting up the compressor for every URL many times faster than the defaults.
+WINDOW_BITS = 11
+MEMORY_LEVEL = 4
+
+_COMPRESSOR = zlib.compressobj(
+    9, zlib.DEFLATED, -WINDOW_BITS, MEMORY_LEVEL, zlib.Z_DEFAULT_STRATEGY, PRESET_DICTIONARY_V1
+)
+_DECOMPRESSOR = zlib.decompressobj(-WINDOW_BITS, PRESET_DICTIONARY_V1)
+
+
+def split_original(original: str) -> tuple[str | None, str]:
+    """Split URL into its prefix (`scheme://host`, with userinfo and port) and the rest.
+
+    Prefix is `None` if there's none or it's too long to be kept in the dictionary table.
+    """
+    start = original.find("://")
+    if start < 0:
+        return None, original
+    start += 3
+    end = len(original)
+    for separator in "/?#":
+        index = original.find(separator, start, end)
+        if index >= 0:
+            end = index
+    if end > MAX_PREFIX_LENGTH:
+        return None, original
+    return original[:end], original[end:]
+
+
+def compress(rest: str) -> bytes:
+    """Compress the rest of URL with the preset dictionary, or keep it as is if it doesn't get any smaller."""
+    data = rest.encode()
+    # Copying compressor with the dictionary already loaded is faster than creating a new one.
+    compressor = _COMPRESSOR.copy()
+    compressed = compressor.compress(data) + compressor.flush()
+    if len(compressed) < len(data):
+        return bytes([DEFLATE_V1]) + compressed
+    return bytes([RAW]) + data
+
+
+def decompress(data: bytes) -> str:
+    """Reverse of `compress`."""
+    codec = data[0]
+    if codec == RAW:
+        return data[1:].decode()
+    if codec == DEFLATE_V1:
+        return _DECOMPRESSOR.copy().decompress(data[1:]).decode()
+    raise ValueError(f"Unknown codec of compressed URL: {codec}.")
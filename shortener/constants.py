@@ -1,3 +1,12 @@
+import string
+
+# Characters of generated shortcuts.
+SHORTCUT_CHARSET = string.ascii_letters + string.digits
 MIN_SHORTCUT_LENGTH = 5
 MAX_SHORTCUT_LENGTH = 10
-DISALLOWED_SHORTCUTS = ("admin",)
+# Top-level routes of the project, which can't be shortcuts.
+DISALLOWED_SHORTCUTS = ("admin", "metrics", "urls")
+MAX_BULK_CREATE_SIZE = 10_000
+BULK_CREATE_BATCH_SIZE = 1000
+MAX_BATCH_RESOLVE_SIZE = 100_000
+BATCH_RESOLVE_CHUNK_SIZE = 500
@@ -0,0 +1,277 @@
+import asyncio
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import DatabaseError, close_old_connections, models
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Coalesce, Greatest, Now
+from django.dispatch import receiver
+from django.utils import timezone
+
+from shortener.cache import ResolvedURL
+from shortener.models import URL, ArchivedURL
+
+logger = logging.getLogger(__name__)
+
+SYNC_COUNTING = "sync"
+BUFFERED_COUNTING = "buffered"
+COUNTING_MODES = (SYNC_COUNTING, BUFFERED_COUNTING)
+
+# Number of URLs updated by a single UPDATE statement. Each URL adds a few query parameters and some backends (e.g.
+# sqlite3) limit their number.
+FLUSH_BATCH_SIZE = 100
+
+
+def bulk_update_usage(usage: dict[int, tuple[int, datetime]]) -> int:
+    """Add use counts and set last access dates of many URLs with as few UPDATE queries as possible.
+
+    `usage` maps URL id to a tuple of (number of new uses, date of the latest use). Date of last access is never moved
+    backwards, in case a more recent access has already been saved by another process. URLs archived since their uses
+    were recorded get them saved in the archive, so they're restored with them.
+    """
+    updated = 0
+    ids = list(usage)
+    for start in range(0, len(ids), FLUSH_BATCH_SIZE):
+        batch = ids[start : start + FLUSH_BATCH_SIZE]
+        use_count_whens = []
+        last_accessed_whens = []
+        for url_id in batch:
+            count, accessed_at = usage[url_id]
+            use_count_whens.append(When(id=url_id, then=Value(count)))
+            last_accessed = Greatest(Coalesce(F("last_accessed"), Value(accessed_at)), Value(accessed_at))
+            last_accessed_whens.append(When(id=url_id, then=last_accessed))
+        changes = {
+            "use_count": F("use_count") + Case(*use_count_whens, output_field=models.PositiveIntegerField()),
+            "last_accessed": Case(*last_accessed_whens, output_field=models.DateTimeField()),
+        }
+        batch_updated = URL.objects.filter(id__in=batch).update(**changes)
+        if batch_updated < len(batch):
+            batch_updated += ArchivedURL.objects.filter(id__in=batch).update(**changes)
+        updated += batch_updated
+    return updated
+
+
+class AccessCounter:
+    """Aggregate URL usage in memory and save it to the database in bulk.
+
+    Uses are summed up per URL along with the date of the latest use. Pending data is flushed when there are
+    `max_pending` different URLs waiting, when `flush_interval` seconds passed since the last flush and when the
+    process exits.
+    """
+
+    def __init__(self, max_pending: int, flush_interval: float):
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self._pending: dict[int, tuple[int, datetime]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def record(self, url_id: int, accessed_at: datetime | None = None, autoflush: bool = True) -> bool:
+        """Count single use of the URL.
+
+        Returns whether pending data should be flushed. Unless `autoflush` is disabled, it's flushed right away.
+        """
+        accessed_at = accessed_at or timezone.now()
+        with self._lock:
+            count, last_accessed = self._pending.get(url_id, (0, accessed_at))
+            self._pending[url_id] = (count + 1, max(last_accessed, accessed_at))
+            should_flush = (
+                len(self._pending) >= self.max_pending or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        if should_flush and autoflush:
+            self.flush()
+        return should_flush
+
+    def flush(self) -> int:
+        """Save all pending usage data. Returns number of updated URLs."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._last_flush = time.monotonic()
+            if not pending:
+                return 0
+            try:
+                return bulk_update_usage(pending)
+            except DatabaseError:
+                logger.exception("Failed to save usage of %d URLs, retrying with the next flush.", len(pending))
+                self._merge(pending)
+                return 0
+
+    def _merge(self, usage: dict[int, tuple[int, datetime]]) -> None:
+        with self._lock:
+            for url_id, (count, accessed_at) in usage.items():
+                pending_count, pending_accessed_at = self._pending.get(url_id, (0, accessed_at))
+                self._pending[url_id] = (count + pending_count, max(accessed_at, pending_accessed_at))
+
+    @property
+    def pending(self) -> dict[int, tuple[int, datetime]]:
+        with self._lock:
+            return dict(self._pending)
+
+    def start(self) -> None:
+        """Start a daemon thread which flushes pending data periodically, even if no new uses are recorded."""
+        if self._thread is None and self.flush_interval > 0:
+            self._thread = threading.Thread(target=self._run, name="shortener-access-counter", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread and flush what's left."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.flush_interval):
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                close_old_connections()
+                self.flush()
+
+
+_access_counter: AccessCounter | None = None
+_access_counter_lock = threading.Lock()
+
+
+def get_access_counter() -> AccessCounter:
+    """Get process-wide access counter. It is started on the first use and flushed when the process exits."""
+    global _access_counter
+    if _access_counter is None:
+        with _access_counter_lock:
+            if _access_counter is None:
+                counter = AccessCounter(
+                    settings.SHORTENER_ACCESS_COUNTER_MAX_PENDING, settings.SHORTENER_ACCESS_COUNTER_FLUSH_INTERVAL
+                )
+                counter.start()
+                atexit.register(counter.stop)
+                _access_counter = counter
+    return _access_counter
+
+
+def get_access_changes() -> dict:
+    return {"last_accessed": Now(), "use_count": F("use_count") + 1}
+
+
+def save_access(url_id: int) -> None:
+    """Save single use of the URL right away. URL archived since it was resolved gets the use saved in the archive."""
+    if not URL.objects.filter(id=url_id).update(**get_access_changes()):
+        ArchivedURL.objects.filter(id=url_id).update(**get_access_changes())
+
+
+async def asave_access(url_id: int) -> None:
+    """Asynchronous version of `save_access`."""
+    if not await URL.objects.filter(id=url_id).aupdate(**get_access_changes()):
+        await ArchivedURL.objects.filter(id=url_id).aupdate(**get_access_changes())
+
+
+def record_access(url_id: int) -> None:
+    """Count single use of the URL, either immediately or in buffered mode, according to the settings."""
+    mode = settings.SHORTENER_ACCESS_COUNTING
+    if mode == BUFFERED_COUNTING:
+        get_access_counter().record(url_id)
+    elif mode == SYNC_COUNTING:
+        save_access(url_id)
+    else:
+        raise ImproperlyConfigured(f"SHORTENER_ACCESS_COUNTING must be one of: {', '.join(COUNTING_MODES)}.")
+
+
+def record_limited_access(url_id: int, max_uses: int) -> bool:
+    """Count single use of the URL unless it has been used `max_uses` times already. Returns whether it was counted.
+
+    Limit is checked by the UPDATE itself, so it holds even with many processes and costs no extra query. Uses of
+    limited URLs are therefore always saved immediately, regardless of `SHORTENER_ACCESS_COUNTING`.
+    """
+    queryset = URL.objects.filter(id=url_id, use_count__lt=max_uses)
+    return queryset.update(last_accessed=Now(), use_count=F("use_count") + 1) > 0
+
+
+def record_use(url: ResolvedURL) -> bool:
+    """Count single use of the resolved URL if it can still be used. Returns `False` for expired or used up URLs."""
+    if url.is_expired():
+        return False
+    if url.max_uses is not None:
+        return record_limited_access(url.id, url.max_uses)
+    record_access(url.id)
+    return True
+
+
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _run_in_background(coroutine) -> None:
+    task = asyncio.get_running_loop().create_task(coroutine)
+    # Event loop keeps only weak references to tasks, so they have to be referenced until they are done.
+    _background_tasks.add(task)
+    task.add_done_callback(_on_background_task_done)
+
+
+def _on_background_task_done(task: asyncio.Task) -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Failed to save URL usage.", exc_info=task.exception())
+
+
+async def wait_for_background_tasks() -> None:
+    """Wait until usage recorded by `arecord_access` is saved."""
+    while _background_tasks:
+        await asyncio.gather(*_background_tasks, return_exceptions=True)
+
+
+def _flush_in_thread(counter: AccessCounter) -> None:
+    try:
+        counter.flush()
+    finally:
+        # Thread is outside of request/response cycle, so its connection has to be closed explicitly.
+        close_old_connections()
+
+
+def arecord_access(url_id: int) -> None:
+    """Count single use of the URL from asynchronous code, without waiting for the database.
+
+    In sync mode, the UPDATE runs in a background task. In buffered mode, use is counted in memory and, if the buffer
+    is full, it's flushed in a background task too. Background tasks need a running event loop which outlives the
+    request, so this is meant to be used under ASGI.
+    """
+    mode = settings.SHORTENER_ACCESS_COUNTING
+    if mode == BUFFERED_COUNTING:
+        counter = get_access_counter()
+        if counter.record(url_id, autoflush=False):
+            _run_in_background(sync_to_async(_flush_in_thread, thread_sensitive=False)(counter))
+    elif mode == SYNC_COUNTING:
+        _run_in_background(asave_access(url_id))
+    else:
+        raise ImproperlyConfigured(f"SHORTENER_ACCESS_COUNTING must be one of: {', '.join(COUNTING_MODES)}.")
+
+
+async def arecord_use(url: ResolvedURL) -> bool:
+    """Asynchronous version of `record_use`.
+
+    Unlike for unlimited URLs (see `arecord_access`), use of URL with max uses has to be saved before responding.
+    """
+    if url.is_expired():
+        return False
+    if url.max_uses is not None:
+        queryset = URL.objects.filter(id=url.id, use_count__lt=url.max_uses)
+        return await queryset.aupdate(last_accessed=Now(), use_count=F("use_count") + 1) > 0
+    arecord_access(url.id)
+    return True
+
+
+@receiver(setting_changed)
+def reset_access_counter(setting: str, **kwargs) -> None:
+    """Flush and drop the current counter if any of its settings has changed."""
+    global _access_counter
+    if setting.startswith("SHORTENER_ACCESS_COUNT") and _access_counter is not None:
+        counter, _access_counter = _access_counter, None
+        atexit.unregister(counter.stop)
+        counter.stop()
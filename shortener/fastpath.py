@@ -0,0 +1,192 @@
+"""Lightweight redirect handlers placed in front of the Django stack.
+
+They serve `GET /<shortcut>/` redirects without middleware, URL resolution or view instantiation. Everything else,
+including unknown shortcuts, is passed to the wrapped application, so it's handled (and e.g. 404 rendered) as usual.
+"""
+import logging
+import re
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signals
+from django.utils.encoding import iri_to_uri
+
+from shortener import (
+    analytics,
+    constants,
+    counters,
+    http_cache,
+    metrics,
+    resolvers,
+    throttling,
+)
+from shortener.cache import ResolvedURL
+
+logger = logging.getLogger(__name__)
+
+# Same as `<slug:shortcut>/` path of the `resolve-url` view.
+SHORTCUT_PATH = re.compile(r"^/(?P<shortcut>[-a-zA-Z0-9_]+)/$")
+METHODS = ("GET", "HEAD")
+STATUS_LINES = {
+    301: "301 Moved Permanently",
+    302: "302 Found",
+    429: "429 Too Many Requests",
+    500: "500 Internal Server Error",
+}
+# Redirects served by the fast path are recorded under the name of the view they replace. Only latency is recorded.
+METRICS_VIEW_NAME = "resolve-url"
+
+
+def observe_redirect(method: str, status: int, started: float) -> None:
+    if settings.SHORTENER_METRICS_ENABLED:
+        metrics.observe_request(METRICS_VIEW_NAME, method, status, time.perf_counter() - started)
+
+
+def get_response_headers(location: str, policy: http_cache.RedirectPolicy) -> tuple[int, list[tuple[str, str]]]:
+    return policy.status, [("Location", location), ("Cache-Control", policy.cache_control), ("Content-Length", "0")]
+
+
+def get_throttled_headers(wait: float) -> tuple[int, list[tuple[str, str]]]:
+    return 429, [("Retry-After", throttling.get_retry_after(wait)), ("Content-Length", "0")]
+
+
+def get_recorded_response(
+    shortcut: str, url: ResolvedURL, background: bool = False
+) -> tuple[int, list[tuple[str, str]]]:
+    """Get redirect to the URL whose use has already been recorded, recording the click (see `record_click`).
+
+    The request can't be passed to Django anymore, as its use would be recorded twice, so failures end with 500.
+    """
+    try:
+        analytics.record_click(shortcut, background)
+        return get_response_headers(iri_to_uri(url.original), http_cache.get_redirect_policy(url))
+    except Exception:
+        logger.exception("Failed to redirect %r with the fast path after recording its use.", shortcut)
+        return 500, [("Content-Length", "0")]
+
+
+def get_asgi_meta(scope) -> dict[str, str]:
+    """Get headers needed to identify the client from ASGI scope, in the format of WSGI environ."""
+    meta = {"REMOTE_ADDR": scope["client"][0] if scope.get("client") else ""}
+    for name, value in scope["headers"]:
+        if name == b"x-forwarded-for":
+            meta["HTTP_X_FORWARDED_FOR"] = value.decode("latin-1")
+    return meta
+
+
+def match_shortcut(method: str, path: str) -> str | None:
+    """Get shortcut from the request if it can be handled by the fast path.
+
+    Paths which can't be shortcuts (e.g. of other routes) are rejected here, so that they don't take tokens of the
+    client or get looked up.
+    """
+    if method not in METHODS:
+        return None
+    match = SHORTCUT_PATH.match(path)
+    if match is None:
+        return None
+    shortcut = match["shortcut"]
+    if (
+        not constants.MIN_SHORTCUT_LENGTH <= len(shortcut) <= constants.MAX_SHORTCUT_LENGTH
+        or shortcut in constants.DISALLOWED_SHORTCUTS
+    ):
+        return None
+    return shortcut
+
+
+class RedirectFastPath:
+    """WSGI application serving shortcut redirects and passing all other requests to the wrapped application."""
+
+    def __init__(self, application):
+        self.application = application
+
+    def __call__(self, environ, start_response):
+        shortcut = match_shortcut(environ["REQUEST_METHOD"], environ.get("PATH_INFO", ""))
+        if shortcut is not None:
+            started = time.perf_counter()
+            response = self.resolve(shortcut, environ)
+            if response is not None:
+                status, headers = response
+                start_response(STATUS_LINES[status], headers)
+                observe_redirect(environ["REQUEST_METHOD"], status, started)
+                return [b""]
+        return self.application(environ, start_response)
+
+    def resolve(self, shortcut: str, environ) -> tuple[int, list[tuple[str, str]]] | None:
+        """Get status and headers of the response, or None to pass the request to Django."""
+        # Signals take care of database connections, exactly like in the Django request handler.
+        signals.request_started.send(sender=self.__class__, environ=environ)
+        try:
+            # Throttled clients don't get to look shortcuts up at all.
+            wait = throttling.check(throttling.REDIRECT, throttling.get_client_ident(environ))
+            if wait:
+                return get_throttled_headers(wait)
+            # Django doesn't take another token of requests it gets back.
+            environ[throttling.CHECKED_KEY] = True
+            url = resolvers.resolve_shortcut(shortcut)
+            # Unknown shortcuts are left to Django to render the error response.
+            if url is None:
+                return None
+            # Expired URLs are left to Django too.
+            if not counters.record_use(url):
+                return None
+        except Exception:
+            logger.exception("Failed to resolve %r with the fast path, falling back to Django.", shortcut)
+            return None
+        else:
+            return get_recorded_response(shortcut, url)
+        finally:
+            signals.request_finished.send(sender=self.__class__)
+
+
+class AsyncRedirectFastPath:
+    """ASGI version of `RedirectFastPath`."""
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            shortcut = match_shortcut(scope["method"], scope["path"])
+            if shortcut is not None:
+                started = time.perf_counter()
+                response = await self.resolve(shortcut, scope)
+                if response is not None:
+                    status, headers = response
+                    encoded_headers = [(name.lower().encode(), value.encode("latin-1")) for name, value in headers]
+                    await send({"type": "http.response.start", "status": status, "headers": encoded_headers})
+                    await send({"type": "http.response.body", "body": b""})
+                    observe_redirect(scope["method"], status, started)
+                    return
+        await self.application(scope, receive, send)
+
+    async def resolve(self, shortcut: str, scope) -> tuple[int, list[tuple[str, str]]] | None:
+        await sync_to_async(signals.request_started.send, thread_sensitive=True)(sender=self.__class__, scope=scope)
+        try:
+            wait = await throttling.acheck(throttling.REDIRECT, throttling.get_client_ident(get_asgi_meta(scope)))
+            if wait:
+                return get_throttled_headers(wait)
+            scope[throttling.CHECKED_KEY] = True
+            url = await resolvers.aresolve_shortcut(shortcut)
+            if url is None:
+                return None
+            if not await counters.arecord_use(url):
+                return None
+        except Exception:
+            logger.exception("Failed to resolve %r with the fast path, falling back to Django.", shortcut)
+            return None
+        else:
+            return get_recorded_response(shortcut, url, background=True)
+        finally:
+            await sync_to_async(signals.request_finished.send, thread_sensitive=True)(sender=self.__class__)
+
+
+def wrap_wsgi_application(application):
+    """Put `RedirectFastPath` in front of the application if it's enabled in settings."""
+    return RedirectFastPath(application) if settings.SHORTENER_REDIRECT_FAST_PATH else application
+
+
+def wrap_asgi_application(application):
+    """Put `AsyncRedirectFastPath` in front of the application if it's enabled in settings."""
+    return AsyncRedirectFastPath(application) if settings.SHORTENER_REDIRECT_FAST_PATH else application
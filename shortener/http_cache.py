@@ -0,0 +1,76 @@
+"""HTTP caching of shortener responses.
+
+Redirects get `Cache-Control` (and status) according to the per-link policy, falling back to `SHORTENER_REDIRECT_*`
+settings, so that browsers and CDNs can absorb repeat traffic. URL details support conditional requests with ETag
+derived from the row's state. There's no Last-Modified, as changes of the URL other than its use aren't dated.
+"""
+import hashlib
+import time
+from typing import NamedTuple
+
+from django.conf import settings
+from django.http import HttpResponsePermanentRedirect, HttpResponseRedirect
+
+from shortener.cache import ResolvedURL
+from shortener.models import URL
+
+NO_STORE = "no-store"
+
+
+class RedirectPolicy(NamedTuple):
+    permanent: bool
+    cache_control: str
+
+    @property
+    def status(self) -> int:
+        return 301 if self.permanent else 302
+
+
+def get_redirect_policy(url: ResolvedURL, now: float | None = None) -> RedirectPolicy:
+    """Get status and `Cache-Control` of the redirect to the URL.
+
+    Cached redirects aren't counted, so URLs with max uses are never cached and URLs which expire are cached at most
+    until their expiration.
+    """
+    permanent = settings.SHORTENER_REDIRECT_PERMANENT if url.redirect_permanent is None else url.redirect_permanent
+    max_age = settings.SHORTENER_REDIRECT_MAX_AGE if url.redirect_max_age is None else url.redirect_max_age
+    if url.max_uses is not None:
+        max_age = 0
+    elif url.expires_at is not None:
+        max_age = min(max_age, int(url.expires_at - (time.time() if now is None else now)))
+    cache_control = f"public, max-age={max_age}" if max_age > 0 else NO_STORE
+    return RedirectPolicy(permanent, cache_control)
+
+
+def redirect_response(url: ResolvedURL) -> HttpResponseRedirect | HttpResponsePermanentRedirect:
+    policy = get_redirect_policy(url)
+    response: HttpResponseRedirect | HttpResponsePermanentRedirect
+    if policy.permanent:
+        response = HttpResponsePermanentRedirect(url.original)
+    else:
+        response = HttpResponseRedirect(url.original)
+    response["Cache-Control"] = policy.cache_control
+    return response
+
+
+def get_etag(url: URL, *variants: str) -> str:
+    """Get strong ETag of the URL details.
+
+    It changes whenever any of the fields (including usage data) changes. `variants` are e.g. media type of the
+    response, which changes the representation too.
+    """
+    state = (
+        url.id,
+        url.original,
+        url.shortcut,
+        url.created,
+        url.last_accessed,
+        url.use_count,
+        url.expires_at,
+        url.max_uses,
+        url.redirect_permanent,
+        url.redirect_max_age,
+        settings.SITE_URL,
+        *variants,
+    )
+    return '"' + hashlib.blake2b(repr(state).encode(), digest_size=16).hexdigest() + '"'
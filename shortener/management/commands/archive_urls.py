@@ -0,0 +1,50 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from shortener import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Move URLs which haven't been used for a long time to the archive in small batches. They're restored once "
+        "they're used again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--accessed-days",
+            type=int,
+            default=180,
+            help="Archive URLs last used more than this number of days ago.",
+        )
+        parser.add_argument(
+            "--created-days",
+            type=int,
+            default=180,
+            help="Archive URLs which have never been used and were created more than this number of days ago.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of URLs moved at once.")
+        parser.add_argument("--sleep", type=float, default=0, help="Seconds to wait between batches.")
+
+    def handle(self, *args, accessed_days: int, created_days: int, batch_size: int, sleep: float, **options):
+        if not settings.SHORTENER_ARCHIVE_ENABLED:
+            raise CommandError("Archived URLs are resolved only with SHORTENER_ARCHIVE_ENABLED, enable it first.")
+
+        now = timezone.now()
+        cold = archive.get_cold_filter(
+            accessed_before=now - datetime.timedelta(days=accessed_days),
+            created_before=now - datetime.timedelta(days=created_days),
+        )
+        archived = 0
+        last_id = 0
+        while ids := archive.archive_urls(cold, last_id, batch_size):
+            archived += len(ids)
+            last_id = ids[-1]
+            self.stdout.write(f"Archived {archived} URLs.")
+            time.sleep(sleep)
+
+        self.stdout.write(self.style.SUCCESS(f"Done. Archived {archived} URLs in total."))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shortener.models import ORIGINAL_FIELDS, URL
+
+
+class Command(BaseCommand):
+    help = "Fill in hashes of original URLs for URLs created before the hashes were introduced."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of URLs updated at once.")
+
+    def handle(self, *args, batch_size: int, **options):
+        updated = 0
+        last_id = 0
+        while True:
+            batch = list(
+                URL.objects.filter(id__gt=last_id, original_hash__isnull=True)
+                .only("id", *ORIGINAL_FIELDS)
+                .order_by("id")[:batch_size]
+            )
+            if not batch:
+                break
+
+            for url in batch:
+                url.update_original_hash()
+            with transaction.atomic():
+                URL.objects.bulk_update(batch, ["original_hash"])
+
+            updated += len(batch)
+            last_id = batch[-1].id
+            self.stdout.write(f"Updated {updated} URLs.")
+
+        self.stdout.write(self.style.SUCCESS(f"Done. Updated {updated} URLs in total."))
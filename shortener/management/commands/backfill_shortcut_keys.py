@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shortener.models import URL
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill in integer keys of shortcuts for URLs created without them, e.g. by processes running older code while "
+        "the migration adding them was applied."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of URLs updated at once.")
+
+    def handle(self, *args, batch_size: int, **options):
+        updated = 0
+        last_id = 0
+        while True:
+            batch = list(
+                URL.objects.filter(id__gt=last_id, shortcut_key__isnull=True)
+                .only("id", "shortcut")
+                .order_by("id")[:batch_size]
+            )
+            if not batch:
+                break
+
+            for url in batch:
+                url.update_shortcut_key()
+            # Shortcuts which can't be encoded (e.g. imported ones) stay without keys.
+            keyed = [url for url in batch if url.shortcut_key is not None]
+            with transaction.atomic():
+                URL.objects.bulk_update(keyed, ["shortcut_key"])
+
+            updated += len(keyed)
+            last_id = batch[-1].id
+            self.stdout.write(f"Updated {updated} URLs.")
+
+        self.stdout.write(self.style.SUCCESS(f"Done. Updated {updated} URLs in total."))
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from shortener import snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Compile URLs into a memory-mapped snapshot file, from which redirect nodes can resolve shortcuts without the "
+        "database. By default only URLs created since the last build are added to the existing snapshot."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", nargs="?", help="Snapshot file, SHORTENER_REDIRECT_SNAPSHOT by default.")
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Read all URLs, not only the new ones, e.g. to pick up changed and deleted URLs.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Number of URLs read with a single query.")
+        parser.add_argument(
+            "--run-size", type=int, default=500_000, help="Number of URLs sorted in memory before spilling to disk."
+        )
+
+    def handle(self, *args, output: str | None, full: bool, chunk_size: int, run_size: int, **options):
+        output = output or settings.SHORTENER_REDIRECT_SNAPSHOT
+        if not output:
+            raise CommandError("Snapshot file is required when SHORTENER_REDIRECT_SNAPSHOT isn't set.")
+        try:
+            count = snapshot.build_snapshot(output, incremental=not full, chunk_size=chunk_size, run_size=run_size)
+        except snapshot.SnapshotError as e:
+            raise CommandError(f"{e} Use --full to overwrite it.") from e
+        self.stdout.write(self.style.SUCCESS(f"Done. Snapshot {output} contains {count} URLs."))
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import router, transaction
+
+from shortener.models import ORIGINAL_FIELDS, URL, compact_originals
+
+
+class Command(BaseCommand):
+    help = (
+        "Convert originals of existing URLs to the compact form if SHORTENER_COMPACT_ORIGINALS is enabled, or back to "
+        "plain text otherwise."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of URLs updated at once.")
+
+    def handle(self, *args, batch_size: int, **options):
+        compact = settings.SHORTENER_COMPACT_ORIGINALS
+        updated = 0
+        last_id = 0
+        while True:
+            batch = list(
+                URL.objects.filter(id__gt=last_id, original_rest__isnull=compact)
+                .only("id", *ORIGINAL_FIELDS)
+                .order_by("id")[:batch_size]
+            )
+            if not batch:
+                break
+
+            with transaction.atomic():
+                compact_originals(batch, router.db_for_write(URL))
+                # Unlike `save`, `bulk_update` writes the original as it is, so it's cleared here.
+                for url in batch:
+                    if url.original_rest is not None:
+                        url.original = ""
+                URL.objects.bulk_update(batch, ORIGINAL_FIELDS)
+
+            updated += len(batch)
+            last_id = batch[-1].id
+            self.stdout.write(f"Updated {updated} URLs.")
+
+        self.stdout.write(self.style.SUCCESS(f"Done. Updated {updated} URLs in total."))
@@ -0,0 +1,58 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from shortener import transfer
+from shortener.models import URL, ArchivedURL
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream all URLs out as NDJSON or CSV with constant memory use. With many workers, ranges of ids are exported "
+        "in parallel, each one to its own file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "output",
+            nargs="?",
+            default="-",
+            help="Output file, stdout by default. With many workers, '-<worker>' is added to the file name.",
+        )
+        parser.add_argument("--format", choices=transfer.FORMATS, help="Guessed from the file extension by default.")
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Number of URLs read with a single query.")
+        parser.add_argument("--workers", type=int, default=1, help="Number of id ranges exported in parallel.")
+
+    def handle(self, *args, output: str, format: str | None, chunk_size: int, workers: int, **options):
+        if workers > 1 and output == "-":
+            raise CommandError("Output file is required with many workers.")
+        format = format or transfer.guess_format(output)
+        # Archived URLs keep their ids, so the range covers both tables.
+        ids = [
+            urls.aggregate(start=Min("id"), end=Max("id")) for urls in (URL.objects.all(), ArchivedURL.objects.all())
+        ]
+        starts = [table["start"] for table in ids if table["start"] is not None]
+        ends = [table["end"] + 1 for table in ids if table["end"] is not None]
+        start, end = (min(starts), max(ends)) if starts else (0, 0)
+        # Ranges of ids [start, end) of equal size, one per worker.
+        bounds = [start + (end - start) * index // workers for index in range(workers + 1)]
+        paths = [output] if workers == 1 else [self.get_part_path(output, index) for index in range(workers)]
+
+        # Progress goes to stderr, so that it doesn't mix with URLs written to stdout.
+        progress = transfer.Progress(self.stderr.write, "Exported")
+        calls = [(path, format, *id_range, chunk_size, progress) for path, *id_range in zip(paths, bounds, bounds[1:])]
+        transfer.run_parallel(self.export, calls, workers)
+        self.stderr.write(self.style.SUCCESS(f"Done. {progress.summary()}"))
+
+    @staticmethod
+    def get_part_path(output: str, index: int) -> str:
+        path = Path(output)
+        return str(path.with_name(f"{path.stem}-{index}{path.suffix}"))
+
+    def export(self, path: str, format: str, start: int, end: int, chunk_size: int, progress) -> None:
+        if path == "-":
+            transfer.export_urls(transfer.WRITERS[format](self.stdout), start, end, chunk_size, progress)
+            return
+        with open(path, "w", newline="", encoding="utf-8") as stream:
+            transfer.export_urls(transfer.WRITERS[format](stream), start, end, chunk_size, progress)
@@ -0,0 +1,46 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shortener import transfer
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream URLs exported by `export_urls` back into the database, inserting them in batches. Many files (e.g. "
+        "exported by many workers) can be imported in parallel."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="*", default=["-"], help="Files to import, stdin by default.")
+        parser.add_argument("--format", choices=transfer.FORMATS, help="Guessed from file extensions by default.")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of URLs inserted at once.")
+        parser.add_argument("--workers", type=int, default=1, help="Number of files imported in parallel.")
+        parser.add_argument(
+            "--update",
+            action="store_true",
+            help="Overwrite existing URLs with the same shortcuts instead of skipping imported ones.",
+        )
+
+    def handle(
+        self, *args, paths: list[str], format: str | None, batch_size: int, workers: int, update: bool, **options
+    ):
+        # URLs skipped because of existing shortcuts are counted too.
+        progress = transfer.Progress(self.stderr.write, "Processed")
+        calls = [(path, format or transfer.guess_format(path), batch_size, update, progress) for path in paths]
+        try:
+            transfer.run_parallel(self.import_file, calls, workers)
+        except ValueError as e:
+            raise CommandError(f"{e} Batches inserted before the error are kept, the import can be run again.")
+        self.stderr.write(self.style.SUCCESS(f"Done. {progress.summary()}"))
+
+    @staticmethod
+    def import_file(path: str, format: str, batch_size: int, update: bool, progress) -> None:
+        if path == "-":
+            transfer.import_urls(transfer.READERS[format](sys.stdin), batch_size, update, progress)
+            return
+        with open(path, newline="", encoding="utf-8") as stream:
+            try:
+                transfer.import_urls(transfer.READERS[format](stream), batch_size, update, progress)
+            except ValueError as e:
+                raise ValueError(f"{path}: {e}") from e
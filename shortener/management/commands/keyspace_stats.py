@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+
+from shortener import constants
+from shortener.models import ShortcutSequence
+from shortener.shortcuts import count_shortcuts_by_length, get_keyspace_size
+
+
+class Command(BaseCommand):
+    help = "Report how many shortcuts of every length are used, out of all possible ones."
+
+    def handle(self, *args, **options):
+        counts = count_shortcuts_by_length()
+        # Counters of all shards together.
+        sequences = ShortcutSequence.objects.values("length").annotate(reserved=Sum("next_value")).order_by()
+        reserved = {row["length"]: row["reserved"] for row in sequences}
+        max_occupancy = settings.SHORTENER_SHORTCUT_MAX_OCCUPANCY
+
+        self.stdout.write(f"{'Length':>6} {'Keyspace':>24} {'Used':>14} {'Utilization':>12} {'Reserved':>14}")
+        for length in range(constants.MIN_SHORTCUT_LENGTH, constants.MAX_SHORTCUT_LENGTH + 1):
+            keyspace = get_keyspace_size(length)
+            used = counts.get(length, 0)
+            utilization = used / keyspace
+            line = (
+                f"{length:>6} {keyspace:>24,} {used:>14,} {utilization:>12.6%} "
+                f"{min(reserved.get(length, 0), keyspace):>14,}"
+            )
+            self.stdout.write(self.style.WARNING(line) if utilization >= max_occupancy else line)
+
+        other = sum(count for length, count in counts.items() if length < constants.MIN_SHORTCUT_LENGTH)
+        if other:
+            self.stdout.write(f"{other} shortcuts are shorter than {constants.MIN_SHORTCUT_LENGTH} characters.")
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+INDEX_NAME = "shortener_url_original_trgm"
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the trigram index of originals which makes substring search in the admin "
+        "(SHORTENER_ADMIN_SEARCH_ORIGINAL) fast, or drop it. PostgreSQL only. The index is built without locking the "
+        "table for writes, but it makes every insert slower and it doesn't cover compact originals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--drop", action="store_true", help="Drop the index instead of creating it.")
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS, help="Database to create the index in.")
+
+    def handle(self, *args, drop: bool, database: str, **options):
+        connection = connections[database]
+        if connection.vendor != "postgresql":
+            raise CommandError("Trigram indexes are supported on PostgreSQL only.")
+        # CONCURRENTLY can't run in a transaction, so statements are run in autocommit mode, which is Django's default.
+        with connection.cursor() as cursor:
+            if drop:
+                cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME}")
+                self.stdout.write(self.style.SUCCESS("Dropped the trigram index of originals."))
+                return
+            # Requires the privilege to create extensions, unless pg_trgm is installed already.
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cursor.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {INDEX_NAME} "
+                "ON shortener_url USING gin (original gin_trgm_ops)"
+            )
+        self.stdout.write(self.style.SUCCESS("Created the trigram index of originals."))
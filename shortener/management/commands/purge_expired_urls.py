@@ -0,0 +1,68 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, QuerySet
+from django.utils import timezone
+
+from shortener.models import URL, ArchivedURL, ClickBucket
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete URLs past their expiration date (and, optionally, URLs which have been used up) in small batches, "
+        "so that their shortcuts can be reused."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of URLs deleted at once.")
+        parser.add_argument("--sleep", type=float, default=0, help="Seconds to wait between batches.")
+        parser.add_argument(
+            "--used-up",
+            action="store_true",
+            help="Delete also URLs which reached their max number of uses. It scans the whole table by id ranges.",
+        )
+
+    def handle(self, *args, batch_size: int, sleep: float, used_up: bool, **options):
+        # Only URLs which expired before the command started are deleted, so that it eventually finishes.
+        now = timezone.now()
+        deleted = 0
+        # Archived URLs are never restored once they expire, but their shortcuts stay taken until they're deleted.
+        for urls in (URL.objects.all(), ArchivedURL.objects.all()):
+            expired = urls.filter(expires_at__lte=now).order_by("expires_at", "id")
+            while batch := list(expired.values_list("id", "shortcut")[:batch_size]):
+                deleted += self.delete_batch(urls, batch)
+                self.stdout.write(f"Deleted {deleted} expired URLs.")
+                time.sleep(sleep)
+
+        if used_up:
+            for urls in (URL.objects.all(), ArchivedURL.objects.all()):
+                deleted += self.delete_used_up(urls, batch_size, sleep)
+
+        self.stdout.write(self.style.SUCCESS(f"Done. Deleted {deleted} URLs in total."))
+
+    def delete_used_up(self, urls: QuerySet[URL] | QuerySet[ArchivedURL], batch_size: int, sleep: float) -> int:
+        """Walk the primary key in ranges of `batch_size`, so that every query touches a bounded number of rows."""
+        deleted = 0
+        last_id = urls.order_by("-id").values_list("id", flat=True).first() or 0
+        for start in range(0, last_id, batch_size):
+            batch = list(
+                urls.filter(
+                    id__gt=start, id__lte=start + batch_size, max_uses__isnull=False, use_count__gte=F("max_uses")
+                ).values_list("id", "shortcut")
+            )
+            if batch:
+                deleted += self.delete_batch(urls, batch)
+                self.stdout.write(f"Deleted {deleted} used up URLs.")
+                time.sleep(sleep)
+        return deleted
+
+    @staticmethod
+    def delete_batch(urls: QuerySet[URL] | QuerySet[ArchivedURL], batch: list[tuple[int, str]]) -> int:
+        """Delete URLs along with their click stats, which would otherwise pass to a URL reusing the shortcut."""
+        ids, shortcuts = zip(*batch)
+        with transaction.atomic():
+            # Deleting with signals drops the URLs from the cache too.
+            deleted, _ = urls.filter(id__in=ids).delete()
+            ClickBucket.objects.filter(shortcut__in=shortcuts).delete()
+        return deleted
@@ -0,0 +1,30 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from shortener.analytics import rollup_clicks
+
+
+class Command(BaseCommand):
+    help = "Roll up click events from the click log into hourly and daily stats."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", type=float, metavar="SECONDS", help="Keep rolling up every given seconds.")
+        parser.add_argument(
+            "--grace-period",
+            type=float,
+            default=1.0,
+            help="Seconds to wait for processes still writing to the log after it's rotated.",
+        )
+
+    def handle(self, *args, loop: float | None, grace_period: float, **options):
+        if not settings.SHORTENER_CLICK_LOG:
+            raise CommandError("Click analytics is disabled, set SHORTENER_CLICK_LOG to enable it.")
+
+        while True:
+            processed = rollup_clicks(settings.SHORTENER_CLICK_LOG, grace_period)
+            self.stdout.write(f"Rolled up {processed} clicks.")
+            if loop is None:
+                break
+            time.sleep(loop)
@@ -0,0 +1,51 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shortener import constants, shortcuts
+from shortener.models import URL
+
+
+class Command(BaseCommand):
+    help = "Fill the database with random URLs, e.g. to benchmark the application on a big table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("count", type=int, help="Number of URLs to create.")
+        parser.add_argument(
+            "--length",
+            type=int,
+            default=constants.MIN_SHORTCUT_LENGTH,
+            help="Length of generated shortcuts.",
+        )
+        parser.add_argument("--batch-size", type=int, default=10_000, help="Number of URLs inserted at once.")
+        parser.add_argument("--seed", type=int, default=None, help="Seed of the random generator.")
+
+    def handle(self, *args, count: int, length: int, batch_size: int, seed: int | None, verbosity: int, **options):
+        if not constants.MIN_SHORTCUT_LENGTH <= length <= constants.MAX_SHORTCUT_LENGTH:
+            raise CommandError(
+                f"Length must be between {constants.MIN_SHORTCUT_LENGTH} and {constants.MAX_SHORTCUT_LENGTH}."
+            )
+
+        # Shortcuts don't have to be unpredictable here, so much faster generator than in `get_random_slug` is used.
+        rng = random.Random(seed)
+        created = 0
+        started = time.monotonic()
+        while created < count:
+            size = min(batch_size, count - created)
+            urls = []
+            for _ in range(size):
+                shortcut = "".join(rng.choices(shortcuts.CHARSET, k=length))
+                url = URL(shortcut=shortcut, original=f"https://example.com/{shortcut}/{rng.getrandbits(64):x}")
+                url.update_original_hash()
+                urls.append(url)
+            URL.objects.bulk_create(urls, ignore_conflicts=True)
+
+            # Colliding shortcuts are silently skipped, so the real number of rows is only approximated here.
+            created += size
+            elapsed = time.monotonic() - started
+            if verbosity >= 1:
+                self.stdout.write(f"Inserted {created}/{count} URLs ({created / elapsed:.0f} rows/s).")
+
+        if verbosity >= 1:
+            self.stdout.write(self.style.SUCCESS(f"Done. Table contains {URL.objects.count()} URLs."))
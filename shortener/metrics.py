@@ -0,0 +1,212 @@
+"""In-process metrics exposed in the Prometheus text format.
+
+Metrics are kept in memory of every process and updated with a lock-protected dict lookup, so recording them is cheap
+enough for the redirect path. With many worker processes, each one exposes only its own metrics.
+"""
+import bisect
+import math
+import threading
+import time
+from typing import Iterator, TypeVar
+
+# Upper bounds of request duration buckets, in seconds.
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+SHORTCUT_ATTEMPT_BUCKETS = (1, 2, 3, 5, 10, 20, 30, 60)
+# Methods recorded under their own label. Clients can send any method, so the rest share one label, keeping the number
+# of series bounded.
+HTTP_METHODS = frozenset(("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "TRACE", "CONNECT"))
+OTHER_METHOD = "other"
+
+Labels = tuple[str, ...]
+Sample = tuple[str, dict[str, str], float]
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Labels = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def samples(self) -> Iterator[Sample]:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def _check_labels(self, labels: Labels) -> None:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels: {', '.join(self.labelnames)}.")
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(f"{name}{format_labels(labels)} {format_value(value)}" for name, labels, value in self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Monotonically increasing value per combination of labels."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Labels = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._check_labels(labels)
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def samples(self) -> Iterator[Sample]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield self.name, dict(zip(self.labelnames, labels)), value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram(Metric):
+    """Distribution of observed values in buckets with given upper bounds, per combination of labels."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Labels = (), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per labels: count of observations in each bucket (not cumulative, the last one is +Inf) and their sum.
+        self._values: dict[Labels, tuple[list[int], float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        self._check_labels(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(labels) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[index] += 1
+            self._values[labels] = (counts, total + value)
+
+    def get_count(self, *labels: str) -> int:
+        with self._lock:
+            counts, _ = self._values.get(labels, ([0], 0.0))
+            return sum(counts)
+
+    def get_sum(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(labels, ([0], 0.0))[1]
+
+    def samples(self) -> Iterator[Sample]:
+        with self._lock:
+            values = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        for labels, (counts, total) in values:
+            label_dict = dict(zip(self.labelnames, labels))
+            cumulative = 0
+            for upper_bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", {**label_dict, "le": format_value(upper_bound)}, cumulative
+            yield f"{self.name}_sum", label_dict, total
+            yield f"{self.name}_count", label_dict, cumulative
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+MetricT = TypeVar("MetricT", bound=Metric)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: MetricT) -> MetricT:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered.")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        return "".join(metric.render() + "\n" for metric in self.metrics.values())
+
+    def clear(self) -> None:
+        for metric in self.metrics.values():
+            metric.clear()
+
+
+REGISTRY = Registry()
+
+REQUEST_DURATION = REGISTRY.register(
+    Histogram("shortener_request_duration_seconds", "Request latency.", ("view", "method", "status"))
+)
+DB_QUERIES = REGISTRY.register(
+    Histogram("shortener_db_queries", "Database queries per request.", ("view",), buckets=QUERY_COUNT_BUCKETS)
+)
+DB_QUERY_DURATION = REGISTRY.register(
+    Histogram("shortener_db_query_duration_seconds", "Time spent in database queries per request.", ("view",))
+)
+URL_CACHE_LOOKUPS = REGISTRY.register(
+    Counter("shortener_url_cache_lookups_total", "Shortcut lookups in the URL cache.", ("result",))
+)
+SHORTCUT_ATTEMPTS = REGISTRY.register(
+    Histogram(
+        "shortener_shortcut_attempts",
+        "Random shortcuts tried until a free one is found.",
+        buckets=SHORTCUT_ATTEMPT_BUCKETS,
+    )
+)
+SHORTCUT_LENGTH_ESCALATIONS = REGISTRY.register(
+    Counter(
+        "shortener_shortcut_length_escalations_total",
+        "Times shortcut generation moved to longer shortcuts because the shorter ones are crowded or used up.",
+        ("length",),
+    )
+)
+
+
+class QueryObserver:
+    """Database execute wrapper counting queries and their total duration."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+def observe_request(view: str, method: str, status: int, duration: float, queries: QueryObserver | None = None):
+    REQUEST_DURATION.observe(duration, view, method if method in HTTP_METHODS else OTHER_METHOD, str(status))
+    if queries is not None:
+        DB_QUERIES.observe(queries.count, view)
+        DB_QUERY_DURATION.observe(queries.duration, view)
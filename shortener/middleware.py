@@ -0,0 +1,90 @@
+import contextlib
+import contextvars
+import time
+from typing import Iterator
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from shortener import metrics
+
+UNMATCHED_VIEW = "unmatched"
+
+# Observer of queries of the current request. It's kept in the context, which `sync_to_async` passes on to the threads
+# running the ORM for async requests, so queries are counted whichever thread and connection they run on.
+current_queries: contextvars.ContextVar[metrics.QueryObserver | None] = contextvars.ContextVar(
+    "current_queries", default=None
+)
+
+
+def observe_query(execute, sql, params, many, context):
+    """Database execute wrapper passing queries to the observer of the current request, if there's any."""
+    queries = current_queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    return queries(execute, sql, params, many, context)
+
+
+def install_query_observer(connection, **kwargs) -> None:
+    """Install `observe_query` on the connection for good, unless it's already there."""
+    if observe_query not in connection.execute_wrappers:
+        # Temporary wrappers are popped from the end of the list, so this one goes first.
+        connection.execute_wrappers.insert(0, observe_query)
+
+
+class MetricsMiddleware:
+    """Record latency and database queries of every request, labelled with the name of the URL pattern.
+
+    It should be the first middleware, so that time spent in the other ones is measured too. Works both in sync and
+    async mode, so it doesn't force async views into a thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SHORTENER_METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # Connections are opened lazily in every thread, and the ones of this thread may already be open.
+        connection_created.connect(install_query_observer, dispatch_uid="shortener.middleware.install_query_observer")
+        for connection in connections.all(initialized_only=True):
+            install_query_observer(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        queries = metrics.QueryObserver()
+        started = time.perf_counter()
+        with self.observe_queries(queries):
+            response = self.get_response(request)
+        self.observe(request, response, time.perf_counter() - started, queries)
+        return response
+
+    async def __acall__(self, request):
+        queries = metrics.QueryObserver()
+        started = time.perf_counter()
+        with self.observe_queries(queries):
+            response = await self.get_response(request)
+        self.observe(request, response, time.perf_counter() - started, queries)
+        return response
+
+    @staticmethod
+    @contextlib.contextmanager
+    def observe_queries(queries: metrics.QueryObserver) -> Iterator[None]:
+        token = current_queries.set(queries)
+        try:
+            yield
+        finally:
+            current_queries.reset(token)
+
+    @staticmethod
+    def observe(request, response, duration: float, queries: metrics.QueryObserver) -> None:
+        match = request.resolver_match
+        view = match.view_name if match is not None else UNMATCHED_VIEW
+        metrics.observe_request(view, request.method, response.status_code, duration, queries)
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("shortener", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ShortcutSequence",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("length", models.PositiveSmallIntegerField(unique=True, verbose_name="Shortcut length")),
+                ("next_value", models.BigIntegerField(default=0, verbose_name="Next value to reserve")),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("shortener", "0002_shortcutsequence"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="url",
+            name="original_hash",
+            field=models.CharField(
+                db_index=True,
+                max_length=64,
+                null=True,
+                verbose_name="Hash of normalized original URL",
+            ),
+        ),
+    ]
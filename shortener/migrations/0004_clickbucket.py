@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [("shortener", "0003_url_original_hash")]
+
+    operations = [
+        migrations.CreateModel(
+            name="ClickBucket",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("shortcut", models.CharField(max_length=10, verbose_name="Shortcut")),
+                (
+                    "granularity",
+                    models.CharField(
+                        choices=[("hour", "Hour"), ("day", "Day")], max_length=4, verbose_name="Granularity"
+                    ),
+                ),
+                ("start", models.DateTimeField(verbose_name="Start of the period")),
+                ("count", models.PositiveBigIntegerField(default=0, verbose_name="Number of uses")),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="clickbucket",
+            constraint=models.UniqueConstraint(fields=("shortcut", "granularity", "start"), name="unique_click_bucket"),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [("shortener", "0004_clickbucket")]
+
+    operations = [
+        migrations.AddField(
+            model_name="url",
+            name="expires_at",
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name="Date of expiration"),
+        ),
+        migrations.AddField(
+            model_name="url",
+            name="max_uses",
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name="Max number of uses"),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [("shortener", "0005_url_expiration")]
+
+    operations = [
+        migrations.AddField(
+            model_name="url",
+            name="redirect_max_age",
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name="Seconds redirect may be cached for"),
+        ),
+        migrations.AddField(
+            model_name="url",
+            name="redirect_permanent",
+            field=models.BooleanField(blank=True, null=True, verbose_name="Redirect permanently"),
+        ),
+    ]
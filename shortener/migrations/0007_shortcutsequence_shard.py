@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [("shortener", "0006_url_redirect_policy")]
+
+    operations = [
+        migrations.AddField(
+            model_name="shortcutsequence",
+            name="shard",
+            field=models.PositiveSmallIntegerField(default=0, verbose_name="Shard of the keyspace"),
+        ),
+        migrations.AlterField(
+            model_name="shortcutsequence",
+            name="length",
+            field=models.PositiveSmallIntegerField(verbose_name="Shortcut length"),
+        ),
+        migrations.AddConstraint(
+            model_name="shortcutsequence",
+            constraint=models.UniqueConstraint(fields=("length", "shard"), name="unique_shortcut_sequence"),
+        ),
+    ]
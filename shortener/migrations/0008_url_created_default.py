@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:07
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [("shortener", "0007_shortcutsequence_shard")]
+
+    operations = [
+        migrations.AlterField(
+            model_name="url",
+            name="created",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, editable=False, verbose_name="Date of creation"
+            ),
+        )
+    ]
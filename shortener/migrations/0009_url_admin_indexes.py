@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [("shortener", "0008_url_created_default")]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="url", index=models.Index(fields=["created", "id"], name="shortener_url_created_idx")
+        ),
+        migrations.AddIndex(
+            model_name="url", index=models.Index(fields=["use_count", "id"], name="shortener_url_use_count_idx")
+        ),
+        migrations.AddIndex(
+            model_name="url", index=models.Index(fields=["last_accessed", "id"], name="shortener_url_last_access_idx")
+        ),
+    ]
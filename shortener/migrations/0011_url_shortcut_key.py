@@ -0,0 +1,15 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [("shortener", "0009_url_admin_indexes")]
+
+    operations = [
+        migrations.AddField(
+            model_name="url",
+            name="shortcut_key",
+            field=models.BigIntegerField(editable=False, null=True, unique=True, verbose_name="Shortcut key"),
+        )
+    ]
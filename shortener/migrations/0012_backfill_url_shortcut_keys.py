@@ -0,0 +1,47 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:24
+
+import string
+
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+# Frozen copy of `shortener.models.get_shortcut_key` as of this migration, so that it keeps writing the same keys.
+CHARSET = string.ascii_letters + string.digits
+MAX_SHORTCUT_LENGTH = 10
+CHARSET_INDEXES = {char: index for index, char in enumerate(CHARSET)}
+KEY_OFFSETS = [
+    sum(len(CHARSET) ** shorter for shorter in range(1, length)) for length in range(MAX_SHORTCUT_LENGTH + 1)
+]
+
+
+def get_shortcut_key(shortcut: str) -> int | None:
+    if not 0 < len(shortcut) <= MAX_SHORTCUT_LENGTH:
+        return None
+    value = 0
+    for char in shortcut:
+        index = CHARSET_INDEXES.get(char)
+        if index is None:
+            return None
+        value = value * len(CHARSET) + index
+    return KEY_OFFSETS[len(shortcut)] + value
+
+
+def backfill_shortcut_keys(apps, schema_editor):
+    """Fill in keys of shortcuts of existing URLs, walking the primary key in batches."""
+    URL = apps.get_model("shortener", "URL")
+    urls = URL.objects.using(schema_editor.connection.alias).filter(shortcut_key__isnull=True).order_by("id")
+    last_id = 0
+    while batch := list(urls.filter(id__gt=last_id).only("id", "shortcut")[:BATCH_SIZE]):
+        for url in batch:
+            url.shortcut_key = get_shortcut_key(url.shortcut)
+        URL.objects.using(schema_editor.connection.alias).bulk_update(batch, ["shortcut_key"])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+    dependencies = [("shortener", "0011_url_shortcut_key")]
+
+    operations = [
+        migrations.RunPython(backfill_shortcut_keys, migrations.RunPython.noop, elidable=True),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+import shortener.models
+
+
+class Migration(migrations.Migration):
+    dependencies = [("shortener", "0012_backfill_url_shortcut_keys")]
+
+    operations = [
+        migrations.CreateModel(
+            name="URLPrefix",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("prefix", models.CharField(max_length=255, unique=True, verbose_name="Prefix")),
+            ],
+        ),
+        migrations.AddField(
+            model_name="url",
+            name="original_rest",
+            field=models.BinaryField(null=True, verbose_name="Compressed rest of original URL"),
+        ),
+        migrations.AlterField(
+            model_name="url", name="original", field=shortener.models.OriginalURLField(verbose_name="Original URL")
+        ),
+        migrations.AddField(
+            model_name="url",
+            name="original_prefix",
+            field=models.ForeignKey(
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                to="shortener.urlprefix",
+                verbose_name="Prefix of original URL",
+            ),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:33
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [("shortener", "0013_url_compact_original")]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedURL",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("original", models.URLField(verbose_name="Original URL")),
+                ("shortcut", models.CharField(max_length=10, unique=True, verbose_name="Shortcut")),
+                ("created", models.DateTimeField(verbose_name="Date of creation")),
+                ("last_accessed", models.DateTimeField(null=True, verbose_name="Date of last access")),
+                ("use_count", models.PositiveIntegerField(default=0, verbose_name="Number of uses")),
+                (
+                    "original_hash",
+                    models.CharField(
+                        db_index=True, max_length=64, null=True, verbose_name="Hash of normalized original URL"
+                    ),
+                ),
+                ("expires_at", models.DateTimeField(null=True, verbose_name="Date of expiration")),
+                ("max_uses", models.PositiveIntegerField(null=True, verbose_name="Max number of uses")),
+                ("redirect_permanent", models.BooleanField(null=True, verbose_name="Redirect permanently")),
+                (
+                    "redirect_max_age",
+                    models.PositiveIntegerField(null=True, verbose_name="Seconds redirect may be cached for"),
+                ),
+                ("archived", models.DateTimeField(default=django.utils.timezone.now, verbose_name="Date of archiving")),
+            ],
+        )
+    ]
@@ -1,26 +1,389 @@
+import functools
 import urllib.parse
+from typing import Iterable
 
 from django.conf import settings
-from django.db import models
+from django.core.signals import setting_changed
+from django.db import models, router, transaction
+from django.db.models import Q
+from django.dispatch import receiver
 from django.urls import reverse
+from django.utils import timezone
 
-from shortener import constants
+from shortener import compact, constants
+from shortener.normalization import hash_url
+
+_shortened_url_template: tuple[str, str] | None = None
+
+
+def get_shortened_url_template() -> tuple[str, str]:
+    """Get parts of shortened URLs before and after the shortcut.
+
+    Reversing the URL pattern and joining it with `SITE_URL` is done once, rather than for every serialized URL.
+    """
+    global _shortened_url_template
+    if _shortened_url_template is None:
+        placeholder = "shortcut"
+        prefix, _, suffix = reverse("resolve-url", args=(placeholder,)).rpartition(placeholder)
+        _shortened_url_template = (urllib.parse.urljoin(settings.SITE_URL, prefix), suffix)
+    return _shortened_url_template
+
+
+@receiver(setting_changed)
+def reset_shortened_url_template(setting: str, **kwargs) -> None:
+    global _shortened_url_template
+    if setting in ("SITE_URL", "ROOT_URLCONF"):
+        _shortened_url_template = None
+
+
+_CHARSET_INDEXES = {char: index for index, char in enumerate(constants.SHORTCUT_CHARSET)}
+# Number of shortcuts shorter than given length, so that keys of shortcuts of different lengths never overlap.
+_KEY_OFFSETS = [
+    sum(len(constants.SHORTCUT_CHARSET) ** shorter for shorter in range(1, length))
+    for length in range(constants.MAX_SHORTCUT_LENGTH + 2)
+]
+
+
+def get_shortcut_key(shortcut: str) -> int | None:
+    """Encode shortcut as an integer which fits in BIGINT, unique across shortcuts of all lengths.
+
+    Shortcut is read as a base62 number over `constants.SHORTCUT_CHARSET`, shifted by the number of all shorter
+    shortcuts. Returns `None` for shortcuts which can't be encoded, i.e. which weren't generated, but imported.
+    """
+    if not 0 < len(shortcut) <= constants.MAX_SHORTCUT_LENGTH:
+        return None
+    value = 0
+    for char in shortcut:
+        index = _CHARSET_INDEXES.get(char)
+        if index is None:
+            return None
+        value = value * len(constants.SHORTCUT_CHARSET) + index
+    return _KEY_OFFSETS[len(shortcut)] + value
+
+
+def get_shortcut_from_key(key: int) -> str:
+    """Decode shortcut from its key. Reverse of `get_shortcut_key`."""
+    length = 1
+    while key >= _KEY_OFFSETS[length + 1]:
+        length += 1
+    value = key - _KEY_OFFSETS[length]
+    chars = []
+    for _ in range(length):
+        value, index = divmod(value, len(constants.SHORTCUT_CHARSET))
+        chars.append(constants.SHORTCUT_CHARSET[index])
+    return "".join(reversed(chars))
+
+
+def get_shortcut_lookup(shortcut: str) -> dict:
+    """Get lookup of URL by shortcut. With `SHORTENER_SHORTCUT_KEY_LOOKUPS`, URL is looked up by the integer key."""
+    if settings.SHORTENER_SHORTCUT_KEY_LOOKUPS:
+        key = get_shortcut_key(shortcut)
+        if key is not None:
+            return {"shortcut_key": key}
+    return {"shortcut": shortcut}
+
+
+def get_unkeyed_filter(shortcuts: Iterable[str]) -> Q | None:
+    """Get filter of URLs without keys with any of the shortcuts, to be looked up when lookups by key find nothing.
+
+    Returns `None` when URLs aren't looked up by keys. URLs may lack keys if they were created by processes running
+    older code before `backfill_shortcut_keys` has been run.
+    """
+    if not settings.SHORTENER_SHORTCUT_KEY_LOOKUPS:
+        return None
+    keyed = [shortcut for shortcut in shortcuts if get_shortcut_key(shortcut) is not None]
+    return Q(shortcut__in=keyed, shortcut_key__isnull=True) if keyed else None
+
+
+def get_by_shortcut(queryset: "models.QuerySet[URL]", shortcut: str) -> "URL":
+    """Get URL by shortcut, see `get_shortcut_lookup`. URL not found by key is looked up by the shortcut string too.
+
+    Raises `URL.DoesNotExist` if there's no such URL.
+    """
+    try:
+        return queryset.get(**get_shortcut_lookup(shortcut))
+    except URL.DoesNotExist:
+        unkeyed = get_unkeyed_filter([shortcut])
+        if unkeyed is None:
+            raise
+    return queryset.get(unkeyed)
+
+
+async def aget_by_shortcut(queryset: "models.QuerySet[URL]", shortcut: str) -> "URL":
+    """Asynchronous version of `get_by_shortcut`."""
+    try:
+        return await queryset.aget(**get_shortcut_lookup(shortcut))
+    except URL.DoesNotExist:
+        unkeyed = get_unkeyed_filter([shortcut])
+        if unkeyed is None:
+            raise
+    return await queryset.aget(unkeyed)
+
+
+def get_shortcuts_filter(shortcuts: Iterable[str]) -> Q:
+    """Get filter of URLs with any of the shortcuts, looked up by their keys like in `get_shortcut_lookup`."""
+    shortcuts = list(shortcuts)
+    if not settings.SHORTENER_SHORTCUT_KEY_LOOKUPS:
+        return Q(shortcut__in=shortcuts)
+    keys = []
+    others = []
+    for shortcut in shortcuts:
+        key = get_shortcut_key(shortcut)
+        if key is None:
+            others.append(shortcut)
+        else:
+            keys.append(key)
+    if not others:
+        return Q(shortcut_key__in=keys)
+    return Q(shortcut_key__in=keys) | Q(shortcut__in=others)
+
+
+# Prefixes of original URLs by ids and the other way round. Prefixes never change, so they can be kept forever, but
+# only once they're committed, as ids of rolled back rows may be reused.
+_url_prefixes: dict[int, str] = {}
+_url_prefix_ids: dict[str, int] = {}
+MAX_CACHED_URL_PREFIXES = 100_000
+
+
+def cache_url_prefixes(prefixes: dict[str, int]) -> None:
+    if len(_url_prefixes) + len(prefixes) > MAX_CACHED_URL_PREFIXES:
+        clear_url_prefix_cache()
+    for prefix, prefix_id in prefixes.items():
+        _url_prefixes[prefix_id] = prefix
+        _url_prefix_ids[prefix] = prefix_id
+
+
+def clear_url_prefix_cache() -> None:
+    _url_prefixes.clear()
+    _url_prefix_ids.clear()
+
+
+class URLPrefixManager(models.Manager["URLPrefix"]):
+    def get_prefix(self, prefix_id: int) -> str:
+        prefix = _url_prefixes.get(prefix_id)
+        if prefix is None:
+            prefix = self.get(id=prefix_id).prefix
+            transaction.on_commit(functools.partial(cache_url_prefixes, {prefix: prefix_id}), using=self.db)
+        return prefix
+
+    def get_ids(self, prefixes: Iterable[str]) -> dict[str, int]:
+        """Get ids of prefixes, adding the missing ones to the table."""
+        ids = {}
+        missing = set()
+        for prefix in prefixes:
+            prefix_id = _url_prefix_ids.get(prefix)
+            if prefix_id is None:
+                missing.add(prefix)
+            else:
+                ids[prefix] = prefix_id
+        if missing:
+            self.bulk_create([URLPrefix(prefix=prefix) for prefix in missing], ignore_conflicts=True)
+            # Ids aren't returned for rows which already existed or with `ignore_conflicts`, so they are read back.
+            found = dict(self.filter(prefix__in=missing).values_list("prefix", "id"))
+            transaction.on_commit(functools.partial(cache_url_prefixes, found), using=self.db)
+            ids.update(found)
+        return ids
+
+
+class URLPrefix(models.Model):
+    """Scheme and host shared by many original URLs, stored once (see `shortener.compact`)."""
+
+    prefix = models.CharField("Prefix", max_length=compact.MAX_PREFIX_LENGTH, unique=True)
+
+    objects = URLPrefixManager()
+
+    def __str__(self) -> str:
+        return self.prefix
+
+
+# Fields in which original URL is stored, required to read it.
+ORIGINAL_FIELDS = ("original", "original_prefix", "original_rest")
+
+
+def compact_originals(urls: list["URL"], using: str) -> None:
+    """Set compact form of originals of URLs if `SHORTENER_COMPACT_ORIGINALS` is enabled, or clear it otherwise."""
+    if not settings.SHORTENER_COMPACT_ORIGINALS:
+        for url in urls:
+            url.original_prefix_id = url.original_rest = None
+        return
+    parts = [compact.split_original(url.original) for url in urls]
+    ids = URLPrefix.objects.db_manager(using).get_ids({prefix for prefix, _ in parts if prefix is not None})
+    for url, (prefix, rest) in zip(urls, parts):
+        url.original_prefix_id = ids[prefix] if prefix is not None else None
+        url.original_rest = compact.compress(rest)
+
+
+def expand_original(original: str, prefix_id: int | None, rest: bytes | None, using: str) -> str:
+    """Get original URL from the values of `ORIGINAL_FIELDS` read from the database."""
+    if rest is None:
+        return original
+    # PostgreSQL returns memoryview rather than bytes.
+    expanded = compact.decompress(bytes(rest))
+    if prefix_id is None:
+        return expanded
+    return URLPrefix.objects.db_manager(using).get_prefix(prefix_id) + expanded
+
+
+class OriginalURLField(models.URLField):
+    """Field of the original URL, which is left empty in the database if the URL is stored in the compact form."""
+
+    def pre_save(self, model_instance, add):
+        if model_instance.original_rest is not None:
+            return ""
+        return super().pre_save(model_instance, add)
+
+
+# Fields set on request, which make URL behave differently from other URLs with the same original: limits of its use
+# and cache policy of its redirect. URLs with any of them set are neither reused nor returned for reuse.
+CUSTOM_FIELDS = ("expires_at", "max_uses", "redirect_permanent", "redirect_max_age")
+
+
+class URLQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        """Set keys of shortcuts and compact originals, which are otherwise set by `URL.save`, before inserting URLs."""
+        objs = list(objs)
+        for url in objs:
+            url.update_shortcut_key()
+        compact_originals(objs, self._db or router.db_for_write(self.model))
+        update_fields = kwargs.get("update_fields")
+        if update_fields and "original" in update_fields:
+            kwargs["update_fields"] = [*update_fields, "original_prefix", "original_rest"]
+        return super().bulk_create(objs, *args, **kwargs)
 
 
 class URL(models.Model):
     """An entity representing shortened URL along with some metadata."""
 
-    original = models.URLField("Original URL")
+    original = OriginalURLField("Original URL")
+    # Compact form of the original (see `shortener.compact`), set with `SHORTENER_COMPACT_ORIGINALS`. The original is
+    # read from it once the URL is loaded, so the rest of the code never sees the difference.
+    original_prefix = models.ForeignKey(
+        URLPrefix, verbose_name="Prefix of original URL", null=True, on_delete=models.PROTECT, editable=False
+    )
+    original_rest = models.BinaryField("Compressed rest of original URL", null=True)
     shortcut = models.CharField("Shortcut", max_length=constants.MAX_SHORTCUT_LENGTH, db_index=True, unique=True)
-    created = models.DateTimeField("Date of creation", auto_now_add=True)
+    # Shortcut encoded as an integer (see `get_shortcut_key`), whose index is smaller and faster to search.
+    shortcut_key = models.BigIntegerField("Shortcut key", unique=True, null=True, editable=False)
+    # Not `auto_now_add`, which would overwrite dates of imported URLs (see `shortener.transfer`).
+    created = models.DateTimeField("Date of creation", default=timezone.now, editable=False)
     last_accessed = models.DateTimeField("Date of last access", null=True)
     use_count = models.PositiveIntegerField("Number of uses", default=0)
+    original_hash = models.CharField("Hash of normalized original URL", max_length=64, db_index=True, null=True)
+    expires_at = models.DateTimeField("Date of expiration", null=True, blank=True, db_index=True)
+    max_uses = models.PositiveIntegerField("Max number of uses", null=True, blank=True)
+    # Cache policy of the redirect. When not set, `SHORTENER_REDIRECT_*` settings apply (see `shortener.http_cache`).
+    redirect_permanent = models.BooleanField("Redirect permanently", null=True, blank=True)
+    redirect_max_age = models.PositiveIntegerField("Seconds redirect may be cached for", null=True, blank=True)
+
+    objects = URLQuerySet.as_manager()
+
+    class Meta:
+        # Columns the admin changelist can be sorted by, with ties broken by id.
+        indexes = [
+            models.Index(fields=["created", "id"], name="shortener_url_created_idx"),
+            models.Index(fields=["use_count", "id"], name="shortener_url_use_count_idx"),
+            models.Index(fields=["last_accessed", "id"], name="shortener_url_last_access_idx"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        url = super().from_db(db, field_names, values)
+        rest = url.__dict__.get("original_rest")
+        if rest is not None:
+            url.original = expand_original(url.original, url.original_prefix_id, rest, db)
+        return url
+
+    def save(self, *args, **kwargs):
+        self.update_original_hash()
+        self.update_shortcut_key()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "original" in update_fields:
+            compact_originals([self], kwargs.get("using") or router.db_for_write(URL, instance=self))
+            if update_fields is not None:
+                kwargs["update_fields"] = [*update_fields, "original_prefix", "original_rest"]
+        super().save(*args, **kwargs)
+
+    def update_original_hash(self) -> None:
+        """Set hash of the original URL. Has to be called explicitly when saving URLs with `bulk_create`."""
+        self.original_hash = hash_url(self.original)
+
+    def update_shortcut_key(self) -> None:
+        self.shortcut_key = get_shortcut_key(self.shortcut)
+
+    @property
+    def is_custom(self) -> bool:
+        """Whether any of `CUSTOM_FIELDS` is set, which makes the URL unfit for reuse."""
+        return any(getattr(self, name) is not None for name in CUSTOM_FIELDS)
 
     @property
     def shortened_url(self) -> str:
         """Full shortened URL that user can visit to be redirected to the original URL."""
-        path = reverse("resolve-url", args=(self.shortcut,))
-        return urllib.parse.urljoin(settings.SITE_URL, path)
+        prefix, suffix = get_shortened_url_template()
+        return f"{prefix}{self.shortcut}{suffix}"
 
     def __str__(self) -> str:
         return f"{self.shortcut} ({self.original})"
+
+
+class ArchivedURL(models.Model):
+    """URL which hasn't been used for a long time, moved out of the table of URLs (see `shortener.archive`).
+
+    It keeps the id of the URL, so it's restored under the same id once it's used again.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    original = models.URLField("Original URL")
+    shortcut = models.CharField("Shortcut", max_length=constants.MAX_SHORTCUT_LENGTH, unique=True)
+    created = models.DateTimeField("Date of creation")
+    last_accessed = models.DateTimeField("Date of last access", null=True)
+    use_count = models.PositiveIntegerField("Number of uses", default=0)
+    original_hash = models.CharField("Hash of normalized original URL", max_length=64, db_index=True, null=True)
+    expires_at = models.DateTimeField("Date of expiration", null=True)
+    max_uses = models.PositiveIntegerField("Max number of uses", null=True)
+    redirect_permanent = models.BooleanField("Redirect permanently", null=True)
+    redirect_max_age = models.PositiveIntegerField("Seconds redirect may be cached for", null=True)
+    archived = models.DateTimeField("Date of archiving", default=timezone.now)
+
+    def __str__(self) -> str:
+        return f"{self.shortcut} ({self.original})"
+
+
+class ShortcutSequence(models.Model):
+    """Counter of shortcuts of given length that have already been reserved by `shortener.shortcuts.SequenceAllocator`.
+
+    Values are reserved in blocks, so processes hit this table only once per block rather than per shortcut. Every
+    shard of the keyspace has its own counters, so nodes owning different shards never wait for each other.
+    """
+
+    length = models.PositiveSmallIntegerField("Shortcut length")
+    shard = models.PositiveSmallIntegerField("Shard of the keyspace", default=0)
+    next_value = models.BigIntegerField("Next value to reserve", default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["length", "shard"], name="unique_shortcut_sequence"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.length} (shard {self.shard}): {self.next_value}"
+
+
+class ClickBucket(models.Model):
+    """Number of uses of a shortcut in a period of time (an hour or a day), rolled up from the click log."""
+
+    HOUR = "hour"
+    DAY = "day"
+    GRANULARITY_CHOICES = [(HOUR, "Hour"), (DAY, "Day")]
+
+    shortcut = models.CharField("Shortcut", max_length=constants.MAX_SHORTCUT_LENGTH)
+    granularity = models.CharField("Granularity", max_length=4, choices=GRANULARITY_CHOICES)
+    start = models.DateTimeField("Start of the period")
+    count = models.PositiveBigIntegerField("Number of uses", default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["shortcut", "granularity", "start"], name="unique_click_bucket"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.shortcut} {self.granularity} {self.start.isoformat()}: {self.count}"
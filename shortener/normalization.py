@@ -0,0 +1,32 @@
+import hashlib
+import urllib.parse
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """Normalize URL so that different spellings of the same address are equal.
+
+    Scheme and host are lowercased, default port is removed and empty path is replaced with "/". Path, query and
+    fragment are kept as they are, because they may be case-sensitive.
+    """
+    parts = urllib.parse.urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or "").lower()
+    if ":" in netloc:
+        netloc = f"[{netloc}]"
+    if parts.username is not None:
+        userinfo = parts.username if parts.password is None else f"{parts.username}:{parts.password}"
+        netloc = f"{userinfo}@{netloc}"
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{port}"
+    return urllib.parse.urlunsplit((scheme, netloc, parts.path or "/", parts.query, parts.fragment))
+
+
+def hash_url(url: str) -> str:
+    """Get hex digest of the normalized URL, suitable for indexing."""
+    return hashlib.sha256(normalize_url(url).encode()).hexdigest()
@@ -0,0 +1,48 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, QuerySet
+from django.utils.functional import cached_property
+
+
+def estimate_count(model, using: str) -> int:
+    """Estimate number of rows in the table of given model without scanning it.
+
+    PostgreSQL keeps an estimate in its statistics. Elsewhere (or if the table hasn't been analyzed yet), the highest
+    id is used, as ids are never reused, so it's an upper bound which is off only by the number of deleted rows.
+    """
+    connection = connections[using]
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [model._meta.db_table])
+            row = cursor.fetchone()
+        if row is not None and row[0] > 0:
+            return row[0]
+    return model._default_manager.using(using).aggregate(max_id=Max("pk"))["max_id"] or 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator which doesn't count all rows of big tables.
+
+    Rows of the whole table are estimated (see `estimate_count`) once there are at least `max_count` of them. Filtered
+    rows are counted, but no more than `max_count`, so pages past that aren't available.
+
+    Pages are read in two steps: ids of the page first and then its rows. Rows skipped by the offset are then read only
+    from the index the rows are ordered by, rather than from the table.
+    """
+
+    max_count = 10_000
+    object_list: QuerySet
+
+    @cached_property
+    def count(self) -> int:
+        queryset = self.object_list
+        if queryset.query.has_filters():
+            return queryset[: self.max_count].count()
+        estimate = estimate_count(queryset.model, queryset.db)
+        return queryset.count() if estimate < self.max_count else estimate
+
+    def page(self, number):
+        page = super().page(number)
+        ids = list(page.object_list.values_list("pk", flat=True))
+        page.object_list = self.object_list.filter(pk__in=ids)
+        return page
@@ -0,0 +1,205 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from shortener import archive, metrics, routers, snapshot
+from shortener.cache import NOT_FOUND, ResolvedURL, get_url_cache
+from shortener.models import (
+    ORIGINAL_FIELDS,
+    URL,
+    ArchivedURL,
+    aget_by_shortcut,
+    get_by_shortcut,
+    get_shortcuts_filter,
+    get_unkeyed_filter,
+)
+
+# Fields required to build `ResolvedURL`.
+RESOLVED_FIELDS = ("id", *ORIGINAL_FIELDS, "expires_at", "max_uses", "redirect_permanent", "redirect_max_age")
+
+
+def to_resolved_url(url: URL | ArchivedURL) -> ResolvedURL:
+    expires_at = url.expires_at.timestamp() if url.expires_at is not None else None
+    return ResolvedURL(url.id, url.original, expires_at, url.max_uses, url.redirect_permanent, url.redirect_max_age)
+
+
+def get_url(shortcut: str) -> URL:
+    """Read URL like `get_hot_url`. With `SHORTENER_ARCHIVE_ENABLED`, missing URL is restored from the archive.
+
+    Raises `URL.DoesNotExist` if there's no such URL.
+    """
+    try:
+        return get_hot_url(shortcut)
+    except URL.DoesNotExist:
+        if not settings.SHORTENER_ARCHIVE_ENABLED:
+            raise
+        url = archive.restore_url(shortcut)
+        if url is None:
+            raise
+    return url
+
+
+def get_hot_url(shortcut: str) -> URL:
+    """Read URL from a replica. Freshly created URL may not have reached it yet, so misses are checked on the primary.
+
+    Raises `URL.DoesNotExist` if there's no such URL.
+    """
+    try:
+        with routers.replica_reads():
+            return get_by_shortcut(URL.objects.only(*RESOLVED_FIELDS), shortcut)
+    except URL.DoesNotExist:
+        if not routers.get_replicas():
+            raise
+    return get_by_shortcut(URL.objects.using(routers.PRIMARY).only(*RESOLVED_FIELDS), shortcut)
+
+
+def get_urls(shortcuts: list[str]) -> list[URL]:
+    """Read URLs of many shortcuts with a single query, like `get_url` does. Missing shortcuts are skipped.
+
+    Shortcuts not found by keys are looked up by strings with another query.
+    """
+    with routers.replica_reads():
+        urls = list(URL.objects.only("shortcut", *RESOLVED_FIELDS).filter(get_shortcuts_filter(shortcuts)))
+    if routers.get_replicas() and len(urls) < len(shortcuts):
+        primary = URL.objects.using(routers.PRIMARY).only("shortcut", *RESOLVED_FIELDS)
+        urls += primary.filter(get_shortcuts_filter(get_missing(shortcuts, urls)))
+    if len(urls) < len(shortcuts):
+        unkeyed = get_unkeyed_filter(get_missing(shortcuts, urls))
+        if unkeyed is not None:
+            urls += URL.objects.using(routers.PRIMARY).only("shortcut", *RESOLVED_FIELDS).filter(unkeyed)
+    return urls
+
+
+def get_missing(shortcuts: list[str], urls: list[URL]) -> list[str]:
+    found = {url.shortcut for url in urls}
+    return [shortcut for shortcut in shortcuts if shortcut not in found]
+
+
+async def aget_url(shortcut: str) -> URL:
+    """Asynchronous version of `get_url`."""
+    try:
+        return await aget_hot_url(shortcut)
+    except URL.DoesNotExist:
+        if not settings.SHORTENER_ARCHIVE_ENABLED:
+            raise
+        # Restoring is rare and needs a transaction, which the async ORM doesn't support.
+        url = await sync_to_async(archive.restore_url)(shortcut)
+        if url is None:
+            raise
+    return url
+
+
+async def aget_hot_url(shortcut: str) -> URL:
+    """Asynchronous version of `get_hot_url`."""
+    try:
+        with routers.replica_reads():
+            return await aget_by_shortcut(URL.objects.only(*RESOLVED_FIELDS), shortcut)
+    except URL.DoesNotExist:
+        if not routers.get_replicas():
+            raise
+    return await aget_by_shortcut(URL.objects.using(routers.PRIMARY).only(*RESOLVED_FIELDS), shortcut)
+
+
+def resolve_shortcut(shortcut: str) -> ResolvedURL | None:
+    """Find URL data by shortcut. Use cache if possible and store the result of the lookup in it.
+
+    Returns `None` if shortcut doesn't exist. Non-existing shortcuts are cached too, so that repeated requests for
+    unknown shortcuts don't hit the database either. Expired URLs are returned as well, use `counters.record_use` to
+    check whether they can still be used.
+
+    With `SHORTENER_REDIRECT_SNAPSHOT`, shortcut is looked up in the snapshot first. Shortcuts missing in it are looked
+    up as usual only with `SHORTENER_REDIRECT_SNAPSHOT_FALLBACK`.
+    """
+    snapshot_resolver = snapshot.get_snapshot_resolver()
+    if snapshot_resolver is not None:
+        resolved = snapshot_resolver.get(shortcut)
+        if resolved is not None or not settings.SHORTENER_REDIRECT_SNAPSHOT_FALLBACK:
+            return resolved
+
+    url_cache = get_url_cache()
+    cached = url_cache.get(shortcut)
+    if cached is not None:
+        metrics.URL_CACHE_LOOKUPS.inc("hit")
+        return None if cached == NOT_FOUND else cached  # type: ignore[return-value]
+    metrics.URL_CACHE_LOOKUPS.inc("miss")
+
+    try:
+        url = get_url(shortcut)
+    except URL.DoesNotExist:
+        url_cache.set(shortcut, NOT_FOUND)
+        return None
+
+    resolved = to_resolved_url(url)
+    url_cache.set(shortcut, resolved)
+    return resolved
+
+
+async def aresolve_shortcut(shortcut: str) -> ResolvedURL | None:
+    """Asynchronous version of `resolve_shortcut`."""
+    # Snapshot lookup doesn't wait for any I/O other than page faults, so it's done in place.
+    snapshot_resolver = snapshot.get_snapshot_resolver()
+    if snapshot_resolver is not None:
+        resolved = snapshot_resolver.get(shortcut)
+        if resolved is not None or not settings.SHORTENER_REDIRECT_SNAPSHOT_FALLBACK:
+            return resolved
+
+    url_cache = get_url_cache()
+    cached = await url_cache.aget(shortcut)
+    if cached is not None:
+        metrics.URL_CACHE_LOOKUPS.inc("hit")
+        return None if cached == NOT_FOUND else cached  # type: ignore[return-value]
+    metrics.URL_CACHE_LOOKUPS.inc("miss")
+
+    try:
+        url = await aget_url(shortcut)
+    except URL.DoesNotExist:
+        await url_cache.aset(shortcut, NOT_FOUND)
+        return None
+
+    resolved = to_resolved_url(url)
+    await url_cache.aset(shortcut, resolved)
+    return resolved
+
+
+def resolve_shortcuts(shortcuts: list[str], restore: bool = False) -> dict[str, ResolvedURL | None]:
+    """Find URL data of many shortcuts at once, e.g. for link audits. Missing shortcuts are mapped to `None`.
+
+    Shortcuts are looked up in the snapshot and the cache like by `resolve_shortcut`, and the rest is read with a
+    single query. Results aren't stored in the cache, so that a big batch doesn't evict entries of popular shortcuts.
+
+    With `SHORTENER_ARCHIVE_ENABLED`, shortcuts missing in the table are read from the archive, and restored only with
+    `restore` (i.e. when they're going to be used), so that audits of old links don't move them all back.
+    """
+    resolved: dict[str, ResolvedURL | None] = {}
+    missing = []
+    snapshot_resolver = snapshot.get_snapshot_resolver()
+    url_cache = get_url_cache()
+    for shortcut in shortcuts:
+        if shortcut in resolved:
+            continue
+        if snapshot_resolver is not None:
+            url = snapshot_resolver.get(shortcut)
+            if url is not None or not settings.SHORTENER_REDIRECT_SNAPSHOT_FALLBACK:
+                resolved[shortcut] = url
+                continue
+        cached = url_cache.get(shortcut)
+        if cached is None:
+            missing.append(shortcut)
+        resolved[shortcut] = None if cached is None or cached == NOT_FOUND else cached  # type: ignore[assignment]
+    if missing:
+        for found in get_urls(missing):
+            resolved[found.shortcut] = to_resolved_url(found)
+    if missing and settings.SHORTENER_ARCHIVE_ENABLED:
+        resolved.update(resolve_archived([shortcut for shortcut in missing if resolved[shortcut] is None], restore))
+    return resolved
+
+
+def resolve_archived(shortcuts: list[str], restore: bool) -> dict[str, ResolvedURL]:
+    """Find URL data of archived shortcuts, restoring the URLs with `restore`. Missing shortcuts are skipped."""
+    if not restore:
+        return {url.shortcut: to_resolved_url(url) for url in archive.get_archived_urls(shortcuts)}
+    resolved = {}
+    for shortcut in shortcuts:
+        url = archive.restore_url(shortcut)
+        if url is not None:
+            resolved[shortcut] = to_resolved_url(url)
+    return resolved
@@ -0,0 +1,53 @@
+"""Routing of reads to database replicas.
+
+Only reads explicitly wrapped in `replica_reads` (resolving shortcuts and retrieving URL details) are sent to replicas,
+everything else, including reads that precede writes (e.g. shortcut allocation), goes to the primary database.
+Replicas may lag behind, so callers which can't tolerate a missing row should retry on the primary (see
+`shortener.resolvers`).
+"""
+import contextlib
+import contextvars
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PRIMARY = DEFAULT_DB_ALIAS
+
+_replica_reads: contextvars.ContextVar[bool] = contextvars.ContextVar("shortener_replica_reads", default=False)
+
+
+def get_replicas() -> list[str]:
+    """Get aliases of the replica databases."""
+    return settings.SHORTENER_DATABASE_REPLICAS
+
+
+@contextlib.contextmanager
+def replica_reads():
+    """Send reads made within the block to a replica, if there is any."""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """Database router sending reads made within `replica_reads` to a random replica and all the rest to the primary."""
+
+    def db_for_read(self, model, **hints) -> str | None:
+        replicas = get_replicas()
+        # Reads within a transaction on the primary have to see its uncommitted writes.
+        if not replicas or not _replica_reads.get() or connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints) -> str:
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints) -> bool:
+        # Replicas contain the same data as the primary.
+        return True
+
+    def allow_migrate(self, db: str, app_label: str, model_name: str | None = None, **hints) -> bool:
+        return db not in get_replicas()
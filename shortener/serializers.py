@@ -1,24 +1,318 @@
+import copy
+import datetime
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 from rest_framework import serializers
-from rest_framework.exceptions import APIException
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.settings import api_settings
 
-from shortener import shortcuts
-from shortener.models import URL
+from shortener import analytics, archive, constants, shortcuts
+from shortener.cache import get_url_cache
+from shortener.models import CUSTOM_FIELDS, URL, ArchivedURL, ClickBucket
+from shortener.normalization import hash_url
 
+# Number of attempts to insert URL with a newly generated shortcut, in case it already exists in the database. Every
+# attempt draws an unrelated shortcut, so running out of them means that the keyspace is nearly full.
+CREATE_ATTEMPTS = 10
+# Max number of hashes looked up with a single query when reusing existing shortcuts.
+HASH_LOOKUP_BATCH_SIZE = 500
 
-class URLSerializer(serializers.ModelSerializer):
-    """Serializer for `shortener.models.URL`."""
+_datetime_field = serializers.DateTimeField()
 
-    url = serializers.URLField(source="original")
+
+def format_datetime(value: datetime.datetime | None) -> str | None:
+    """Format date the same way as `DateTimeField` of a serializer does, respecting DRF settings."""
+    return None if value is None else _datetime_field.to_representation(value)
+
+
+def get_not_custom_lookup() -> dict:
+    return {f"{name}__isnull": True for name in CUSTOM_FIELDS}
+
+
+def get_existing_urls(original_hashes) -> dict[str, URL]:
+    """Find URLs by hashes of their originals. If there are many URLs with the same original, the oldest is used.
+
+    URLs which expire or have their own redirect policy (see `CUSTOM_FIELDS`) are never reused. With the archive
+    enabled, archived URLs are reused too, once they're restored.
+    """
+    original_hashes = list(original_hashes)
+    existing: dict[str, URL] = {}
+    for start in range(0, len(original_hashes), HASH_LOOKUP_BATCH_SIZE):
+        batch = original_hashes[start : start + HASH_LOOKUP_BATCH_SIZE]
+        urls = URL.objects.filter(original_hash__in=batch, **get_not_custom_lookup())
+        for url in urls.order_by("-id"):
+            existing[url.original_hash] = url  # type: ignore[index]
+        if settings.SHORTENER_ARCHIVE_ENABLED:
+            existing.update(
+                get_archived_urls([original_hash for original_hash in batch if original_hash not in existing])
+            )
+    return existing
+
+
+def get_archived_urls(original_hashes: list[str]) -> dict[str, URL]:
+    """Find archived URLs by hashes of their originals and restore them."""
+    archived: dict[str, str] = {}
+    urls = ArchivedURL.objects.filter(original_hash__in=original_hashes, **get_not_custom_lookup())
+    for original_hash, shortcut in urls.order_by("-id").values_list("original_hash", "shortcut"):
+        archived[original_hash] = shortcut  # type: ignore[index]
+    restored = {original_hash: archive.restore_url(shortcut) for original_hash, shortcut in archived.items()}
+    return {original_hash: url for original_hash, url in restored.items() if url is not None}
+
+
+class BulkURLSerializer(serializers.ListSerializer):
+    """Serializer for creating many `shortener.models.URL` instances at once.
+
+    Unlike regular `ListSerializer`, invalid items don't make the whole list invalid. They are skipped and their
+    errors are returned in place of the serialized URL. Shortcuts for all valid items are allocated in one pass and
+    URLs are inserted with `bulk_create` in batches of `constants.BULK_CREATE_BATCH_SIZE`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("max_length", constants.MAX_BULK_CREATE_SIZE)
+        kwargs.setdefault("allow_empty", False)
+        super().__init__(*args, **kwargs)
+        self.item_errors: dict[int, dict] = {}
+        self.valid_indexes: list[int] = []
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            message = self.error_messages["not_a_list"].format(input_type=type(data).__name__)
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [message]}, code="not_a_list")
+        if not self.allow_empty and len(data) == 0:
+            message = self.error_messages["empty"]
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [message]}, code="empty")
+        if self.max_length is not None and len(data) > self.max_length:
+            message = self.error_messages["max_length"].format(max_length=self.max_length)
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [message]}, code="max_length")
+
+        self.item_errors, self.valid_indexes = {}, []
+        validated = []
+        for index, item in enumerate(data):
+            try:
+                validated.append(self.child.run_validation(item))
+            except ValidationError as exc:
+                self.item_errors[index] = exc.detail
+            else:
+                self.valid_indexes.append(index)
+        return validated
 
     def create(self, validated_data):
-        """Generate "shortcut" before creating the URL instance."""
+        """Create URLs for all valid items.
+
+        With `SHORTENER_REUSE_EXISTING_SHORTCUTS` enabled, URLs with known originals (either already in the database or
+        repeated in the request) are reused instead, unless they expire or have their own redirect policy.
+        """
+        urls = []
+        for attrs in validated_data:
+            url = URL(**attrs)
+            url.update_original_hash()
+            urls.append(url)
+
+        new_urls = urls
+        if settings.SHORTENER_REUSE_EXISTING_SHORTCUTS:
+            known = get_existing_urls({url.original_hash for url in urls})
+            new_urls = []
+            for index, url in enumerate(urls):
+                if url.is_custom:
+                    new_urls.append(url)
+                elif url.original_hash in known:
+                    urls[index] = known[url.original_hash]  # type: ignore[index]
+                else:
+                    known[url.original_hash] = url  # type: ignore[index]
+                    new_urls.append(url)
+
         try:
-            validated_data["shortcut"] = shortcuts.get_shortcut()
+            allocated = shortcuts.get_shortcuts(len(new_urls))
         except shortcuts.GenerationError as e:
             raise APIException(str(e))
-        return super().create(validated_data)
+        for url, shortcut in zip(new_urls, allocated):
+            url.shortcut = shortcut
+
+        for start in range(0, len(new_urls), constants.BULK_CREATE_BATCH_SIZE):
+            self._insert_batch(new_urls[start : start + constants.BULK_CREATE_BATCH_SIZE])
+        # bulk_create doesn't send post_save signal, so shortcuts which have been cached as unknown must be dropped.
+        get_url_cache().delete_many(url.shortcut for url in new_urls)
+        return urls
+
+    def _insert_batch(self, urls: list[URL]) -> None:
+        """Insert batch of URLs, replacing shortcuts which are taken already.
+
+        Shortcuts are checked with a single query before the insert and only the taken ones are drawn again, until all
+        of them are free. If some get taken in the meantime, the check and the insert are repeated. Running out of
+        `CREATE_ATTEMPTS` is reported as an API error.
+        """
+        unchecked = urls
+        for _ in range(CREATE_ATTEMPTS):
+            taken = shortcuts.get_existing_shortcuts(url.shortcut for url in unchecked)
+            if taken:
+                unchecked = [url for url in unchecked if url.shortcut in taken]
+                self._replace_shortcuts(unchecked)
+                continue
+            try:
+                with transaction.atomic():
+                    URL.objects.bulk_create(urls)
+                    return
+            except IntegrityError:
+                # Compared as strings, as URLs created by older processes may have no keys of shortcuts yet.
+                taken = set(
+                    URL.objects.filter(shortcut__in=[url.shortcut for url in urls]).values_list("shortcut", flat=True)
+                )
+                if not taken:
+                    raise
+                unchecked = [url for url in urls if url.shortcut in taken]
+                self._replace_shortcuts(unchecked)
+        raise APIException("Couldn't find free shortcuts, try again later.")
+
+    @staticmethod
+    def _replace_shortcuts(urls: list[URL]) -> None:
+        try:
+            new_shortcuts = shortcuts.get_shortcuts(len(urls))
+        except shortcuts.GenerationError as e:
+            raise APIException(str(e))
+        for url, shortcut in zip(urls, new_shortcuts):
+            url.shortcut = shortcut
+
+    def to_representation(self, data):
+        """Serialize created URLs, putting errors of invalid items at their original positions."""
+        representation = super().to_representation(data)
+        if not self.item_errors:
+            return representation
+
+        results: list = [None] * (len(self.valid_indexes) + len(self.item_errors))
+        for index, item in zip(self.valid_indexes, representation):
+            results[index] = item
+        for index, errors in self.item_errors.items():
+            results[index] = {"errors": errors}
+        return results
+
+
+class URLSerializer(serializers.ModelSerializer):
+    """Serializer for `shortener.models.URL`."""
+
+    url = serializers.URLField(source="original")
+    max_uses = serializers.IntegerField(min_value=1, required=False, allow_null=True)
+    redirect_max_age = serializers.IntegerField(min_value=0, required=False, allow_null=True)
+
+    _field_prototypes: dict[str, serializers.Field]
+
+    def get_fields(self):
+        """Build fields from the model once per class and return copies of them.
+
+        Introspection of the model done by `ModelSerializer` takes most of the time of validating a URL.
+        """
+        cls = type(self)
+        if "_field_prototypes" not in cls.__dict__:
+            cls._field_prototypes = super().get_fields()
+        return copy.deepcopy(cls._field_prototypes)
+
+    def validate_expires_at(self, value):
+        if value is not None and value <= timezone.now():
+            raise ValidationError("Must be in the future.")
+        return value
+
+    def create(self, validated_data):
+        """Generate "shortcut" before creating the URL instance.
+
+        Allocated shortcut may still collide with an existing one (e.g. generated earlier by another allocator), so
+        new shortcuts are drawn until the insert doesn't violate uniqueness of the shortcut, up to `CREATE_ATTEMPTS`
+        times. Running out of attempts is reported as an API error.
+
+        With `SHORTENER_REUSE_EXISTING_SHORTCUTS` enabled, existing URL with the same (normalized) original is returned
+        instead of creating a new one. URLs which expire or have their own redirect policy are neither reused nor
+        returned for reuse.
+        """
+        custom = any(validated_data.get(name) is not None for name in CUSTOM_FIELDS)
+        if settings.SHORTENER_REUSE_EXISTING_SHORTCUTS and not custom:
+            existing = get_existing_urls([hash_url(validated_data["original"])])
+            if existing:
+                return next(iter(existing.values()))
+
+        attempt = 1
+        while True:
+            try:
+                validated_data["shortcut"] = shortcuts.get_shortcut()
+            except shortcuts.GenerationError as e:
+                raise APIException(str(e))
+
+            try:
+                with transaction.atomic():
+                    return super().create(validated_data)
+            except IntegrityError:
+                # Compared as a string, as URLs created by older processes may have no keys of shortcuts yet.
+                if not URL.objects.filter(shortcut=validated_data["shortcut"]).exists():
+                    raise
+                if attempt >= CREATE_ATTEMPTS:
+                    raise APIException("Couldn't find a free shortcut, try again later.")
+                attempt += 1
+
+    def to_representation(self, instance: URL) -> dict:
+        """Serialize URL without going through serializer fields.
+
+        The output is the same as the one built from `Meta.fields`, but it's several times cheaper, as no fields have
+        to be built and no attributes looked up dynamically. Keys have to be kept in sync with `Meta.fields`.
+        """
+        return {
+            "url": instance.original,
+            "expires_at": format_datetime(instance.expires_at),
+            "max_uses": instance.max_uses,
+            "redirect_permanent": instance.redirect_permanent,
+            "redirect_max_age": instance.redirect_max_age,
+            "shortcut": instance.shortcut,
+            "created": format_datetime(instance.created),
+            "last_accessed": format_datetime(instance.last_accessed),
+            "use_count": instance.use_count,
+            "shortened_url": instance.shortened_url,
+        }
 
     class Meta:
         model = URL
         read_only_fields = ["shortcut", "created", "last_accessed", "use_count", "shortened_url"]
-        fields = ["url", *read_only_fields]
+        fields = ["url", "expires_at", "max_uses", "redirect_permanent", "redirect_max_age", *read_only_fields]
+        list_serializer_class = BulkURLSerializer
+
+
+class ShortcutListField(serializers.ListField):
+    """List of shortcuts. Items are checked in a single pass instead of running a child field for each of them, which
+    is several times faster for long lists. Errors are reported per item, the same way.
+    """
+
+    child = serializers.CharField(max_length=constants.MAX_SHORTCUT_LENGTH)
+
+    def run_child_validation(self, data) -> list[str]:
+        errors: dict = {
+            index: [f"Must be a string of at most {constants.MAX_SHORTCUT_LENGTH} characters."]
+            for index, item in enumerate(data)
+            if not isinstance(item, str) or not 0 < len(item) <= constants.MAX_SHORTCUT_LENGTH
+        }
+        if errors:
+            raise ValidationError(errors)
+        return list(data)
+
+
+class BatchResolveSerializer(serializers.Serializer):
+    """Shortcuts to resolve at once. Uses are counted only with `record_use`, so that audits don't skew usage data."""
+
+    shortcuts = ShortcutListField(allow_empty=False, max_length=constants.MAX_BATCH_RESOLVE_SIZE)
+    record_use = serializers.BooleanField(default=False)
+
+
+class ClickStatsQuerySerializer(serializers.Serializer):
+    """Query parameters of the click stats endpoint. Buckets which start in [since, until) are returned."""
+
+    granularity = serializers.ChoiceField(choices=ClickBucket.GRANULARITY_CHOICES, default=ClickBucket.HOUR)
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs: dict) -> dict:
+        if "since" not in attrs:
+            attrs["since"] = analytics.default_since(attrs["granularity"])
+        if attrs.get("until") is not None and attrs["until"] <= attrs["since"]:
+            raise ValidationError({"until": "Must be later than since."})
+        return attrs
+
+
+class ClickBucketSerializer(serializers.Serializer):
+    start = serializers.DateTimeField()
+    count = serializers.IntegerField()
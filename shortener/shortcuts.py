@@ -1,11 +1,37 @@
+import hashlib
 import random
-import string
+import threading
+import time
 
-from shortener import constants
-from shortener.models import URL
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Length
+from django.dispatch import receiver
 
-CHARSET = string.ascii_letters + string.digits
+from shortener import archive, constants, metrics
+from shortener.models import (
+    URL,
+    ShortcutSequence,
+    get_shortcut_lookup,
+    get_shortcuts_filter,
+)
+
+CHARSET = constants.SHORTCUT_CHARSET
 SAME_LENGTH_ATTEMPTS = 10
+# Max number of shortcuts checked for existence with a single query.
+EXISTS_BATCH_SIZE = 500
+
+RANDOM_ALLOCATOR = "random"
+SEQUENCE_ALLOCATOR = "sequence"
+ALLOCATORS = (RANDOM_ALLOCATOR, SEQUENCE_ALLOCATOR)
+
+# Key of the permutation which makes sequential shortcuts look random. Changing it makes already handed out shortcuts
+# collide with new ones, so it should never be changed once shortcuts are generated with it.
+PERMUTATION_KEY = b"drf-url-shortener"
+PERMUTATION_ROUNDS = 4
 
 
 class GenerationError(Exception):
@@ -17,10 +43,58 @@ def get_random_slug(length: int) -> str:
     return "".join(random.SystemRandom().choice(CHARSET) for _ in range(length))
 
 
-def get_shortcut() -> str:
+def get_node_shard() -> tuple[int, int]:
+    """Get shard of the keyspace owned by this node and the number of shards."""
+    shard, shard_count = settings.SHORTENER_SHARD, settings.SHORTENER_SHARD_COUNT
+    if shard_count < 1 or not 0 <= shard < shard_count:
+        raise ImproperlyConfigured("SHORTENER_SHARD must be between 0 and SHORTENER_SHARD_COUNT - 1.")
+    return shard, shard_count
+
+
+def get_shard_keyspace_size(length: int, shard: int, shard_count: int) -> int:
+    """Get number of shortcuts of given length in the shard."""
+    return (get_keyspace_size(length) - shard + shard_count - 1) // shard_count
+
+
+def get_shard_shortcut(index: int, length: int, shard: int, shard_count: int) -> str:
+    """Get `index`-th shortcut of given length from the shard.
+
+    Shard owns every `shard_count`-th value of the keyspace, counting from `shard`, before the values are permuted.
+    With a single shard, it's the same shortcut as the one `SequenceAllocator` hands out for `index`.
+    """
+    return encode(permute(index * shard_count + shard, length), length)
+
+
+def get_shard(shortcut: str, shard_count: int) -> int | None:
+    """Get shard of the keyspace which given shortcut belongs to, out of `shard_count` shards.
+
+    It depends on the shortcut only, so lookups can be routed to the shard without any queries. Shortcuts created
+    before the keyspace was sharded (or with another number of shards) map onto arbitrary shards. Returns `None` for
+    shortcuts which couldn't have been generated (e.g. imported ones with `-` or `_`), which belong to no shard.
+    """
+    if not constants.MIN_SHORTCUT_LENGTH <= len(shortcut) <= constants.MAX_SHORTCUT_LENGTH or any(
+        char not in CHARSET for char in shortcut
+    ):
+        return None
+    return unpermute(decode(shortcut), len(shortcut)) % shard_count
+
+
+def get_random_candidate(length: int) -> str:
+    """Get random shortcut of given length from the shard of the keyspace owned by this node.
+
+    Nodes never draw the same candidates, so they don't compete for the same shortcuts.
+    """
+    shard, shard_count = get_node_shard()
+    if shard_count == 1:
+        return get_random_slug(length)
+    index = random.SystemRandom().randrange(get_shard_keyspace_size(length, shard, shard_count))
+    return get_shard_shortcut(index, length, shard, shard_count)
+
+
+def get_random_shortcut(start_length: int = constants.MIN_SHORTCUT_LENGTH) -> str:
     """Generate unique and non-existing string that can be used as a URL shortcut.
 
-    Shortcut generation algorithm tries to find a shortcut with given length in 10 attempts.
+    Shortcut generation algorithm tries to find a shortcut with given length (`start_length` at first) in 10 attempts.
     If all attempts for this particular length fail, then it means that there are already probably a lot of
     shortcuts with such length (because otherwise it's nearly impossible to generate 10 strings in a row that already
     exists). In such case, we can try 10 times to generate 1-char longer shortcut again.
@@ -33,19 +107,344 @@ def get_shortcut() -> str:
     we simply throw GenerationError and user should try again. However, this is so unlikely to happen, that it's we
     don't have to handle this case.
     """
-    shortcut_length = constants.MIN_SHORTCUT_LENGTH
-    shortcut = get_random_slug(shortcut_length)
+    shortcut_length = start_length
+    shortcut = get_random_candidate(shortcut_length)
     attempt = 1
-    while URL.objects.filter(shortcut=shortcut).exists() or shortcut in constants.DISALLOWED_SHORTCUTS:
+    total_attempts = 1
+    while shortcut_exists(shortcut) or shortcut in constants.DISALLOWED_SHORTCUTS:
         if attempt >= SAME_LENGTH_ATTEMPTS:
             shortcut_length += 1
             attempt = 1
+            metrics.SHORTCUT_LENGTH_ESCALATIONS.inc(str(shortcut_length))
         else:
             attempt += 1
 
         if shortcut_length > constants.MAX_SHORTCUT_LENGTH:
+            metrics.SHORTCUT_ATTEMPTS.observe(total_attempts)
             raise GenerationError("Failed to found unique shortcut. Try again.")
 
-        shortcut = get_random_slug(shortcut_length)
+        shortcut = get_random_candidate(shortcut_length)
+        total_attempts += 1
 
+    metrics.SHORTCUT_ATTEMPTS.observe(total_attempts)
     return shortcut
+
+
+def get_random_shortcuts(count: int, start_length: int = constants.MIN_SHORTCUT_LENGTH) -> list[str]:
+    """Generate `count` unique and non-existing shortcuts with as few queries as possible.
+
+    It works like `get_random_shortcut`, but all candidates are checked with a single query (or one query per
+    `EXISTS_BATCH_SIZE` candidates). Only the candidates which turned out to be taken are generated again, so every
+    shortcut is recorded with the number of rounds it took to find it.
+    """
+    found: list[str] = []
+    shortcut_length = start_length
+    attempt = 1
+    total_attempts = 1
+    while len(found) < count:
+        candidates = {get_random_candidate(shortcut_length) for _ in range(count - len(found))}
+        candidates -= {*found, *constants.DISALLOWED_SHORTCUTS}
+        taken = get_existing_shortcuts(candidates)
+        free = candidates - taken
+        found.extend(free)
+        for _ in free:
+            metrics.SHORTCUT_ATTEMPTS.observe(total_attempts)
+
+        if taken:
+            if attempt >= SAME_LENGTH_ATTEMPTS:
+                shortcut_length += 1
+                attempt = 1
+                metrics.SHORTCUT_LENGTH_ESCALATIONS.inc(str(shortcut_length))
+            else:
+                attempt += 1
+
+            if shortcut_length > constants.MAX_SHORTCUT_LENGTH:
+                for _ in range(count - len(found)):
+                    metrics.SHORTCUT_ATTEMPTS.observe(total_attempts)
+                raise GenerationError("Failed to found unique shortcuts. Try again.")
+        total_attempts += 1
+
+    return found
+
+
+def shortcut_exists(shortcut: str) -> bool:
+    """Check whether shortcut already exists in the database, in the archive too if it's enabled."""
+    if URL.objects.filter(**get_shortcut_lookup(shortcut)).exists():
+        return True
+    return settings.SHORTENER_ARCHIVE_ENABLED and bool(archive.get_archived_shortcuts([shortcut]))
+
+
+def get_existing_shortcuts(shortcuts) -> set[str]:
+    """Get subset of given shortcuts which already exist in the database, in the archive too if it's enabled."""
+    shortcuts = list(shortcuts)
+    existing: set[str] = set()
+    for start in range(0, len(shortcuts), EXISTS_BATCH_SIZE):
+        batch = shortcuts[start : start + EXISTS_BATCH_SIZE]
+        existing.update(URL.objects.filter(get_shortcuts_filter(batch)).values_list("shortcut", flat=True))
+        if settings.SHORTENER_ARCHIVE_ENABLED:
+            existing.update(archive.get_archived_shortcuts(set(batch) - existing))
+    return existing
+
+
+def count_shortcuts_by_length() -> dict[int, int]:
+    """Count existing shortcuts of every length. It scans the whole table, so it shouldn't be run too often."""
+    rows = URL.objects.values(length=Length("shortcut")).annotate(count=Count("id")).order_by()
+    return {row["length"]: row["count"] for row in rows}
+
+
+def get_keyspace_size(length: int) -> int:
+    return len(CHARSET) ** length
+
+
+class KeyspaceOccupancy:
+    """Share of used shortcuts of every length, used to choose the length `get_random_shortcut` starts at.
+
+    Random shortcut of a length with occupancy `p` already exists with probability `p`, so starting at the shortest
+    length with occupancy below `max_occupancy` keeps the expected number of existence checks per shortcut below
+    `1 / (1 - max_occupancy)`. Counts are read from the database at most once per `ttl` seconds and updated in memory
+    with every generated shortcut in the meantime.
+    """
+
+    def __init__(self, ttl: float, max_occupancy: float):
+        self.ttl = ttl
+        self.max_occupancy = max_occupancy
+        self._counts: dict[int, int] = {}
+        self._refreshed_at: float | None = None
+        self._lock = threading.Lock()
+
+    def refresh(self) -> None:
+        counts = count_shortcuts_by_length()
+        with self._lock:
+            self._counts = counts
+            self._refreshed_at = time.monotonic()
+
+    def _refresh_if_stale(self) -> None:
+        if self._refreshed_at is None or time.monotonic() - self._refreshed_at >= self.ttl:
+            self.refresh()
+
+    def get_occupancy(self, length: int) -> float:
+        self._refresh_if_stale()
+        with self._lock:
+            return self._counts.get(length, 0) / get_keyspace_size(length)
+
+    def get_start_length(self) -> int:
+        """Get the shortest length with occupancy below the target, or the longest length if all are crowded."""
+        for length in range(constants.MIN_SHORTCUT_LENGTH, constants.MAX_SHORTCUT_LENGTH):
+            if self.get_occupancy(length) < self.max_occupancy:
+                return length
+        return constants.MAX_SHORTCUT_LENGTH
+
+    def record(self, shortcuts, start_length: int) -> None:
+        """Count generated shortcuts.
+
+        Shortcuts longer than `start_length` mean that generator had to move on, because shorter ones are more crowded
+        than the counts say. They are treated as full until the next refresh, so that next shortcuts don't waste
+        queries on them.
+        """
+        with self._lock:
+            for shortcut in shortcuts:
+                length = len(shortcut)
+                self._counts[length] = self._counts.get(length, 0) + 1
+                for crowded in range(start_length, length):
+                    self._counts[crowded] = max(self._counts.get(crowded, 0), get_keyspace_size(crowded))
+
+
+_keyspace_occupancy: KeyspaceOccupancy | None = None
+_keyspace_occupancy_lock = threading.Lock()
+
+
+def get_keyspace_occupancy() -> KeyspaceOccupancy:
+    """Get process-wide keyspace occupancy."""
+    global _keyspace_occupancy
+    if _keyspace_occupancy is None:
+        with _keyspace_occupancy_lock:
+            if _keyspace_occupancy is None:
+                _keyspace_occupancy = KeyspaceOccupancy(
+                    settings.SHORTENER_KEYSPACE_STATS_TTL, settings.SHORTENER_SHORTCUT_MAX_OCCUPANCY
+                )
+    return _keyspace_occupancy
+
+
+def encode(value: int, length: int) -> str:
+    """Encode non-negative integer as a base62 string over `CHARSET`, left-padded to given length."""
+    chars = []
+    for _ in range(length):
+        value, remainder = divmod(value, len(CHARSET))
+        chars.append(CHARSET[remainder])
+    if value:
+        raise ValueError(f"Value doesn't fit in {length} characters.")
+    return "".join(reversed(chars))
+
+
+def decode(shortcut: str) -> int:
+    """Decode base62 string over `CHARSET` into an integer. Reverse of `encode`."""
+    value = 0
+    for char in shortcut:
+        value = value * len(CHARSET) + CHARSET.index(char)
+    return value
+
+
+def _feistel_round(value: int, round_index: int, length: int, half_bits: int) -> int:
+    data = value.to_bytes(8, "big") + bytes([round_index, length])
+    digest = hashlib.blake2b(data, key=PERMUTATION_KEY, digest_size=8).digest()
+    return int.from_bytes(digest, "big") & ((1 << half_bits) - 1)
+
+
+def _feistel(value: int, length: int, half_bits: int, rounds) -> int:
+    mask = (1 << half_bits) - 1
+    left, right = value >> half_bits, value & mask
+    for round_index in rounds:
+        left, right = right, left ^ _feistel_round(right, round_index, length, half_bits)
+    return (right << half_bits) | left
+
+
+def permute(value: int, length: int) -> int:
+    """Map value from the keyspace of shortcuts of given length onto another value from the same keyspace.
+
+    It's a bijection, so unique values are mapped onto unique values, but consecutive values are spread randomly
+    over the whole keyspace. It's a Feistel network over 6 bits per character (62 ** length < 2 ** (6 * length)),
+    restricted to the keyspace with cycle walking.
+    """
+    keyspace = get_keyspace_size(length)
+    half_bits = 3 * length
+    value = _feistel(value, length, half_bits, range(PERMUTATION_ROUNDS))
+    while value >= keyspace:
+        value = _feistel(value, length, half_bits, range(PERMUTATION_ROUNDS))
+    return value
+
+
+def unpermute(value: int, length: int) -> int:
+    """Reverse of `permute`. Feistel network is reversed simply by running its rounds in reversed order."""
+    keyspace = get_keyspace_size(length)
+    half_bits = 3 * length
+    value = _feistel(value, length, half_bits, reversed(range(PERMUTATION_ROUNDS)))
+    while value >= keyspace:
+        value = _feistel(value, length, half_bits, reversed(range(PERMUTATION_ROUNDS)))
+    return value
+
+
+class SequenceAllocator:
+    """Hand out unique shortcuts without checking in the database whether they already exist.
+
+    Each shortcut length has its own counter stored in `ShortcutSequence`. Process reserves a block of `block_size`
+    values with a single query and hands them out from memory. Values are permuted (see `permute`) and encoded in
+    base62, so shortcuts still look random. Once the keyspace of given length is exhausted, allocator moves to longer
+    shortcuts.
+
+    Uniqueness is guaranteed between shortcuts generated by this allocator only. Shortcuts generated in other ways
+    (e.g. by `get_random_shortcut`) may still collide, which should be handled by retrying the insert.
+
+    Allocator hands out shortcuts from given shard of the keyspace only (see `get_shard_shortcut`), counting them
+    separately from other shards.
+    """
+
+    def __init__(self, block_size: int, shard: int = 0, shard_count: int = 1):
+        self.block_size = block_size
+        self.shard = shard
+        self.shard_count = shard_count
+        self._length = constants.MIN_SHORTCUT_LENGTH
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def allocate(self, count: int = 1) -> list[str]:
+        """Get `count` unique shortcuts."""
+        shortcuts: list[str] = []
+        with self._lock:
+            while len(shortcuts) < count:
+                if self._next >= self._end:
+                    self._reserve_block(max(self.block_size, count - len(shortcuts)))
+                shortcut = get_shard_shortcut(self._next, self._length, self.shard, self.shard_count)
+                self._next += 1
+                if shortcut not in constants.DISALLOWED_SHORTCUTS:
+                    shortcuts.append(shortcut)
+        return shortcuts
+
+    def _reserve_block(self, size: int) -> None:
+        while self._length <= constants.MAX_SHORTCUT_LENGTH:
+            keyspace = get_shard_keyspace_size(self._length, self.shard, self.shard_count)
+            sequence = ShortcutSequence.objects.filter(length=self._length, shard=self.shard)
+            with transaction.atomic():
+                ShortcutSequence.objects.get_or_create(length=self._length, shard=self.shard)
+                # Counter is incremented before it's read, so that the row (or the whole database in case of sqlite3)
+                # is locked for writing and no other process can read the same value in the meantime.
+                reserved = sequence.filter(next_value__lt=keyspace).update(next_value=F("next_value") + size)
+                if reserved:
+                    end = sequence.values_list("next_value", flat=True).get()
+                    self._next = end - size
+                    self._end = min(end, keyspace)
+                    return
+            self._length += 1
+            metrics.SHORTCUT_LENGTH_ESCALATIONS.inc(str(self._length))
+        raise GenerationError("All shortcuts have already been used.")
+
+
+_sequence_allocator: SequenceAllocator | None = None
+_sequence_allocator_lock = threading.Lock()
+
+
+def get_sequence_allocator() -> SequenceAllocator:
+    """Get process-wide sequence allocator."""
+    global _sequence_allocator
+    if _sequence_allocator is None:
+        with _sequence_allocator_lock:
+            if _sequence_allocator is None:
+                shard, shard_count = get_node_shard()
+                _sequence_allocator = SequenceAllocator(settings.SHORTENER_SHORTCUT_BLOCK_SIZE, shard, shard_count)
+    return _sequence_allocator
+
+
+@receiver(setting_changed)
+def reset_sequence_allocator(setting: str, **kwargs) -> None:
+    global _sequence_allocator
+    if setting in ("SHORTENER_SHORTCUT_BLOCK_SIZE", "SHORTENER_SHARD", "SHORTENER_SHARD_COUNT"):
+        _sequence_allocator = None
+
+
+@receiver(setting_changed)
+def reset_keyspace_occupancy(setting: str, **kwargs) -> None:
+    global _keyspace_occupancy
+    if setting in ("SHORTENER_KEYSPACE_STATS_TTL", "SHORTENER_SHORTCUT_MAX_OCCUPANCY"):
+        _keyspace_occupancy = None
+
+
+def allocate_sequence_shortcuts(count: int) -> list[str]:
+    """Allocate shortcuts with the sequence allocator, skipping archived ones.
+
+    Collisions with shortcuts handed out earlier by another allocator are caught by the unique index on insert, but
+    archived shortcuts aren't covered by it, so with `SHORTENER_ARCHIVE_ENABLED` they're checked for explicitly.
+    """
+    allocator = get_sequence_allocator()
+    allocated = allocator.allocate(count)
+    if settings.SHORTENER_ARCHIVE_ENABLED:
+        while taken := archive.get_archived_shortcuts(allocated):
+            allocated = [shortcut for shortcut in allocated if shortcut not in taken] + allocator.allocate(len(taken))
+    return allocated
+
+
+def get_shortcut() -> str:
+    """Get unique shortcut using allocator chosen with `SHORTENER_SHORTCUT_ALLOCATOR` setting."""
+    allocator = settings.SHORTENER_SHORTCUT_ALLOCATOR
+    if allocator == SEQUENCE_ALLOCATOR:
+        return allocate_sequence_shortcuts(1)[0]
+    if allocator == RANDOM_ALLOCATOR:
+        occupancy = get_keyspace_occupancy()
+        start_length = occupancy.get_start_length()
+        shortcut = get_random_shortcut(start_length)
+        occupancy.record([shortcut], start_length)
+        return shortcut
+    raise ImproperlyConfigured(f"SHORTENER_SHORTCUT_ALLOCATOR must be one of: {', '.join(ALLOCATORS)}.")
+
+
+def get_shortcuts(count: int) -> list[str]:
+    """Get `count` unique shortcuts at once using allocator chosen with `SHORTENER_SHORTCUT_ALLOCATOR` setting."""
+    allocator = settings.SHORTENER_SHORTCUT_ALLOCATOR
+    if allocator == SEQUENCE_ALLOCATOR:
+        return allocate_sequence_shortcuts(count)
+    if allocator == RANDOM_ALLOCATOR:
+        occupancy = get_keyspace_occupancy()
+        start_length = occupancy.get_start_length()
+        found = get_random_shortcuts(count, start_length)
+        occupancy.record(found, start_length)
+        return found
+    raise ImproperlyConfigured(f"SHORTENER_SHORTCUT_ALLOCATOR must be one of: {', '.join(ALLOCATORS)}.")
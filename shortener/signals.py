@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from shortener.cache import get_url_cache
+from shortener.models import URL
+
+
+@receiver(post_save, sender=URL)
+@receiver(post_delete, sender=URL)
+def invalidate_url_cache(instance: URL, **kwargs) -> None:
+    """Drop cached data of the shortcut so that the next lookup reads it from the database."""
+    get_url_cache().delete(instance.shortcut)
@@ -0,0 +1,323 @@
+"""Read-only snapshot of shortcuts for redirect nodes which shouldn't read from the database.
+
+Snapshot is a single file built by the `build_snapshot` command: a header, an index of fixed-width records sorted by
+shortcut and a blob of original URLs the records point to. It's memory-mapped, so lookups are binary searches over
+pages shared by all processes on the machine, and nothing has to be loaded at startup.
+
+Rows are sorted in Python rather than by the database, whose collation may order shortcuts differently. They are read
+by walking the primary key, sorted in runs of limited size spilled to temporary files, and merged with the previous
+snapshot, so memory use doesn't depend on the size of the table. A new snapshot is written next to the old one and
+moved in its place, so processes using the old one can keep reading it until they reopen the file.
+"""
+import heapq
+import logging
+import math
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+from typing import IO, Iterable, Iterator
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.models import Max
+from django.dispatch import receiver
+
+from shortener import constants, resolvers
+from shortener.cache import ResolvedURL
+from shortener.models import URL
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SHRTSNP1"
+# Magic, width of shortcuts, number of records, highest id included, build time.
+HEADER = struct.Struct("<8sIQqd")
+# Fields of a record following the shortcut padded with zero bytes. The offset is 64-bit, as the blob of originals of
+# tens of millions of URLs passes 4 GiB.
+RECORD_FIELDS = "".join(
+    (
+        "q",  # Id.
+        "Q",  # Offset of the original in the blob.
+        "I",  # Length of the original.
+        "d",  # Expiration timestamp, NaN if none.
+        "q",  # Max uses, -1 if none.
+        "b",  # Permanent redirect, -1 if not set.
+        "i",  # Redirect max age, -1 if not set.
+    )
+)
+
+# Size of chunks in which the blob is copied into the snapshot.
+COPY_CHUNK_SIZE = 1024 * 1024
+
+Row = tuple[str, ResolvedURL]
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class Snapshot:
+    """Memory-mapped snapshot file. Lookups are thread-safe."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as file:
+            self.stat = os.fstat(file.fileno())
+            if self.stat.st_size < HEADER.size:
+                raise SnapshotError(f"{path} is not a snapshot.")
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.width, self.count, self.last_id, self.built_at = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise SnapshotError(f"{path} is not a snapshot.")
+        self.record = struct.Struct(f"<{self.width}s{RECORD_FIELDS}")
+        self.blob_offset = HEADER.size + self.count * self.record.size
+        if self.stat.st_size < self.blob_offset:
+            self._mmap.close()
+            raise SnapshotError(f"{path} is truncated.")
+
+    def close(self) -> None:
+        self._mmap.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def get(self, shortcut: str) -> ResolvedURL | None:
+        """Find URL by binary search over the index."""
+        key = shortcut.encode()
+        if len(key) > self.width:
+            return None
+        key = key.ljust(self.width, b"\0")
+        mm, width, record_size = self._mmap, self.width, self.record.size
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset = HEADER.size + middle * record_size
+            found = mm[offset : offset + width]
+            if found < key:
+                low = middle + 1
+            elif found > key:
+                high = middle
+            else:
+                return self._read(offset)[1]
+        return None
+
+    def __iter__(self) -> Iterator[Row]:
+        """Iterate over all URLs, sorted by shortcut."""
+        for index in range(self.count):
+            yield self._read(HEADER.size + index * self.record.size)
+
+    def _read(self, offset: int) -> Row:
+        key, url_id, start, length, expires_at, max_uses, permanent, max_age = self.record.unpack_from(
+            self._mmap, offset
+        )
+        start += self.blob_offset
+        original = self._mmap[start : start + length].decode()
+        resolved = ResolvedURL(
+            url_id,
+            original,
+            None if math.isnan(expires_at) else expires_at,
+            None if max_uses < 0 else max_uses,
+            None if permanent < 0 else bool(permanent),
+            None if max_age < 0 else max_age,
+        )
+        return key.rstrip(b"\0").decode(), resolved
+
+
+def write_snapshot(path: str, rows: Iterable[Row], last_id: int, width: int = constants.MAX_SHORTCUT_LENGTH) -> int:
+    """Write rows sorted by shortcut into a new snapshot, atomically replacing the file at `path`.
+
+    Returns number of written rows.
+    """
+    record = struct.Struct(f"<{width}s{RECORD_FIELDS}")
+    directory = os.path.dirname(os.path.abspath(path))
+    count = 0
+    with tempfile.NamedTemporaryFile(dir=directory, prefix=".snapshot-", delete=False) as file:
+        try:
+            with tempfile.TemporaryFile(dir=directory) as blob:
+                file.write(HEADER.pack(MAGIC, width, 0, last_id, 0.0))
+                offset = 0
+                for shortcut, url in rows:
+                    original = url.original.encode()
+                    blob.write(original)
+                    file.write(
+                        record.pack(
+                            shortcut.encode(),
+                            url.id,
+                            offset,
+                            len(original),
+                            math.nan if url.expires_at is None else url.expires_at,
+                            -1 if url.max_uses is None else url.max_uses,
+                            -1 if url.redirect_permanent is None else int(url.redirect_permanent),
+                            -1 if url.redirect_max_age is None else url.redirect_max_age,
+                        )
+                    )
+                    offset += len(original)
+                    count += 1
+                blob.seek(0)
+                while chunk := blob.read(COPY_CHUNK_SIZE):
+                    file.write(chunk)
+            file.seek(0)
+            file.write(HEADER.pack(MAGIC, width, count, last_id, time.time()))
+            file.flush()
+            os.fsync(file.fileno())
+        except BaseException:
+            os.unlink(file.name)
+            raise
+    os.chmod(file.name, 0o644)
+    os.replace(file.name, path)
+    return count
+
+
+def read_rows(after_id: int, last_id: int, chunk_size: int) -> Iterator[Row]:
+    """Read URLs with ids from (after_id, last_id], walking the primary key in chunks."""
+    urls = URL.objects.filter(id__lte=last_id).order_by("id").only("shortcut", *resolvers.RESOLVED_FIELDS)
+    while chunk := list(urls.filter(id__gt=after_id)[:chunk_size]):
+        for url in chunk:
+            yield url.shortcut, resolvers.to_resolved_url(url)
+        after_id = chunk[-1].id
+
+
+def get_shortcut(row: Row) -> str:
+    return row[0]
+
+
+def sort_in_runs(rows: Iterable[Row], run_size: int, stack: ExitStack) -> list[Iterator[Row]]:
+    """Sort rows in runs of `run_size`. Every run but a single one is spilled to a temporary file."""
+    files: list[IO[bytes]] = []
+    run: list[Row] = []
+    for row in rows:
+        run.append(row)
+        if len(run) >= run_size:
+            files.append(spill(sorted(run, key=get_shortcut), stack))
+            run = []
+    run.sort(key=get_shortcut)
+    if not files:
+        return [iter(run)]
+    files.append(spill(run, stack))
+    return [read_run(file) for file in files]
+
+
+def spill(run: list[Row], stack: ExitStack) -> IO[bytes]:
+    file = stack.enter_context(tempfile.TemporaryFile())
+    pickler = pickle.Pickler(file, protocol=pickle.HIGHEST_PROTOCOL)
+    for row in run:
+        pickler.dump(row)
+    file.seek(0)
+    return file
+
+
+def read_run(file: IO[bytes]) -> Iterator[Row]:
+    unpickler = pickle.Unpickler(file)
+    while True:
+        try:
+            yield unpickler.load()
+        except EOFError:
+            return
+
+
+def merge_rows(*sources: Iterable[Row]) -> Iterator[Row]:
+    """Merge sorted sources of rows. If a shortcut is in many of them, the row from the last source is kept."""
+    previous: Row | None = None
+    for row in heapq.merge(*sources, key=get_shortcut):
+        if previous is not None and previous[0] != row[0]:
+            yield previous
+        previous = row
+    if previous is not None:
+        yield previous
+
+
+def build_snapshot(path: str, incremental: bool = True, chunk_size: int = 5000, run_size: int = 500_000) -> int:
+    """Build snapshot of all URLs at `path`. Returns number of URLs in it.
+
+    With `incremental`, only URLs with ids greater than the highest one in the existing snapshot are read and merged
+    into it. URLs changed or deleted since then are only picked up by a full build.
+    """
+    previous = None
+    if incremental and os.path.exists(path):
+        previous = Snapshot(path)
+    try:
+        after_id = previous.last_id if previous is not None else 0
+        # URLs created while the snapshot is being built are left for the next build.
+        last_id = URL.objects.aggregate(last_id=Max("id"))["last_id"] or after_id
+        with ExitStack() as stack:
+            runs = sort_in_runs(read_rows(after_id, last_id, chunk_size), run_size, stack)
+            sources = ([iter(previous)] if previous is not None else []) + runs
+            count = write_snapshot(path, merge_rows(*sources), last_id)
+    finally:
+        if previous is not None:
+            previous.close()
+    return count
+
+
+class SnapshotResolver:
+    """Lookups in the snapshot at `path`, reopened once the file has been replaced.
+
+    The file is checked at most every `check_interval` seconds. Missing file is treated as an empty snapshot. File which
+    can't be opened (e.g. copied only partially) is logged and the previous snapshot is kept until the file changes.
+    """
+
+    def __init__(self, path: str, check_interval: float):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot: Snapshot | None = None
+        # Inode and modification time of the file last opened (or attempted to).
+        self._version: tuple[int, int] | None = None
+        self._checked_at = -math.inf
+        self._lock = threading.Lock()
+
+    def get(self, shortcut: str) -> ResolvedURL | None:
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            self.reload()
+        snapshot = self._snapshot
+        return snapshot.get(shortcut) if snapshot is not None else None
+
+    def reload(self) -> None:
+        """Open the snapshot again if the file has changed."""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                self._snapshot = self._version = None
+                return
+            version = (stat.st_ino, stat.st_mtime_ns)
+            if version == self._version:
+                return
+            self._version = version
+            try:
+                snapshot = Snapshot(self.path)
+            except (OSError, ValueError, SnapshotError):
+                logger.exception("Failed to open snapshot %s, keeping the previous one.", self.path)
+                return
+            # The old mapping is left to be closed by garbage collection, as other threads may still be reading it.
+            self._snapshot = snapshot
+
+
+_snapshot_resolver: SnapshotResolver | None = None
+_snapshot_resolver_lock = threading.Lock()
+
+
+def get_snapshot_resolver() -> SnapshotResolver | None:
+    """Get process-wide resolver of `SHORTENER_REDIRECT_SNAPSHOT`, or `None` if it's not set."""
+    global _snapshot_resolver
+    if not settings.SHORTENER_REDIRECT_SNAPSHOT:
+        return None
+    if _snapshot_resolver is None:
+        with _snapshot_resolver_lock:
+            if _snapshot_resolver is None:
+                _snapshot_resolver = SnapshotResolver(
+                    settings.SHORTENER_REDIRECT_SNAPSHOT, settings.SHORTENER_REDIRECT_SNAPSHOT_CHECK_INTERVAL
+                )
+    return _snapshot_resolver
+
+
+@receiver(setting_changed)
+def reset_snapshot_resolver(setting: str, **kwargs) -> None:
+    global _snapshot_resolver
+    if setting.startswith("SHORTENER_REDIRECT_SNAPSHOT"):
+        _snapshot_resolver = None
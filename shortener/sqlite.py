@@ -0,0 +1,43 @@
+"""Tuning of sqlite3 connections for single-node deployments.
+
+In the default rollback journal mode a writer locks out all readers and concurrent usage UPDATEs made by redirects
+fail with "database is locked" once they wait longer than the busy timeout. In WAL mode readers never block the writer
+and vice versa, so with a read-only connection for reads (the "readonly" alias routed by `shortener.routers`) redirects
+wait only for other writers, one at a time, up to the busy timeout.
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from shortener.routers import get_replicas
+
+
+def get_pragmas(read_only: bool) -> dict[str, str | int]:
+    """Get pragmas set on every new connection."""
+    pragmas: dict[str, str | int] = {
+        "busy_timeout": settings.SHORTENER_SQLITE_BUSY_TIMEOUT,
+        # WAL is consistent after a crash with NORMAL, only the last commits may be lost on power failure.
+        "synchronous": "NORMAL",
+        "mmap_size": settings.SHORTENER_SQLITE_MMAP_SIZE,
+        # Negative size is in KiB rather than pages.
+        "cache_size": -settings.SHORTENER_SQLITE_CACHE_SIZE,
+    }
+    if read_only:
+        pragmas["query_only"] = "ON"
+    else:
+        # Journal mode is stored in the database file, but it can be changed only by a connection which may write.
+        pragmas = {"journal_mode": "WAL", **pragmas}
+    return pragmas
+
+
+def tune_connection(connection) -> None:
+    """Set pragmas on a sqlite3 connection, making it read-only if it's a replica of the primary."""
+    with connection.cursor() as cursor:
+        for name, value in get_pragmas(connection.alias in get_replicas()).items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+@receiver(connection_created)
+def tune_sqlite_connection(connection, **kwargs) -> None:
+    if connection.vendor == "sqlite" and settings.SHORTENER_SQLITE_TUNING:
+        tune_connection(connection)
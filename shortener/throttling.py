@@ -0,0 +1,246 @@
+"""Per-client rate limiting with token buckets.
+
+Every client has a bucket per scope (creating URLs, reading their details and redirecting), holding up to `capacity`
+tokens and refilled with `rate` tokens per second. A request takes a token from the bucket or is rejected with 429 Too
+Many Requests until the next token arrives. Requests creating or resolving many URLs at once take a token per URL, but
+at most a full bucket. Limits are set with `SHORTENER_THROTTLE_*_RATE` settings, in the DRF format
+(`<requests>/<period>`, e.g. `60/min`), where the number of requests is the capacity too, so a client may spend all of
+it at once.
+
+Buckets are kept in memory of the process by default, so checking them doesn't need any round trip. With
+`SHORTENER_THROTTLE_BACKEND`, they are kept in a Django cache shared by all processes instead.
+"""
+import collections
+import functools
+import math
+import threading
+import time
+from typing import Mapping
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpResponse
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+CREATE = "create"
+RETRIEVE = "retrieve"
+REDIRECT = "redirect"
+SCOPES = (CREATE, RETRIEVE, REDIRECT)
+
+DURATIONS = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+
+# Set in WSGI environ or ASGI scope by the redirect fast path once it has taken a token for the request, so that the
+# view it falls back to doesn't take another one.
+CHECKED_KEY = "shortener.throttle_checked"
+
+
+@functools.lru_cache
+def parse_rate(rate: str) -> tuple[int, float]:
+    """Parse rate like `60/min` into the capacity of the bucket and the number of tokens added per second."""
+    try:
+        num, period = rate.split("/")
+        capacity = int(num)
+        duration = DURATIONS[period.strip()[0]]
+    except (ValueError, KeyError, IndexError):
+        raise ValueError(f"Invalid throttle rate: {rate!r}.") from None
+    if capacity <= 0:
+        raise ValueError(f"Invalid throttle rate: {rate!r}.")
+    return capacity, capacity / duration
+
+
+def get_rate(scope: str) -> str | None:
+    return getattr(settings, f"SHORTENER_THROTTLE_{scope.upper()}_RATE")
+
+
+def get_client_ident(meta: Mapping[str, str]) -> str:
+    """Identify client by the remote address, or by the address the outermost of `NUM_PROXIES` proxies saw.
+
+    `X-Forwarded-For` is trusted only if there are proxies in front of the application, as otherwise clients could
+    set it to anything to get a new bucket with every request. `META` of the request, WSGI environ or its equivalent
+    built from ASGI scope can be passed.
+    """
+    forwarded_for = meta.get("HTTP_X_FORWARDED_FOR")
+    remote_addr = meta.get("REMOTE_ADDR", "")
+    num_proxies = api_settings.NUM_PROXIES
+    if not num_proxies or not forwarded_for:
+        return remote_addr
+    addresses = forwarded_for.split(",")
+    return addresses[-min(num_proxies, len(addresses))].strip()
+
+
+class BaseTokenBuckets:
+    def consume(self, key: str, capacity: int, rate: float, cost: int = 1) -> float:
+        """Take `cost` tokens from the bucket. Return 0 if they were taken, or seconds to wait for them otherwise."""
+        raise NotImplementedError
+
+    async def aconsume(self, key: str, capacity: int, rate: float, cost: int = 1) -> float:
+        """Asynchronous version of `consume`."""
+        return self.consume(key, capacity, rate, cost)
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    @staticmethod
+    def take(
+        bucket: tuple[float, float] | None, now: float, capacity: int, rate: float, cost: int = 1
+    ) -> tuple[tuple[float, float], float]:
+        """Take `cost` tokens from the bucket (tokens, time of the last update).
+
+        Return the new state of the bucket and 0 if the tokens were taken, or seconds until there's enough of them
+        otherwise. Cost greater than the capacity is reduced to it, so that the request can be allowed eventually.
+        """
+        cost = min(cost, capacity)
+        if bucket is None:
+            tokens = float(capacity)
+        else:
+            tokens, updated = bucket
+            tokens = min(capacity, tokens + max(now - updated, 0) * rate)
+        if tokens >= cost:
+            return (tokens - cost, now), 0.0
+        return (tokens, now), (cost - tokens) / rate
+
+
+class LocalTokenBuckets(BaseTokenBuckets):
+    """Buckets kept in memory of the process. The least recently used ones are dropped once there are `max_size`."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._buckets: collections.OrderedDict[str, tuple[float, float]] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key: str, capacity: int, rate: float, cost: int = 1) -> float:
+        with self._lock:
+            self._buckets[key], wait = self.take(self._buckets.get(key), time.monotonic(), capacity, rate, cost)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_size:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class DjangoTokenBuckets(BaseTokenBuckets):
+    """Buckets kept in one of the Django cache backends, so that limits apply to all processes together.
+
+    Bucket is read and written back without locking, so concurrent requests of the same client may occasionally take
+    the same token. Full buckets are left to expire from the cache.
+    """
+
+    def __init__(self, alias: str, key_prefix: str = "shortener:throttle:"):
+        self.alias = alias
+        self.key_prefix = key_prefix
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def consume(self, key: str, capacity: int, rate: float, cost: int = 1) -> float:
+        key = self.key_prefix + key
+        bucket, wait = self.take(self.backend.get(key), time.time(), capacity, rate, cost)
+        self.backend.set(key, bucket, timeout=math.ceil(capacity / rate))
+        return wait
+
+    async def aconsume(self, key: str, capacity: int, rate: float, cost: int = 1) -> float:
+        key = self.key_prefix + key
+        bucket, wait = self.take(await self.backend.aget(key), time.time(), capacity, rate, cost)
+        await self.backend.aset(key, bucket, timeout=math.ceil(capacity / rate))
+        return wait
+
+    def clear(self) -> None:
+        # Clearing the whole backend could remove unrelated data, so buckets are left to expire on their own.
+        pass
+
+
+_token_buckets: BaseTokenBuckets | None = None
+_token_buckets_lock = threading.Lock()
+
+
+def build_token_buckets() -> BaseTokenBuckets:
+    """Build store of buckets according to `SHORTENER_THROTTLE_*` settings."""
+    if settings.SHORTENER_THROTTLE_BACKEND:
+        return DjangoTokenBuckets(settings.SHORTENER_THROTTLE_BACKEND)
+    return LocalTokenBuckets(settings.SHORTENER_THROTTLE_MAX_CLIENTS)
+
+
+def get_token_buckets() -> BaseTokenBuckets:
+    """Get process-wide store of buckets, building it on the first use."""
+    global _token_buckets
+    if _token_buckets is None:
+        with _token_buckets_lock:
+            if _token_buckets is None:
+                _token_buckets = build_token_buckets()
+    return _token_buckets
+
+
+@receiver(setting_changed)
+def reset_token_buckets(setting: str, **kwargs) -> None:
+    """Rebuild the store next time it's used if any of its settings has changed."""
+    global _token_buckets
+    if setting in ("SHORTENER_THROTTLE_BACKEND", "SHORTENER_THROTTLE_MAX_CLIENTS"):
+        _token_buckets = None
+
+
+def check(scope: str, ident: str, cost: int = 1) -> float:
+    """Take tokens of the client in the scope. Return 0 if the request is allowed, or seconds to wait otherwise."""
+    rate = get_rate(scope)
+    if rate is None:
+        return 0
+    return get_token_buckets().consume(f"{scope}:{ident}", *parse_rate(rate), cost)
+
+
+async def acheck(scope: str, ident: str, cost: int = 1) -> float:
+    """Asynchronous version of `check`."""
+    rate = get_rate(scope)
+    if rate is None:
+        return 0
+    return await get_token_buckets().aconsume(f"{scope}:{ident}", *parse_rate(rate), cost)
+
+
+def is_checked(request) -> bool:
+    """Check whether a token has already been taken for the request by the redirect fast path."""
+    return CHECKED_KEY in request.META or CHECKED_KEY in getattr(request, "scope", {})
+
+
+def get_retry_after(wait: float) -> str:
+    return str(math.ceil(wait))
+
+
+def too_many_requests(wait: float) -> HttpResponse:
+    """Response of plain Django views (i.e. redirects) to throttled requests."""
+    response = HttpResponse("Request was throttled.", status=429, content_type="text/plain")
+    response["Retry-After"] = get_retry_after(wait)
+    return response
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """DRF throttle taking tokens of the client in `scope`, as many as `get_throttle_cost` of the view returns."""
+
+    scope: str
+
+    def __init__(self):
+        self.wait_seconds = 0.0
+
+    def allow_request(self, request, view) -> bool:
+        get_cost = getattr(view, "get_throttle_cost", None)
+        cost = get_cost() if get_cost is not None else 1
+        self.wait_seconds = check(self.scope, get_client_ident(request.META), cost)
+        return not self.wait_seconds
+
+    def wait(self) -> float | None:
+        return self.wait_seconds or None
+
+
+class CreateURLThrottle(TokenBucketThrottle):
+    scope = CREATE
+
+
+class RetrieveURLThrottle(TokenBucketThrottle):
+    scope = RETRIEVE
@@ -0,0 +1,299 @@
+"""Streaming export and import of URLs as NDJSON or CSV, used by the `export_urls` and `import_urls` commands.
+
+Rows are read by walking the primary key in chunks and inserted with `bulk_create` in batches, so memory use doesn't
+depend on the size of the table or of the file.
+"""
+import csv
+import datetime
+import functools
+import io
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Callable, Iterable, Iterator
+
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import serializers
+
+from shortener import constants
+from shortener.cache import get_url_cache
+from shortener.models import URL, ArchivedURL, expand_original
+from shortener.serializers import URLSerializer
+
+NDJSON = "ndjson"
+CSV = "csv"
+FORMATS = (NDJSON, CSV)
+
+# Exported fields of URL. Ids aren't exported, as they may be taken in the target database, and the hash of the
+# original URL is computed again when URL is imported.
+FIELDS = (
+    "shortcut",
+    "original",
+    "created",
+    "last_accessed",
+    "use_count",
+    "expires_at",
+    "max_uses",
+    "redirect_permanent",
+    "redirect_max_age",
+)
+REQUIRED_FIELDS = ("shortcut", "original")
+DATETIME_FIELDS = ("created", "last_accessed", "expires_at")
+INTEGER_FIELDS = ("use_count", "max_uses", "redirect_max_age")
+BOOLEAN_FIELDS = ("redirect_permanent",)
+# Fields overwritten when an imported URL has the same shortcut as an existing one and conflicts are updated.
+UPDATE_FIELDS = [name for name in FIELDS if name != "shortcut"] + ["original_hash"]
+
+SHORTCUT_CHARSET = frozenset(constants.SHORTCUT_CHARSET)
+
+Record = dict[str, object]
+
+
+def guess_format(path: str) -> str:
+    return CSV if path.lower().endswith(".csv") else NDJSON
+
+
+def to_record(values) -> Record:
+    """Convert values of `FIELDS` into a JSON-compatible record."""
+    record = dict(zip(FIELDS, values))
+    for name in DATETIME_FIELDS:
+        if record[name] is not None:
+            record[name] = record[name].isoformat()
+    return record
+
+
+def parse_value(name: str, value):
+    """Parse value of a field read from NDJSON (already typed) or CSV (always a string, empty for null)."""
+    if value is None or value == "":
+        return None
+    if name in DATETIME_FIELDS:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValueError(f"Invalid date in {name}: {value!r}.")
+        return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed, datetime.timezone.utc)
+    if name in INTEGER_FIELDS:
+        return int(value)
+    if name in BOOLEAN_FIELDS:
+        if isinstance(value, bool):
+            return value
+        if value.lower() not in ("true", "false"):
+            raise ValueError(f"Invalid boolean in {name}: {value!r}.")
+        return value.lower() == "true"
+    return str(value)
+
+
+def validate_shortcut(shortcut: str) -> None:
+    """Check that the shortcut could have been generated, so that imported URLs can be resolved like others."""
+    if (
+        not constants.MIN_SHORTCUT_LENGTH <= len(shortcut) <= constants.MAX_SHORTCUT_LENGTH
+        or not set(shortcut) <= SHORTCUT_CHARSET
+        or shortcut in constants.DISALLOWED_SHORTCUTS
+    ):
+        raise ValueError(f"Invalid shortcut: {shortcut!r}.")
+
+
+@functools.cache
+def get_serializer_fields() -> dict[str, serializers.Field]:
+    """Get fields of `URLSerializer` validating fields of URL which can be set on request, by names of model fields."""
+    fields = URLSerializer().fields
+    return {
+        "original": fields["url"],
+        "max_uses": fields["max_uses"],
+        "redirect_permanent": fields["redirect_permanent"],
+        "redirect_max_age": fields["redirect_max_age"],
+    }
+
+
+def validate_values(values: dict) -> None:
+    """Validate values like `URLSerializer` validates created URLs. Expiration date may have passed already."""
+    validate_shortcut(values["shortcut"])
+    for name, field in get_serializer_fields().items():
+        if values.get(name) is not None:
+            try:
+                field.run_validation(values[name])
+            except serializers.ValidationError as e:
+                raise ValueError(f"Invalid {name}: {' '.join(map(str, e.detail))}") from e
+
+
+def from_record(record: Record) -> URL:
+    """Build (unsaved) URL from an exported record. Missing optional fields get their defaults."""
+    if not isinstance(record, dict):
+        raise ValueError("Record must be an object.")
+    for name in REQUIRED_FIELDS:
+        if not record.get(name):
+            raise ValueError(f"Missing {name}.")
+    values = {name: parse_value(name, record[name]) for name in FIELDS if name in record}
+    validate_values(values)
+    # Fields which can't be null get their defaults.
+    for name in ("created", "use_count"):
+        if values.get(name) is None:
+            values.pop(name, None)
+    url = URL(**values)
+    url.update_original_hash()
+    return url
+
+
+class NDJSONWriter:
+    def __init__(self, stream: io.TextIOBase):
+        self.stream = stream
+
+    def write(self, records: Iterable[Record]) -> None:
+        self.stream.write("".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records))
+
+
+class CSVWriter:
+    """Write records as CSV with a header. Nulls are written as empty strings and booleans as "true" / "false"."""
+
+    def __init__(self, stream: io.TextIOBase):
+        self.writer = csv.DictWriter(stream, fieldnames=FIELDS)
+        self.writer.writeheader()
+
+    def write(self, records: Iterable[Record]) -> None:
+        self.writer.writerows({name: format_csv_value(value) for name, value in record.items()} for record in records)
+
+
+def format_csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value
+
+
+def read_ndjson(stream: IO[str]) -> Iterator[tuple[int, Record]]:
+    """Read records along with their line numbers."""
+    for line_number, line in enumerate(stream, start=1):
+        if line.strip():
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"Line {line_number}: {e}") from e
+
+
+def read_csv(stream: IO[str]) -> Iterator[tuple[int, Record]]:
+    reader = csv.DictReader(stream)
+    for record in reader:
+        yield reader.line_num, record
+
+
+WRITERS = {NDJSON: NDJSONWriter, CSV: CSVWriter}
+READERS = {NDJSON: read_ndjson, CSV: read_csv}
+
+
+class Progress:
+    """Thread-safe counter of transferred rows, reported along with the rate at most every `interval` seconds."""
+
+    def __init__(self, report: Callable[[str], None], verb: str, interval: float = 1.0):
+        self.report = report
+        self.verb = verb
+        self.interval = interval
+        self.count = 0
+        self._started = self._reported = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, count: int) -> None:
+        with self._lock:
+            self.count += count
+            now = time.monotonic()
+            if now - self._reported >= self.interval:
+                self._reported = now
+                self.report(self.summary())
+
+    def summary(self) -> str:
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        return f"{self.verb} {self.count:,} URLs ({self.count / elapsed:,.0f} rows/s)."
+
+
+def run_parallel(func: Callable, calls: list[tuple], workers: int) -> None:
+    """Call `func` with every tuple of arguments, in up to `workers` threads at once.
+
+    Threads use their own database connections, which are closed once they are done. With a single worker, everything
+    runs in the current thread.
+    """
+    if workers <= 1:
+        for args in calls:
+            func(*args)
+        return
+
+    def call(args: tuple) -> None:
+        try:
+            func(*args)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Iterating over results raises the first exception from the threads.
+        for _ in executor.map(call, calls):
+            pass
+
+
+def export_urls(writer, start_id: int, end_id: int, chunk_size: int, progress: Progress) -> None:
+    """Write URLs with ids from [start_id, end_id), ordered by id, followed by archived URLs from the same range.
+
+    Every chunk is read with a separate query starting after the last id of the previous one, so queries stay short
+    and no cursor is kept open (server-side cursors don't work behind transaction-pooling proxies). Archived URLs keep
+    their ids, so ranges of both tables never overlap.
+    """
+    urls = URL.objects.filter(id__lt=end_id).order_by("id")
+    last_id = start_id - 1
+    columns = ("id", *FIELDS, "original_prefix", "original_rest")
+    while rows := list(urls.filter(id__gt=last_id).values_list(*columns)[:chunk_size]):
+        writer.write(to_record(expand_row(row, urls.db)) for row in rows)
+        last_id = rows[-1][0]
+        progress.add(len(rows))
+
+    archived = ArchivedURL.objects.filter(id__lt=end_id).order_by("id")
+    last_id = start_id - 1
+    while rows := list(archived.filter(id__gt=last_id).values_list("id", *FIELDS)[:chunk_size]):
+        writer.write(to_record(row[1:]) for row in rows)
+        last_id = rows[-1][0]
+        progress.add(len(rows))
+
+
+def expand_row(row: tuple, using: str) -> tuple:
+    """Get values of `FIELDS` from a row read by `export_urls`, with the original URL in its full form."""
+    values = list(row[1:-2])
+    values[FIELDS.index("original")] = expand_original(values[FIELDS.index("original")], row[-2], row[-1], using)
+    return tuple(values)
+
+
+def import_urls(records: Iterable[tuple[int, Record]], batch_size: int, update: bool, progress: Progress) -> None:
+    """Insert URLs from records in batches.
+
+    URLs with shortcuts which already exist are skipped, or overwrite the existing ones if `update` is set. Every
+    batch is inserted in its own transaction, so an interrupted import can simply be run again.
+    """
+    batch: dict[str, URL] = {}
+    for line_number, record in records:
+        try:
+            url = from_record(record)
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Line {line_number}: {e}") from e
+        # Repeated shortcuts can't be inserted with the same statement, the last one wins.
+        batch[url.shortcut] = url
+        if len(batch) >= batch_size:
+            insert_batch(list(batch.values()), update)
+            progress.add(len(batch))
+            batch = {}
+    if batch:
+        insert_batch(list(batch.values()), update)
+        progress.add(len(batch))
+
+
+def insert_batch(urls: list[URL], update: bool) -> None:
+    """Insert URLs, skipping or updating existing ones. Archived URLs are skipped too, or replaced by imported ones."""
+    archived = ArchivedURL.objects.filter(shortcut__in=[url.shortcut for url in urls])
+    if update:
+        with transaction.atomic():
+            archived.delete()
+            URL.objects.bulk_create(
+                urls, update_conflicts=True, unique_fields=["shortcut"], update_fields=UPDATE_FIELDS
+            )
+    else:
+        taken = set(archived.values_list("shortcut", flat=True))
+        URL.objects.bulk_create([url for url in urls if url.shortcut not in taken], ignore_conflicts=True)
+    # bulk_create doesn't send post_save signal, so cached data of the shortcuts must be dropped explicitly.
+    get_url_cache().delete_many(url.shortcut for url in urls)
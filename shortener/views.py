@@ -1,11 +1,59 @@
-from django.db.models import F
-from django.db.models.functions import Now
-from django.shortcuts import get_object_or_404
+import json
+from typing import Iterator
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseGone, StreamingHttpResponse
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
 from django.views import generic
-from rest_framework import mixins, viewsets
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from shortener import (
+    analytics,
+    archive,
+    constants,
+    counters,
+    http_cache,
+    metrics,
+    resolvers,
+    routers,
+    throttling,
+)
+from shortener.models import URL, get_by_shortcut
+from shortener.serializers import (
+    BatchResolveSerializer,
+    ClickBucketSerializer,
+    ClickStatsQuerySerializer,
+    URLSerializer,
+)
+
+
+def get_batch_resolve_lines(shortcuts: list[str], record_use: bool) -> Iterator[str]:
+    """Resolve shortcuts in chunks and yield a line of NDJSON per shortcut, in the given order.
 
-from shortener.models import URL
-from shortener.serializers import URLSerializer
+    Original URL of a found shortcut is given along with whether it has expired. Unknown shortcuts have `found: false`.
+    With `record_use`, a use of every found URL is counted (and URLs which are used up are reported as expired).
+    """
+    for start in range(0, len(shortcuts), constants.BATCH_RESOLVE_CHUNK_SIZE):
+        chunk = shortcuts[start : start + constants.BATCH_RESOLVE_CHUNK_SIZE]
+        resolved = resolvers.resolve_shortcuts(chunk, restore=record_use)
+        lines = []
+        for shortcut in chunk:
+            url = resolved[shortcut]
+            if url is None:
+                item: dict = {"shortcut": shortcut, "found": False}
+            else:
+                expired = not counters.record_use(url) if record_use else url.is_expired()
+                if record_use and not expired:
+                    analytics.record_click(shortcut)
+                item = {"shortcut": shortcut, "found": True, "url": url.original, "expired": expired}
+            lines.append(json.dumps(item, separators=(",", ":")) + "\n")
+        yield "".join(lines)
 
 
 class CreateRetrieveURLViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
@@ -16,13 +64,169 @@ class CreateRetrieveURLViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixi
     lookup_field = lookup_url_kwarg = "shortcut"
     queryset = URL.objects.all()
 
+    def get_throttles(self):
+        """Limit creating URLs and reading them separately (see `shortener.throttling`)."""
+        if self.action in ("create", "bulk_create"):
+            return [throttling.CreateURLThrottle()]
+        return [throttling.RetrieveURLThrottle()]
+
+    def get_throttle_cost(self) -> int:
+        """Take a token per URL created or shortcut resolved in a batch, as they cost like separate requests."""
+        data = self.request.data
+        items = data.get("shortcuts") if self.action == "batch_resolve" and isinstance(data, dict) else data
+        if self.action in ("bulk_create", "batch_resolve") and isinstance(items, list) and items:
+            return len(items)
+        return 1
+
+    def get_object(self):
+        """Get URL like `get_hot_object`. With `SHORTENER_ARCHIVE_ENABLED`, missing URL is restored from the archive."""
+        try:
+            return self.get_hot_object()
+        except Http404:
+            if not settings.SHORTENER_ARCHIVE_ENABLED:
+                raise
+            url = archive.restore_url(self.kwargs[self.lookup_url_kwarg])
+            if url is None:
+                raise
+        self.check_object_permissions(self.request, url)
+        return url
+
+    def get_hot_object(self) -> URL:
+        """Get URL, from a replica when retrieving it.
+
+        URL missing on the replica may not have reached it yet, so it's looked up on the primary too.
+        """
+        if self.action != "retrieve" or not routers.get_replicas():
+            return self.get_url()
+        try:
+            with routers.replica_reads():
+                return self.get_url()
+        except Http404:
+            pass
+        self.queryset = URL.objects.using(routers.PRIMARY)
+        return self.get_url()
+
+    def get_url(self) -> URL:
+        """Same as `get_object` of DRF, but with URL looked up by the key of its shortcut, if it's enabled."""
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            url = get_by_shortcut(queryset, self.kwargs[self.lookup_url_kwarg])
+        except URL.DoesNotExist:
+            raise Http404("No URL matches the given query.")
+        self.check_object_permissions(self.request, url)
+        return url
+
+    def retrieve(self, request, *args, **kwargs):
+        """GET URL details. Conditional requests are supported: 304 is returned without serializing unchanged URL."""
+        instance = self.get_object()
+        etag = http_cache.get_etag(instance, request.accepted_media_type)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = Response(self.get_serializer(instance).data)
+        response["ETag"] = etag
+        # Usage data changes with every redirect, so clients may store the details, but have to revalidate them.
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ["Accept"])
+        return response
+
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk_create(self, request, *args, **kwargs):
+        """Create many shortcuts at once by POST-ing a list of original urls.
+
+        Response contains an item per each posted url, in the same order: either the created URL or its errors.
+        """
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        response_status = status.HTTP_201_CREATED if serializer.valid_indexes else status.HTTP_400_BAD_REQUEST
+        return Response(serializer.data, status=response_status)
+
+    @action(detail=False, methods=["post"], url_path="batch-resolve")
+    def batch_resolve(self, request, *args, **kwargs):
+        """Resolve many shortcuts at once by POST-ing their list.
+
+        Results are streamed as NDJSON, one line per shortcut in the posted order, while shortcuts are still being
+        resolved in chunks (see `get_batch_resolve_lines`). Uses aren't counted unless `record_use` is set.
+        """
+        serializer = BatchResolveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lines = get_batch_resolve_lines(serializer.validated_data["shortcuts"], serializer.validated_data["record_use"])
+        return StreamingHttpResponse(lines, content_type="application/x-ndjson")
+
+    @action(detail=True, methods=["get"])
+    def stats(self, request, *args, **kwargs):
+        """GET number of uses of the URL per hour or per day.
+
+        Stats are read from buckets precomputed by the `rollup_clicks` management command, so clicks show up only
+        after the next rollup. Defaults to hourly buckets from the last 24 hours (daily ones from the last 30 days).
+        """
+        url = self.get_object()
+        query = ClickStatsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        granularity = query.validated_data["granularity"]
+        buckets = analytics.get_stats(
+            url.shortcut, granularity, query.validated_data["since"], query.validated_data.get("until")
+        )
+        return Response(
+            {
+                "shortcut": url.shortcut,
+                "granularity": granularity,
+                "buckets": ClickBucketSerializer(buckets, many=True).data,
+            }
+        )
+
 
 class ResolveURLView(generic.RedirectView):
-    """Find original URL by shortcut and redirect to it. Update URL's usage data."""
+    """Find original URL by shortcut and redirect to it. Update URL's usage data.
+
+    Shortcut is resolved through the cache (see `shortener.resolvers.resolve_shortcut`), so redirect for a cached
+    shortcut doesn't read from the database at all. Usage is saved according to `SHORTENER_ACCESS_COUNTING` setting
+    (see `shortener.counters.record_use`) and a click event is logged for analytics (see `shortener.analytics`).
+    Status and `Cache-Control` of the redirect follow the URL's cache policy (see `shortener.http_cache`). 410 Gone is
+    returned for expired URLs and 429 Too Many Requests for clients over `SHORTENER_THROTTLE_REDIRECT_RATE`.
+    """
+
+    def get(self, request, *args, shortcut: str, **kwargs):
+        if not throttling.is_checked(request):
+            wait = throttling.check(throttling.REDIRECT, throttling.get_client_ident(request.META))
+            if wait:
+                return throttling.too_many_requests(wait)
+        url = resolvers.resolve_shortcut(shortcut)
+        if url is None:
+            raise Http404("No URL matches the given query.")
+        if not counters.record_use(url):
+            return HttpResponseGone()
+        analytics.record_click(shortcut)
+        return http_cache.redirect_response(url)
+
+
+class AsyncResolveURLView(generic.View):
+    """Asynchronous version of `ResolveURLView`, used when the application is served with ASGI.
+
+    Shortcut is resolved with the async cache and ORM API, so no thread is occupied while waiting for the database.
+    Usage is saved in the background, after the response has been returned (see `shortener.counters.arecord_access`).
+    """
+
+    async def get(self, request, shortcut: str):
+        if not throttling.is_checked(request):
+            wait = await throttling.acheck(throttling.REDIRECT, throttling.get_client_ident(request.META))
+            if wait:
+                return throttling.too_many_requests(wait)
+        url = await resolvers.aresolve_shortcut(shortcut)
+        if url is None:
+            raise Http404("No URL matches the given query.")
+        if not await counters.arecord_use(url):
+            return HttpResponseGone()
+        analytics.record_click(shortcut, background=True)
+        return http_cache.redirect_response(url)
+
+
+class MetricsView(generic.View):
+    """Expose metrics of this process in the Prometheus text format (see `shortener.metrics`)."""
 
-    permanent = False
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
 
-    def get_redirect_url(self, shortcut: str) -> str:
-        url = get_object_or_404(URL, shortcut=shortcut)
-        URL.objects.filter(id=url.id).update(last_accessed=Now(), use_count=F("use_count") + 1)
-        return url.original
+    def get(self, request):
+        if not settings.SHORTENER_METRICS_ENABLED:
+            raise Http404("Metrics are disabled.")
+        return HttpResponse(metrics.REGISTRY.render(), content_type=self.content_type)
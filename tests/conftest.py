@@ -1,8 +1,34 @@
 import pytest
 
 from shortener import constants, shortcuts
+from shortener.cache import get_url_cache
 from shortener.factories import URLFactory
-from shortener.models import URL
+from shortener.models import URL, clear_url_prefix_cache
+from shortener.throttling import get_token_buckets
+
+
+@pytest.fixture(autouse=True)
+def clear_url_cache():
+    """Make sure that cached shortcuts don't leak between tests, as database changes are rolled back after each."""
+    get_url_cache().clear()
+    yield
+    get_url_cache().clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_token_buckets():
+    """Make sure that requests of one test don't count towards rate limits of another."""
+    get_token_buckets().clear()
+    yield
+    get_token_buckets().clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_url_prefixes():
+    """Make sure that prefixes of original URLs don't leak between tests, as their ids are reused after rollbacks."""
+    clear_url_prefix_cache()
+    yield
+    clear_url_prefix_cache()
 
 
 @pytest.fixture
@@ -0,0 +1,82 @@
+import pytest
+import pytest_django.asserts
+from django.urls import reverse
+
+from shortener.factories import URLFactory
+from shortener.models import URL
+from shortener.pagination import EstimatedCountPaginator, estimate_count
+
+CHANGELIST_VIEW_NAME = "admin:shortener_url_changelist"
+
+
+@pytest.mark.django_db
+def test_estimate_count():
+    """Test `shortener.pagination.estimate_count`. Check that the highest id is used outside of PostgreSQL."""
+    urls = URLFactory.create_batch(3)
+    urls[0].delete()
+    assert estimate_count(URL, "default") == urls[-1].id
+
+
+@pytest.mark.django_db
+def test_estimated_count_paginator_count(mocker):
+    """Test `shortener.pagination.EstimatedCountPaginator`.
+
+    Check that big tables are estimated, small ones are counted and filtered rows are counted up to the limit.
+    """
+    urls = URLFactory.create_batch(5)
+    URL.objects.filter(id=urls[1].id).delete()
+    queryset = URL.objects.order_by("id")
+
+    assert EstimatedCountPaginator(queryset, 2).count == 4
+    mocker.patch.object(EstimatedCountPaginator, "max_count", 3)
+    assert EstimatedCountPaginator(queryset, 2).count == urls[-1].id
+    assert EstimatedCountPaginator(queryset.filter(use_count=0), 2).count == 3
+
+
+@pytest.mark.django_db
+def test_estimated_count_paginator_page():
+    """Test `shortener.pagination.EstimatedCountPaginator.page`. Check that rows of the page keep their order."""
+    urls = URLFactory.create_batch(5)
+    paginator = EstimatedCountPaginator(URL.objects.order_by("-id"), 2)
+    assert paginator.count == 5
+
+    # Ids of the page and then its rows.
+    with pytest_django.asserts.assertNumQueries(2):
+        page = list(paginator.page(2).object_list)
+    assert page == [urls[2], urls[1]]
+
+
+@pytest.mark.parametrize(
+    "search, expected",
+    [
+        ("abc", ["abcde", "abcxy"]),
+        ("ABC", ["ABCDE"]),
+        ("abcde", ["abcde"]),
+        ("HTTPS://Example.com/path", ["fghij"]),
+        ("example", []),
+    ],
+)
+@pytest.mark.django_db
+def test_url_admin_search(admin_client, search, expected):
+    """Test `shortener.admin.URLAdmin.get_search_results`. Check that URLs are found by shortcut prefix or original."""
+    URLFactory(shortcut="abcde", original="https://other.com/")
+    URLFactory(shortcut="abcxy", original="https://other.com/")
+    URLFactory(shortcut="ABCDE", original="https://other.com/")
+    URLFactory(shortcut="fghij", original="https://example.com/path")
+
+    response = admin_client.get(reverse(CHANGELIST_VIEW_NAME), {"q": search})
+
+    assert response.status_code == 200
+    assert sorted(url.shortcut for url in response.context["cl"].result_list) == sorted(expected)
+
+
+@pytest.mark.django_db
+def test_url_admin_search_original(admin_client, settings):
+    """Test `shortener.admin.URLAdmin.get_search_results`. Check that originals can be searched by substrings."""
+    settings.SHORTENER_ADMIN_SEARCH_ORIGINAL = True
+    URLFactory(shortcut="abcde", original="https://example.com/path")
+    URLFactory(shortcut="fghij", original="https://other.com/")
+
+    response = admin_client.get(reverse(CHANGELIST_VIEW_NAME), {"q": "example"})
+
+    assert [url.shortcut for url in response.context["cl"].result_list] == ["abcde"]
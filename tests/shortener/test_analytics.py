@@ -0,0 +1,181 @@
+import time
+from datetime import datetime, timezone
+
+import freezegun
+import pytest
+from django.urls import reverse
+
+from shortener import analytics
+from shortener.models import ClickBucket
+
+URL_STATS_VIEW_NAME = "url-stats"
+RESOLVE_URL_VIEW_NAME = "resolve-url"
+# 2023-09-06 11:19:00 UTC
+TIMESTAMP = int(datetime(2023, 9, 6, 11, 19, tzinfo=timezone.utc).timestamp())
+
+
+@pytest.fixture
+def click_log(settings, tmp_path):
+    settings.SHORTENER_CLICK_LOG = str(tmp_path / "clicks.log")
+    settings.SHORTENER_CLICK_LOG_MAX_PENDING = 1000
+    settings.SHORTENER_CLICK_LOG_FLUSH_INTERVAL = 60
+    return tmp_path / "clicks.log"
+
+
+def test_click_log_writes_in_batches(tmp_path):
+    """Test `shortener.analytics.ClickLog`. Check that events are appended to the file once there are enough of them."""
+    path = tmp_path / "clicks.log"
+    log = analytics.ClickLog(path, max_pending=3, flush_interval=60)
+
+    log.record("first", TIMESTAMP)
+    log.record("second", TIMESTAMP)
+    assert not path.exists()
+
+    log.record("first", TIMESTAMP + 1)
+    assert path.read_text() == f"first {TIMESTAMP}\nsecond {TIMESTAMP}\nfirst {TIMESTAMP + 1}\n"
+    assert log.flush() == 0
+
+
+def test_click_log_background_flush(tmp_path):
+    """Test `shortener.analytics.ClickLog.start`. Check that events are written by the thread, even without new ones."""
+    path = tmp_path / "clicks.log"
+    log = analytics.ClickLog(path, max_pending=1, flush_interval=0.05)
+
+    log.record("first", TIMESTAMP, background=True)
+    assert not path.exists()
+
+    log.start()
+    deadline = time.monotonic() + 5
+    while not path.exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert path.read_text() == f"first {TIMESTAMP}\n"
+
+    log.max_pending = 1000
+    log.record("second", TIMESTAMP)
+    log.stop()
+    assert path.read_text() == f"first {TIMESTAMP}\nsecond {TIMESTAMP}\n"
+
+
+def test_record_click_disabled(settings):
+    """Test `shortener.analytics.record_click`. Check that nothing is recorded when click log is not configured."""
+    settings.SHORTENER_CLICK_LOG = None
+    analytics.record_click("testtest")
+    assert analytics.get_click_log() is None
+
+
+@pytest.mark.django_db
+def test_rollup_clicks(click_log):
+    """Test `shortener.analytics.rollup_clicks`. Check that events are counted in hourly and daily buckets."""
+    click_log.write_text(
+        f"first {TIMESTAMP}\nfirst {TIMESTAMP + 60}\nfirst {TIMESTAMP + 3600}\nsecond {TIMESTAMP}\nmalformed\n"
+    )
+
+    assert analytics.rollup_clicks(click_log, grace_period=0) == 4
+
+    hour = datetime(2023, 9, 6, 11, tzinfo=timezone.utc)
+    day = datetime(2023, 9, 6, tzinfo=timezone.utc)
+    assert set(ClickBucket.objects.values_list("shortcut", "granularity", "start", "count")) == {
+        ("first", ClickBucket.HOUR, hour, 2),
+        ("first", ClickBucket.HOUR, hour.replace(hour=12), 1),
+        ("first", ClickBucket.DAY, day, 3),
+        ("second", ClickBucket.HOUR, hour, 1),
+        ("second", ClickBucket.DAY, day, 1),
+    }
+    assert list(click_log.parent.iterdir()) == []
+
+
+@pytest.mark.django_db
+def test_rollup_clicks_adds_to_existing_buckets(click_log):
+    """Test `shortener.analytics.rollup_clicks`. Check that counts of consecutive rollups are summed up."""
+    ClickBucket.objects.create(
+        shortcut="first", granularity=ClickBucket.DAY, start=datetime(2023, 9, 6, tzinfo=timezone.utc), count=5
+    )
+    click_log.write_text(f"first {TIMESTAMP}\n")
+
+    analytics.rollup_clicks(click_log, grace_period=0)
+
+    assert ClickBucket.objects.get(shortcut="first", granularity=ClickBucket.DAY).count == 6
+
+
+@pytest.mark.django_db
+def test_rollup_clicks_processes_leftover_file(click_log):
+    """Test `shortener.analytics.rollup_clicks`. Check that file left by a failed rollup is processed first."""
+    click_log.with_name(click_log.name + analytics.PROCESSING_SUFFIX).write_text(f"first {TIMESTAMP}\n")
+    click_log.write_text(f"second {TIMESTAMP}\n")
+
+    assert analytics.rollup_clicks(click_log, grace_period=0) == 1
+    assert analytics.rollup_clicks(click_log, grace_period=0) == 1
+    assert analytics.rollup_clicks(click_log, grace_period=0) == 0
+    assert set(ClickBucket.objects.values_list("shortcut", flat=True)) == {"first", "second"}
+
+
+@pytest.mark.django_db
+def test_resolve_url_records_click(client, click_log, url_object):
+    """Test that redirect appends click event to the click log."""
+    client.get(reverse(RESOLVE_URL_VIEW_NAME, args=(url_object.shortcut,)))
+    analytics.get_click_log().flush()
+
+    shortcut, _ = click_log.read_text().split()
+    assert shortcut == url_object.shortcut
+
+
+@pytest.mark.django_db
+def test_get_stats(client, url_object):
+    """Test that stats endpoint returns buckets of given granularity from the requested period."""
+    for hour, count in [(9, 1), (10, 2), (11, 3)]:
+        ClickBucket.objects.create(
+            shortcut=url_object.shortcut,
+            granularity=ClickBucket.HOUR,
+            start=datetime(2023, 9, 6, hour, tzinfo=timezone.utc),
+            count=count,
+        )
+    ClickBucket.objects.create(
+        shortcut="other", granularity=ClickBucket.HOUR, start=datetime(2023, 9, 6, 10, tzinfo=timezone.utc), count=1
+    )
+
+    response = client.get(
+        reverse(URL_STATS_VIEW_NAME, args=(url_object.shortcut,)),
+        {"since": "2023-09-06T10:00:00Z", "until": "2023-09-06T12:00:00Z"},
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "shortcut": url_object.shortcut,
+        "granularity": "hour",
+        "buckets": [{"start": "2023-09-06T10:00:00Z", "count": 2}, {"start": "2023-09-06T11:00:00Z", "count": 3}],
+    }
+
+
+@pytest.mark.django_db
+@freezegun.freeze_time("2023-09-06 11:19:00")
+def test_get_stats_default_period(client, url_object):
+    """Test that daily stats from the last 30 days are returned by default for the day granularity."""
+    for day in [(2023, 8, 1), (2023, 8, 8), (2023, 9, 6)]:
+        ClickBucket.objects.create(
+            shortcut=url_object.shortcut,
+            granularity=ClickBucket.DAY,
+            start=datetime(*day, tzinfo=timezone.utc),
+            count=1,
+        )
+
+    response = client.get(reverse(URL_STATS_VIEW_NAME, args=(url_object.shortcut,)), {"granularity": "day"})
+
+    assert [bucket["start"] for bucket in response.json()["buckets"]] == [
+        "2023-08-08T00:00:00Z",
+        "2023-09-06T00:00:00Z",
+    ]
+
+
+@pytest.mark.django_db
+def test_get_stats_invalid_query(client, url_object):
+    """Test that error is returned for unknown granularity."""
+    response = client.get(reverse(URL_STATS_VIEW_NAME, args=(url_object.shortcut,)), {"granularity": "week"})
+    assert response.status_code == 400
+    assert "granularity" in response.json()
+
+
+@pytest.mark.django_db
+def test_get_stats_not_found(client):
+    """Test that 404 is returned for stats of a non-existent shortcut."""
+    response = client.get(reverse(URL_STATS_VIEW_NAME, args=("missing",)))
+    assert response.status_code == 404
@@ -0,0 +1,250 @@
+import io
+import json
+from datetime import timedelta
+
+import freezegun
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.management import CommandError, call_command
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+
+from shortener import archive, counters, resolvers, shortcuts
+from shortener.cache import get_url_cache
+from shortener.factories import URLFactory
+from shortener.models import URL, ArchivedURL, ClickBucket
+from shortener.serializers import URLSerializer
+
+
+@pytest.fixture
+def archive_enabled(settings):
+    settings.SHORTENER_ARCHIVE_ENABLED = True
+
+
+def archive_url(url: URL) -> None:
+    assert archive.archive_urls(Q(id=url.id), after_id=0, batch_size=10) == [url.id]
+
+
+@pytest.mark.django_db
+def test_archive_urls_command(archive_enabled):
+    """Test `archive_urls` command. Check that URLs unused or never used for long enough are moved to the archive."""
+    now = timezone.now()
+    old = now - timedelta(days=200)
+    accessed_long_ago = URLFactory(shortcut="aaaaa", last_accessed=old, created=old, use_count=3)
+    never_accessed = URLFactory(shortcut="bbbbb", created=old)
+    URLFactory(shortcut="ccccc", last_accessed=now - timedelta(days=10), created=old)
+    URLFactory(shortcut="ddddd", created=now - timedelta(days=10))
+
+    call_command("archive_urls", batch_size=1, stdout=io.StringIO())
+
+    assert sorted(URL.objects.values_list("shortcut", flat=True)) == ["ccccc", "ddddd"]
+    archived = ArchivedURL.objects.get(shortcut="aaaaa")
+    assert (archived.id, archived.original, archived.use_count) == (
+        accessed_long_ago.id,
+        accessed_long_ago.original,
+        3,
+    )
+    assert ArchivedURL.objects.get(shortcut="bbbbb").id == never_accessed.id
+
+    call_command("archive_urls", accessed_days=5, created_days=5, stdout=io.StringIO())
+    assert not URL.objects.exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("mode", [counters.SYNC_COUNTING, counters.BUFFERED_COUNTING])
+def test_archive_urls_keeps_uses(settings, mode):
+    """Test `shortener.archive.archive_urls`. Check that uses of URL resolved before it was archived are saved."""
+    settings.SHORTENER_ACCESS_COUNTING = mode
+    settings.SHORTENER_ACCESS_COUNTER_FLUSH_INTERVAL = 60
+    url = URLFactory(use_count=3)
+    resolved = resolvers.resolve_shortcut(url.shortcut)
+    if mode == counters.BUFFERED_COUNTING:
+        counters.get_access_counter().record(url.id, autoflush=False)
+
+    archive_url(url)
+    if mode == counters.SYNC_COUNTING:
+        assert counters.record_use(resolved)
+    else:
+        assert counters.get_access_counter().flush() == 1
+
+    archived = ArchivedURL.objects.get(id=url.id)
+    assert archived.use_count == 4
+    assert archived.last_accessed is not None
+
+
+@pytest.mark.django_db
+def test_archive_urls_command_disabled():
+    """Test `archive_urls` command. Check that URLs aren't archived unless archived URLs are resolved."""
+    with pytest.raises(CommandError):
+        call_command("archive_urls")
+
+
+@pytest.mark.django_db
+def test_redirect_restores_archived_url(settings, client, url_object, shortcut, original_url):
+    """Test that archived URL is redirected to and restored under its id, but only with the archive enabled."""
+    archive_url(url_object)
+    assert client.get(f"/{shortcut}/").status_code == 404
+
+    settings.SHORTENER_ARCHIVE_ENABLED = True
+    # Unknown shortcut has been cached as not found.
+    get_url_cache().clear()
+    response = client.get(f"/{shortcut}/")
+
+    assert response.status_code == 302
+    assert response.url == original_url
+    assert not ArchivedURL.objects.exists()
+    url = URL.objects.get(shortcut=shortcut)
+    assert (url.id, url.use_count) == (url_object.id, 1)
+    assert client.get("/unknown/").status_code == 404
+
+
+@pytest.mark.django_db
+def test_async_resolve_restores_archived_url(archive_enabled, url_object, shortcut):
+    """Test `shortener.resolvers.aresolve_shortcut`. Check that archived URL is restored."""
+    archive_url(url_object)
+
+    assert async_to_sync(resolvers.aresolve_shortcut)(shortcut) == resolvers.to_resolved_url(url_object)
+    assert URL.objects.filter(id=url_object.id).exists()
+
+
+@pytest.mark.django_db
+def test_retrieve_restores_archived_url(archive_enabled, client, url_object, shortcut, original_url):
+    """Test that details of archived URL are returned once it's restored."""
+    archive_url(url_object)
+
+    response = client.get(reverse("url-detail", args=[shortcut]))
+
+    assert response.status_code == 200
+    assert response.json()["url"] == original_url
+    assert URL.objects.filter(id=url_object.id).exists()
+    assert client.get(reverse("url-detail", args=["unknown"])).status_code == 404
+
+
+@pytest.mark.django_db
+def test_batch_resolve_archived_urls(archive_enabled, client, url_object, shortcut, original_url):
+    """Test that archived URLs are resolved in batches, but restored only when their uses are counted."""
+    archive_url(url_object)
+    expected = [{"shortcut": shortcut, "found": True, "url": original_url, "expired": False}]
+
+    response = client.post(reverse("url-batch-resolve"), {"shortcuts": [shortcut]}, content_type="application/json")
+    assert [json.loads(line) for line in b"".join(response.streaming_content).splitlines()] == expected
+    assert ArchivedURL.objects.exists()
+
+    data = {"shortcuts": [shortcut], "record_use": True}
+    response = client.post(reverse("url-batch-resolve"), data, content_type="application/json")
+    assert [json.loads(line) for line in b"".join(response.streaming_content).splitlines()] == expected
+    assert URL.objects.get(id=url_object.id).use_count == 1
+
+
+@pytest.mark.django_db
+def test_restore_url_already_restored(archive_enabled, url_object, shortcut):
+    """Test `shortener.archive.restore_url`. Check that URL restored in the meantime is read from the table of URLs."""
+    assert archive.restore_url(shortcut) == url_object
+    assert archive.restore_url("unknown") is None
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "limits", [{"expires_at": timezone.now() - timedelta(days=1)}, {"max_uses": 2, "use_count": 2}]
+)
+def test_restore_url_unusable(archive_enabled, limits):
+    """Test `shortener.archive.restore_url`. Check that expired or used up URLs aren't restored."""
+    archive_url(URLFactory(shortcut="aaaaa", **limits))
+
+    assert archive.restore_url("aaaaa") is None
+    assert ArchivedURL.objects.filter(shortcut="aaaaa").exists()
+
+
+@pytest.mark.django_db
+def test_existing_shortcuts_include_archived(settings, url_object, shortcut):
+    """Test `shortener.shortcuts.get_existing_shortcuts`. Check that archived shortcuts are taken with the archive."""
+    URLFactory(shortcut="hotto")
+    archive_url(url_object)
+    assert shortcuts.get_existing_shortcuts([shortcut, "hotto", "free1"]) == {"hotto"}
+
+    settings.SHORTENER_ARCHIVE_ENABLED = True
+    assert shortcuts.get_existing_shortcuts([shortcut, "hotto", "free1"]) == {shortcut, "hotto"}
+    assert shortcuts.shortcut_exists(shortcut)
+    assert not shortcuts.shortcut_exists("free1")
+
+
+@pytest.mark.django_db
+def test_random_shortcut_skips_archived(archive_enabled, mocker):
+    """Test `shortener.shortcuts.get_random_shortcut`. Check that archived shortcuts aren't handed out again."""
+    archive_url(URLFactory(shortcut="aaaaa"))
+    mocker.patch("shortener.shortcuts.get_random_candidate", side_effect=["aaaaa", "bbbbb"])
+
+    assert shortcuts.get_random_shortcut() == "bbbbb"
+
+
+@pytest.mark.django_db
+def test_sequence_shortcuts_skip_archived(archive_enabled, mocker):
+    """Test `shortener.shortcuts.allocate_sequence_shortcuts`. Check that archived shortcuts are replaced."""
+    archive_url(URLFactory(shortcut="aaaaa"))
+    mocker.patch.object(shortcuts.SequenceAllocator, "allocate", side_effect=[["aaaaa", "bbbbb"], ["ccccc"]])
+
+    assert shortcuts.allocate_sequence_shortcuts(2) == ["bbbbb", "ccccc"]
+
+
+@pytest.mark.django_db
+def test_export_import_archived_urls(tmp_path):
+    """Test `export_urls` and `import_urls` commands. Check that archived URLs are backed up and restored."""
+    archived = URLFactory(shortcut="aaaaa", use_count=3)
+    URLFactory(shortcut="bbbbb")
+    archive_url(archived)
+    path = str(tmp_path / "urls.ndjson")
+
+    call_command("export_urls", path, stderr=io.StringIO())
+    URL.objects.all().delete()
+    ArchivedURL.objects.all().delete()
+    call_command("import_urls", path, stderr=io.StringIO())
+
+    assert dict(URL.objects.values_list("shortcut", "use_count")) == {"aaaaa": 3, "bbbbb": 0}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("update, expected_original", [(False, "https://example.com/old"), (True, "https://new.com/")])
+def test_import_archived_shortcut(archive_enabled, tmp_path, update, expected_original):
+    """Test `import_urls` command. Check that archived shortcuts are skipped, or replaced by the imported URLs."""
+    archive_url(URLFactory(shortcut="abcde", original="https://example.com/old"))
+    path = tmp_path / "urls.ndjson"
+    path.write_text('{"shortcut": "abcde", "original": "https://new.com/"}\n')
+
+    call_command("import_urls", str(path), update=update, stderr=io.StringIO())
+
+    assert resolvers.get_url("abcde").original == expected_original
+    assert URL.objects.count() == 1
+    assert not ArchivedURL.objects.exists()
+
+
+@pytest.mark.django_db
+@freezegun.freeze_time("2023-09-06 11:19:00")
+def test_purge_archived_urls():
+    """Test `purge_expired_urls` command. Check that expired and used up archived URLs are deleted too."""
+    expired = URLFactory(shortcut="aaaaa", expires_at=timezone.now() - timedelta(hours=1))
+    used_up = URLFactory(shortcut="bbbbb", max_uses=1, use_count=1)
+    active = URLFactory(shortcut="ccccc", expires_at=timezone.now() + timedelta(hours=1))
+    for url in (expired, used_up, active):
+        archive_url(url)
+    ClickBucket.objects.create(shortcut="aaaaa", granularity=ClickBucket.DAY, start=timezone.now())
+
+    call_command("purge_expired_urls", stdout=io.StringIO())
+    assert set(ArchivedURL.objects.values_list("shortcut", flat=True)) == {"bbbbb", "ccccc"}
+    assert not ClickBucket.objects.exists()
+
+    call_command("purge_expired_urls", used_up=True, stdout=io.StringIO())
+    assert list(ArchivedURL.objects.values_list("shortcut", flat=True)) == ["ccccc"]
+
+
+@pytest.mark.django_db
+def test_url_serializer_reuses_archived_url(settings, archive_enabled, url_object):
+    """Test `shortener.serializers.URLSerializer`. Check that archived URL with the same original is restored."""
+    settings.SHORTENER_REUSE_EXISTING_SHORTCUTS = True
+    archive_url(url_object)
+    serializer = URLSerializer(data={"url": url_object.original})
+    serializer.is_valid()
+
+    assert serializer.save() == url_object
+    assert URL.objects.count() == 1
+    assert not ArchivedURL.objects.exists()
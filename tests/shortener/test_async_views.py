@@ -0,0 +1,92 @@
+import pytest
+import pytest_django.asserts
+from asgiref.sync import async_to_sync
+from django.http import Http404
+from django.test import AsyncRequestFactory
+
+from shortener import counters, resolvers
+from shortener.cache import ResolvedURL
+from shortener.factories import URLFactory
+from shortener.views import AsyncResolveURLView
+
+
+def resolve(shortcut: str):
+    """Call `AsyncResolveURLView` and wait until usage is saved in the background."""
+
+    async def call_view():
+        request = AsyncRequestFactory().get(f"/{shortcut}/")
+        try:
+            return await AsyncResolveURLView.as_view()(request, shortcut=shortcut)
+        finally:
+            await counters.wait_for_background_tasks()
+
+    return async_to_sync(call_view)()
+
+
+@pytest.mark.django_db
+def test_async_redirect(shortcut, original_url, url_object):
+    """Test that `AsyncResolveURLView` redirects to the original URL and updates usage in the background."""
+    response = resolve(shortcut)
+
+    assert response.status_code == 302
+    assert response.url == original_url
+    url_object.refresh_from_db()
+    assert url_object.use_count == 1
+    assert url_object.last_accessed is not None
+
+
+@pytest.mark.django_db
+def test_async_redirect_used_up_url(shortcut):
+    """Test that `AsyncResolveURLView` returns 410 once URL has been used max uses times."""
+    url = URLFactory(shortcut=shortcut, max_uses=1)
+
+    assert resolve(shortcut).status_code == 302
+    assert resolve(shortcut).status_code == 410
+    url.refresh_from_db()
+    assert url.use_count == 1
+
+
+@pytest.mark.django_db
+def test_async_redirect_invalid_shortcut(url_object):
+    """Test that `AsyncResolveURLView` raises 404 if non-existing shortcut is attempted to be resolved."""
+    with pytest.raises(Http404):
+        resolve("unknown")
+
+
+@pytest.mark.django_db
+def test_async_redirect_buffered_counting(settings, shortcut, url_object):
+    """Test that in buffered mode `AsyncResolveURLView` only counts usage in memory."""
+    settings.SHORTENER_ACCESS_COUNTING = counters.BUFFERED_COUNTING
+    settings.SHORTENER_ACCESS_COUNTER_FLUSH_INTERVAL = 60
+
+    with pytest_django.asserts.assertNumQueries(1):
+        for _ in range(3):
+            assert resolve(shortcut).status_code == 302
+
+    assert counters.get_access_counter().pending[url_object.id][0] == 3
+    counters.get_access_counter().flush()
+    url_object.refresh_from_db()
+    assert url_object.use_count == 3
+
+
+@pytest.mark.django_db
+def test_aresolve_shortcut_uses_cache(url_object, shortcut, original_url):
+    """Test `shortener.resolvers.aresolve_shortcut`. Check that the database is queried only on a cache miss."""
+    with pytest_django.asserts.assertNumQueries(1):
+        assert async_to_sync(resolvers.aresolve_shortcut)(shortcut) == ResolvedURL(url_object.id, original_url)
+        assert async_to_sync(resolvers.aresolve_shortcut)(shortcut) == ResolvedURL(url_object.id, original_url)
+
+    with pytest_django.asserts.assertNumQueries(1):
+        assert async_to_sync(resolvers.aresolve_shortcut)("unknown") is None
+        assert async_to_sync(resolvers.aresolve_shortcut)("unknown") is None
+
+
+@pytest.mark.django_db
+def test_async_redirect_throttling(settings, shortcut, url_object):
+    """Test that `AsyncResolveURLView` returns 429 to clients over the redirect limit."""
+    settings.SHORTENER_THROTTLE_REDIRECT_RATE = "1/min"
+
+    assert resolve(shortcut).status_code == 302
+    response = resolve(shortcut)
+    assert response.status_code == 429
+    assert response["Retry-After"] == "60"
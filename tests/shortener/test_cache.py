@@ -0,0 +1,129 @@
+from unittest import mock
+
+import pytest
+import pytest_django.asserts
+from asgiref.sync import async_to_sync
+
+from shortener import cache, resolvers
+from shortener.factories import URLFactory
+
+
+def test_local_url_cache_lru_eviction():
+    """Test `shortener.cache.LocalURLCache`. Check that the least recently used entry is evicted first."""
+    url_cache = cache.LocalURLCache(max_size=2, ttl=60, negative_ttl=60)
+    url_cache.set("a", cache.ResolvedURL(1, "https://a.com"))
+    url_cache.set("b", cache.ResolvedURL(2, "https://b.com"))
+    url_cache.get("a")
+    url_cache.set("c", cache.ResolvedURL(3, "https://c.com"))
+
+    assert url_cache.get("a") == cache.ResolvedURL(1, "https://a.com")
+    assert url_cache.get("b") is None
+    assert url_cache.get("c") == cache.ResolvedURL(3, "https://c.com")
+    assert len(url_cache) == 2
+
+
+def test_local_url_cache_ttl():
+    """Test `shortener.cache.LocalURLCache`. Check that positive and negative entries expire after their TTL."""
+    url_cache = cache.LocalURLCache(max_size=10, ttl=60, negative_ttl=5)
+    with mock.patch("time.monotonic", return_value=1000):
+        url_cache.set("found", cache.ResolvedURL(1, "https://a.com"))
+        url_cache.set("missing", cache.NOT_FOUND)
+
+    with mock.patch("time.monotonic", return_value=1010):
+        assert url_cache.get("found") == cache.ResolvedURL(1, "https://a.com")
+        assert url_cache.get("missing") is None
+
+    with mock.patch("time.monotonic", return_value=1061):
+        assert url_cache.get("found") is None
+
+
+def test_tiered_url_cache_backfills_faster_tiers():
+    """Test `shortener.cache.TieredURLCache`. Check that a hit in a slower tier populates the faster one."""
+    fast = cache.LocalURLCache(max_size=10, ttl=60, negative_ttl=60)
+    slow = cache.LocalURLCache(max_size=10, ttl=60, negative_ttl=60)
+    tiered = cache.TieredURLCache(fast, slow)
+    slow.set("a", cache.ResolvedURL(1, "https://a.com"))
+
+    assert tiered.get("a") == cache.ResolvedURL(1, "https://a.com")
+    assert fast.get("a") == cache.ResolvedURL(1, "https://a.com")
+
+    tiered.delete("a")
+    assert fast.get("a") is None
+    assert slow.get("a") is None
+
+
+def test_django_url_cache(settings):
+    """Test `shortener.cache.DjangoURLCache`. Check that entries are stored in the configured Django cache."""
+    settings.CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    url_cache = cache.DjangoURLCache("default", ttl=60, negative_ttl=60)
+    url_cache.set("a", cache.ResolvedURL(1, "https://a.com"))
+    url_cache.set("b", cache.NOT_FOUND)
+
+    assert url_cache.get("a") == cache.ResolvedURL(1, "https://a.com")
+    assert url_cache.get("b") == cache.NOT_FOUND
+
+    url_cache.delete_many(["a", "b"])
+    assert url_cache.get("a") is None
+    assert url_cache.get("b") is None
+
+
+def test_build_url_cache(settings):
+    """Test `shortener.cache.get_url_cache`. Check that cache is rebuilt according to changed settings."""
+    settings.SHORTENER_URL_CACHE_ENABLED = False
+    assert isinstance(cache.get_url_cache(), cache.DummyURLCache)
+
+    settings.SHORTENER_URL_CACHE_ENABLED = True
+    settings.SHORTENER_URL_CACHE_BACKEND = None
+    assert isinstance(cache.get_url_cache(), cache.LocalURLCache)
+
+    settings.SHORTENER_URL_CACHE_BACKEND = "default"
+    assert isinstance(cache.get_url_cache(), cache.TieredURLCache)
+
+
+@pytest.mark.django_db
+def test_resolve_shortcut_uses_cache(url_object, shortcut, original_url):
+    """Test `shortener.resolvers.resolve_shortcut`. Check that the database is queried only on a cache miss."""
+    with pytest_django.asserts.assertNumQueries(1):
+        resolved = resolvers.resolve_shortcut(shortcut)
+    assert resolved == cache.ResolvedURL(url_object.id, original_url)
+
+    with pytest_django.asserts.assertNumQueries(0):
+        assert resolvers.resolve_shortcut(shortcut) == resolved
+
+
+@pytest.mark.django_db
+def test_resolve_shortcut_negative_caching():
+    """Test `shortener.resolvers.resolve_shortcut`. Check that unknown shortcut is cached until URL is created."""
+    with pytest_django.asserts.assertNumQueries(1):
+        assert resolvers.resolve_shortcut("unknown") is None
+    with pytest_django.asserts.assertNumQueries(0):
+        assert resolvers.resolve_shortcut("unknown") is None
+
+    url = URLFactory(shortcut="unknown")
+    assert resolvers.resolve_shortcut("unknown") == cache.ResolvedURL(url.id, url.original)
+
+
+@pytest.mark.django_db
+def test_url_cache_invalidation(url_object, shortcut):
+    """Test `shortener.signals.invalidate_url_cache`. Check that cached URL is dropped when URL is saved or deleted."""
+    resolvers.resolve_shortcut(shortcut)
+
+    url_object.original = "https://changed.com/"
+    url_object.save()
+    assert resolvers.resolve_shortcut(shortcut).original == "https://changed.com/"
+
+    url_object.delete()
+    assert resolvers.resolve_shortcut(shortcut) is None
+
+
+def test_tiered_url_cache_async(settings):
+    """Test `shortener.cache.TieredURLCache`. Check that async API reads through all tiers like the sync one."""
+    settings.CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    fast = cache.LocalURLCache(max_size=10, ttl=60, negative_ttl=60)
+    slow = cache.DjangoURLCache("default", ttl=60, negative_ttl=60)
+    tiered = cache.TieredURLCache(fast, slow)
+
+    async_to_sync(slow.aset)("a", cache.ResolvedURL(1, "https://a.com"))
+    assert async_to_sync(tiered.aget)("a") == cache.ResolvedURL(1, "https://a.com")
+    assert fast.get("a") == cache.ResolvedURL(1, "https://a.com")
+    assert async_to_sync(tiered.aget)("b") is None
@@ -0,0 +1,248 @@
+import importlib
+import io
+import json
+import re
+import threading
+from datetime import datetime, timezone
+
+import freezegun
+import pytest
+from django.apps import apps
+from django.core.management import CommandError, call_command
+from django.db import connection
+
+from shortener import constants, transfer
+from shortener.factories import URLFactory
+from shortener.models import URL, ClickBucket, get_shortcut_key
+from shortener.normalization import hash_url
+
+
+@pytest.mark.django_db
+def test_backfill_original_hashes():
+    """Test `backfill_original_hashes` command. Check that missing hashes are filled in for all URLs."""
+    urls = URLFactory.create_batch(5)
+    URL.objects.filter(id__in=[url.id for url in urls[:3]]).update(original_hash=None)
+
+    call_command("backfill_original_hashes", batch_size=2, stdout=io.StringIO())
+
+    for url in urls:
+        url.refresh_from_db()
+        assert url.original_hash == hash_url(url.original)
+
+
+@pytest.mark.django_db
+def test_backfill_shortcut_keys():
+    """Test `backfill_shortcut_keys` command. Check that missing keys are filled in where shortcuts can be encoded."""
+    urls = [URLFactory(shortcut=shortcut) for shortcut in ("aaaaa", "odd-short", "bbbbb", "ccccc")]
+    URL.objects.update(shortcut_key=None)
+
+    call_command("backfill_shortcut_keys", batch_size=2, stdout=io.StringIO())
+
+    assert dict(URL.objects.values_list("shortcut", "shortcut_key")) == {
+        url.shortcut: get_shortcut_key(url.shortcut) for url in urls
+    }
+    assert URL.objects.filter(shortcut_key__isnull=True).count() == 1
+
+
+@pytest.mark.django_db
+def test_backfill_shortcut_keys_migration(mocker):
+    """Test the data migration of shortcut keys. Check that keys of all existing URLs are filled in."""
+    migration = importlib.import_module("shortener.migrations.0012_backfill_url_shortcut_keys")
+    mocker.patch.object(migration, "BATCH_SIZE", 2)
+    URLFactory.create_batch(5)
+    URL.objects.update(shortcut_key=None)
+
+    migration.backfill_shortcut_keys(apps, mocker.Mock(connection=connection))
+
+    for shortcut, shortcut_key in URL.objects.values_list("shortcut", "shortcut_key"):
+        assert shortcut_key == get_shortcut_key(shortcut)
+
+
+@pytest.mark.django_db
+def test_seed_urls():
+    """Test `seed_urls` command. Check that it creates requested number of URLs with shortcuts of given length."""
+    call_command("seed_urls", 25, length=7, batch_size=10, seed=1, stdout=io.StringIO())
+
+    assert URL.objects.count() == 25
+    assert {len(shortcut) for shortcut in URL.objects.values_list("shortcut", flat=True)} == {7}
+
+
+@pytest.mark.django_db
+def test_rollup_clicks(settings, tmp_path):
+    """Test `rollup_clicks` command. Check that events from the click log end up in the stats."""
+    settings.SHORTENER_CLICK_LOG = str(tmp_path / "clicks.log")
+    (tmp_path / "clicks.log").write_text("testtest 1693999140\n")
+
+    call_command("rollup_clicks", grace_period=0, stdout=io.StringIO())
+
+    assert ClickBucket.objects.filter(shortcut="testtest").count() == 2
+
+
+@pytest.mark.django_db
+@freezegun.freeze_time("2023-09-06 11:19:00")
+def test_purge_expired_urls():
+    """Test `purge_expired_urls` command. Check that only expired URLs are deleted along with their click stats."""
+    expired = URLFactory.create_batch(3, expires_at=datetime(2023, 9, 6, 11, tzinfo=timezone.utc))
+    active = URLFactory(expires_at=datetime(2023, 9, 7, tzinfo=timezone.utc))
+    used_up = URLFactory(max_uses=1, use_count=1)
+    ClickBucket.objects.create(
+        shortcut=expired[0].shortcut, granularity=ClickBucket.DAY, start=datetime(2023, 9, 1, tzinfo=timezone.utc)
+    )
+
+    call_command("purge_expired_urls", batch_size=2, stdout=io.StringIO())
+
+    assert set(URL.objects.all()) == {active, used_up}
+    assert not ClickBucket.objects.exists()
+
+
+@pytest.mark.django_db
+def test_purge_expired_urls_used_up():
+    """Test `purge_expired_urls` command. Check that URLs which reached max uses are deleted with --used-up."""
+    used_up = URLFactory.create_batch(3, max_uses=2, use_count=2)
+    active = [URLFactory(max_uses=2, use_count=1), URLFactory(use_count=5)]
+
+    call_command("purge_expired_urls", batch_size=2, used_up=True, stdout=io.StringIO())
+
+    assert set(URL.objects.all()) == set(active)
+    assert not URL.objects.filter(id__in=[url.id for url in used_up]).exists()
+
+
+@pytest.mark.django_db
+def test_keyspace_stats():
+    """Test `keyspace_stats` command. Check that it reports used shortcuts for every length."""
+    URLFactory(shortcut="abcde")
+    stdout = io.StringIO()
+
+    call_command("keyspace_stats", stdout=stdout)
+
+    lines = stdout.getvalue().splitlines()
+    assert len(lines) == 1 + constants.MAX_SHORTCUT_LENGTH - constants.MIN_SHORTCUT_LENGTH + 1
+    assert lines[1].split()[:3] == ["5", "916,132,832", "1"]
+
+
+def get_url_rows() -> list[tuple]:
+    fields = ["shortcut", "original", "original_hash", "created", "last_accessed", "use_count", "redirect_permanent"]
+    return list(URL.objects.order_by("shortcut").values_list(*fields))
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("extension", [".ndjson", ".csv"])
+def test_export_import_urls(tmp_path, extension):
+    """Test `export_urls` and `import_urls` commands. Check that all URLs are restored from the exported file."""
+    URLFactory.create_batch(4)
+    URLFactory(
+        last_accessed=datetime(2023, 9, 6, tzinfo=timezone.utc), use_count=7, max_uses=10, redirect_permanent=False
+    )
+    URL.objects.update(created=datetime(2023, 1, 1, tzinfo=timezone.utc))
+    expected = get_url_rows()
+    path = str(tmp_path / f"urls{extension}")
+
+    call_command("export_urls", path, chunk_size=2, stderr=io.StringIO())
+    URL.objects.all().delete()
+    call_command("import_urls", path, batch_size=2, stderr=io.StringIO())
+
+    assert get_url_rows() == expected
+
+
+@pytest.mark.django_db
+def test_export_urls_to_stdout():
+    """Test `export_urls` command. Check that URLs are written to stdout as NDJSON by default."""
+    url = URLFactory(redirect_max_age=60)
+    stdout = io.StringIO()
+
+    call_command("export_urls", stdout=stdout, stderr=io.StringIO())
+
+    records = [json.loads(line) for line in stdout.getvalue().splitlines()]
+    assert records == [
+        {
+            "shortcut": url.shortcut,
+            "original": url.original,
+            "created": url.created.isoformat(),
+            "last_accessed": None,
+            "use_count": 0,
+            "expires_at": None,
+            "max_uses": None,
+            "redirect_permanent": None,
+            "redirect_max_age": 60,
+        }
+    ]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("update, expected_original", [(False, "https://example.com/old"), (True, "https://new.com/")])
+def test_import_urls_conflicts(tmp_path, update, expected_original):
+    """Test `import_urls` command. Check that URLs with existing shortcuts are either skipped or updated."""
+    URLFactory(shortcut="abcde", original="https://example.com/old")
+    path = tmp_path / "urls.ndjson"
+    path.write_text(
+        '{"shortcut": "abcde", "original": "https://new.com/"}\n{"shortcut": "fghij", "original": "https://new.com/"}\n'
+    )
+
+    call_command("import_urls", str(path), update=update, stderr=io.StringIO())
+
+    assert URL.objects.get(shortcut="abcde").original == expected_original
+    assert URL.objects.get(shortcut="fghij").original_hash == hash_url("https://new.com/")
+
+
+@pytest.mark.django_db
+def test_import_urls_invalid_record(tmp_path):
+    """Test `import_urls` command. Check that the import stops at an invalid record, pointing at its line."""
+    path = tmp_path / "urls.ndjson"
+    path.write_text('{"shortcut": "abcde", "original": "https://example.com/"}\n{"shortcut": "fghij"}\n')
+
+    with pytest.raises(CommandError, match="urls.ndjson: Line 2: Missing original."):
+        call_command("import_urls", str(path), batch_size=1, stderr=io.StringIO())
+    assert URL.objects.filter(shortcut="abcde").exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "record, error",
+    [
+        ({"shortcut": "abc"}, "Invalid shortcut: 'abc'."),
+        ({"shortcut": "abc/def"}, "Invalid shortcut: 'abc/def'."),
+        ({"shortcut": "admin"}, "Invalid shortcut: 'admin'."),
+        ({"original": "not a url"}, "Invalid original: Enter a valid URL."),
+        ({"max_uses": 0}, "Invalid max_uses: Ensure this value is greater than or equal to 1."),
+        ({"redirect_max_age": -1}, "Invalid redirect_max_age: Ensure this value is greater than or equal to 0."),
+    ],
+)
+def test_import_urls_invalid_values(tmp_path, record, error):
+    """Test `import_urls` command. Check that imported URLs are validated like the ones created with the API."""
+    path = tmp_path / "urls.ndjson"
+    path.write_text(json.dumps({"shortcut": "abcde", "original": "https://example.com/", **record}))
+
+    with pytest.raises(CommandError, match=re.escape(f"Line 1: {error}")):
+        call_command("import_urls", str(path), stderr=io.StringIO())
+    assert not URL.objects.exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_export_import_urls_parallel(tmp_path, mocker):
+    """Test `export_urls` and `import_urls` commands. Check that id ranges are exported and imported in parallel."""
+    URLFactory.create_batch(10)
+    expected = get_url_rows()
+    path = tmp_path / "urls.ndjson"
+
+    call_command("export_urls", str(path), workers=3, chunk_size=2, stderr=io.StringIO())
+    parts = sorted(tmp_path.glob("urls-*.ndjson"))
+    URL.objects.all().delete()
+    # Concurrent writes to the in-memory test database fail with "table is locked" instead of waiting for each other.
+    lock = threading.Lock()
+    import_urls = transfer.import_urls
+
+    def import_locked(*args):
+        with lock:
+            import_urls(*args)
+
+    mocker.patch("shortener.transfer.import_urls", side_effect=import_locked)
+    call_command("import_urls", *map(str, parts), workers=3, stderr=io.StringIO())
+
+    assert len(parts) == 3
+    assert get_url_rows() == expected
+
+
+def test_original_search_index_postgresql_only():
+    """Test `original_search_index` command. Check that it refuses to run on databases without trigram indexes."""
+    with pytest.raises(CommandError, match="PostgreSQL only"):
+        call_command("original_search_index", stdout=io.StringIO())
@@ -0,0 +1,98 @@
+from datetime import datetime, timezone
+
+import pytest
+import pytest_django.asserts
+from django.core.exceptions import ImproperlyConfigured
+from django.urls import reverse
+
+from shortener import counters
+from shortener.factories import URLFactory
+
+
+@pytest.mark.django_db
+def test_bulk_update_usage():
+    """Test `shortener.counters.bulk_update_usage`. Check that usage of all URLs is saved in a single query."""
+    first, second = URLFactory(), URLFactory(use_count=3)
+    accessed_at = datetime(2023, 9, 6, 11, 19, tzinfo=timezone.utc)
+
+    with pytest_django.asserts.assertNumQueries(1):
+        updated = counters.bulk_update_usage({first.id: (2, accessed_at), second.id: (5, accessed_at)})
+
+    assert updated == 2
+    first.refresh_from_db()
+    second.refresh_from_db()
+    assert (first.use_count, first.last_accessed) == (2, accessed_at)
+    assert (second.use_count, second.last_accessed) == (8, accessed_at)
+
+
+@pytest.mark.django_db
+def test_bulk_update_usage_keeps_newer_last_accessed():
+    """Test `shortener.counters.bulk_update_usage`. Check that date of last access is never moved backwards."""
+    newer = datetime(2023, 9, 7, tzinfo=timezone.utc)
+    url = URLFactory(last_accessed=newer)
+
+    counters.bulk_update_usage({url.id: (1, datetime(2023, 9, 6, tzinfo=timezone.utc))})
+
+    url.refresh_from_db()
+    assert url.last_accessed == newer
+    assert url.use_count == 1
+
+
+@pytest.mark.django_db
+def test_access_counter_aggregates_until_flush():
+    """Test `shortener.counters.AccessCounter`. Check that uses are summed up in memory and saved on flush."""
+    url = URLFactory()
+    counter = counters.AccessCounter(max_pending=100, flush_interval=60)
+
+    with pytest_django.asserts.assertNumQueries(0):
+        for _ in range(3):
+            counter.record(url.id)
+
+    assert counter.pending[url.id][0] == 3
+    assert counter.flush() == 1
+    assert counter.pending == {}
+    url.refresh_from_db()
+    assert url.use_count == 3
+    assert url.last_accessed is not None
+
+
+@pytest.mark.django_db
+def test_access_counter_flushes_on_max_pending():
+    """Test `shortener.counters.AccessCounter`. Check that pending data is flushed once there are enough URLs."""
+    urls = URLFactory.create_batch(3)
+    counter = counters.AccessCounter(max_pending=3, flush_interval=60)
+
+    for url in urls[:2]:
+        counter.record(url.id)
+    assert len(counter.pending) == 2
+
+    counter.record(urls[2].id)
+    assert counter.pending == {}
+    for url in urls:
+        url.refresh_from_db()
+        assert url.use_count == 1
+
+
+@pytest.mark.django_db
+def test_redirect_buffered_counting(client, settings, shortcut, url_object):
+    """Test that in buffered mode redirect doesn't update the URL until counter is flushed."""
+    settings.SHORTENER_ACCESS_COUNTING = counters.BUFFERED_COUNTING
+    settings.SHORTENER_ACCESS_COUNTER_FLUSH_INTERVAL = 60
+
+    for _ in range(2):
+        response = client.get(reverse("resolve-url", args=(shortcut,)), follow=False)
+        assert response.status_code == 302
+
+    url_object.refresh_from_db()
+    assert url_object.use_count == 0
+
+    counters.get_access_counter().flush()
+    url_object.refresh_from_db()
+    assert url_object.use_count == 2
+
+
+def test_record_access_invalid_mode(settings):
+    """Test `shortener.counters.record_access`. Check that unknown counting mode is reported."""
+    settings.SHORTENER_ACCESS_COUNTING = "invalid"
+    with pytest.raises(ImproperlyConfigured):
+        counters.record_access(1)
@@ -0,0 +1,259 @@
+import io
+from datetime import datetime, timezone
+from unittest import mock
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core import signals
+from django.core.asgi import get_asgi_application
+from django.core.wsgi import get_wsgi_application
+from django.db import close_old_connections
+
+from shortener import counters, fastpath, metrics, throttling
+from shortener.factories import URLFactory
+
+
+@pytest.fixture(autouse=True)
+def keep_db_connections():
+    """Don't close connections (and so break test transactions) at the end of the request, like Django test client."""
+    signals.request_started.disconnect(close_old_connections)
+    signals.request_finished.disconnect(close_old_connections)
+    yield
+    signals.request_started.connect(close_old_connections)
+    signals.request_finished.connect(close_old_connections)
+
+
+def wsgi_get(application, path: str, method: str = "GET"):
+    environ = {"REQUEST_METHOD": method, "PATH_INFO": path, "HTTP_HOST": "testserver", "wsgi.input": io.BytesIO()}
+    start_response = mock.Mock()
+    body = b"".join(application(environ, start_response))
+    status, headers = start_response.call_args.args
+    return status, dict(headers), body
+
+
+def asgi_get(application, path: str, method: str = "GET"):
+    scope = {"type": "http", "method": method, "path": path, "headers": [(b"host", b"testserver")]}
+    messages = []
+
+    async def call():
+        async def send(message):
+            messages.append(message)
+
+        await application(scope, mock.AsyncMock(return_value={"type": "http.request", "body": b""}), send)
+        await counters.wait_for_background_tasks()
+
+    async_to_sync(call)()
+    return messages[0]["status"], dict(messages[0].get("headers", []))
+
+
+def fallback_wsgi(environ, start_response):
+    start_response("404 Not Found", [("Content-Type", "text/plain")])
+    return [b"fallback"]
+
+
+async def fallback_asgi(scope, receive, send):
+    await send({"type": "http.response.start", "status": 404, "headers": []})
+    await send({"type": "http.response.body", "body": b"fallback"})
+
+
+@pytest.mark.parametrize(
+    "method, path, expected",
+    [
+        ("GET", "/abcde/", "abcde"),
+        ("HEAD", "/abc-_1/", "abc-_1"),
+        ("POST", "/abcde/", None),
+        ("GET", "/abcde", None),
+        ("GET", "/urls/abcde/", None),
+        ("GET", "/admin/", None),
+        ("GET", "/metrics/", None),
+        ("GET", "/urls/", None),
+        ("GET", "/abcd/", None),
+        ("GET", "/abcdefghijk/", None),
+    ],
+)
+def test_match_shortcut(method, path, expected):
+    """Test `shortener.fastpath.match_shortcut`. Check that only shortcut redirects are handled by the fast path."""
+    assert fastpath.match_shortcut(method, path) == expected
+
+
+@pytest.mark.django_db
+def test_wsgi_fast_path_redirect(shortcut, original_url, url_object):
+    """Test `shortener.fastpath.RedirectFastPath`. Check that redirect is served without the wrapped application."""
+    fallback = mock.Mock(side_effect=fallback_wsgi)
+    status, headers, body = wsgi_get(fastpath.RedirectFastPath(fallback), f"/{shortcut}/")
+
+    assert status == "302 Found"
+    assert headers["Location"] == original_url
+    assert headers["Cache-Control"] == "no-store"
+    assert body == b""
+    fallback.assert_not_called()
+    url_object.refresh_from_db()
+    assert url_object.use_count == 1
+
+
+@pytest.mark.django_db
+def test_wsgi_fast_path_records_latency(shortcut, url_object):
+    """Test `shortener.fastpath.RedirectFastPath`. Check that latency of served redirects is recorded."""
+    before = metrics.REQUEST_DURATION.get_count("resolve-url", "GET", "302")
+    wsgi_get(fastpath.RedirectFastPath(fallback_wsgi), f"/{shortcut}/")
+    assert metrics.REQUEST_DURATION.get_count("resolve-url", "GET", "302") == before + 1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("path", ["/unknown/", "/urls/"])
+def test_wsgi_fast_path_fallback(path, url_object):
+    """Test `shortener.fastpath.RedirectFastPath`. Check that other requests are passed to the wrapped application."""
+    status, _, body = wsgi_get(fastpath.RedirectFastPath(fallback_wsgi), path)
+    assert status == "404 Not Found"
+    assert body == b"fallback"
+
+
+@pytest.mark.django_db
+def test_wsgi_fast_path_falls_back_on_error(shortcut, url_object):
+    """Test `shortener.fastpath.RedirectFastPath`. Check that request is passed on if the fast path fails."""
+    with mock.patch("shortener.resolvers.resolve_shortcut", side_effect=RuntimeError):
+        status, _, body = wsgi_get(fastpath.RedirectFastPath(fallback_wsgi), f"/{shortcut}/")
+    assert body == b"fallback"
+
+
+@pytest.mark.django_db
+def test_wsgi_fast_path_skips_routes(settings, django_assert_num_queries):
+    """Test `shortener.fastpath.RedirectFastPath`. Check that other routes reach Django without a query or a token."""
+    settings.SHORTENER_THROTTLE_REDIRECT_RATE = "1/min"
+    application = fastpath.RedirectFastPath(fallback_wsgi)
+    with django_assert_num_queries(0):
+        for _ in range(2):
+            _, _, body = wsgi_get(application, "/urls/")
+            assert body == b"fallback"
+    assert throttling.check(throttling.REDIRECT, "") == 0
+
+
+@pytest.mark.django_db
+def test_wsgi_fast_path_error_after_recorded_use(shortcut, url_object):
+    """Test `shortener.fastpath.RedirectFastPath`. Check that request isn't passed on once its use has been recorded."""
+    with mock.patch("shortener.analytics.record_click", side_effect=RuntimeError):
+        status, _, body = wsgi_get(fastpath.RedirectFastPath(fallback_wsgi), f"/{shortcut}/")
+    assert status == "500 Internal Server Error"
+    assert body == b""
+    url_object.refresh_from_db()
+    assert url_object.use_count == 1
+
+
+@pytest.mark.django_db
+def test_wsgi_fast_path_falls_back_for_expired_url(shortcut):
+    """Test `shortener.fastpath.RedirectFastPath`. Check that error response for expired URL is left to Django."""
+    URLFactory(shortcut=shortcut, expires_at=datetime(2023, 9, 6, tzinfo=timezone.utc))
+    _, _, body = wsgi_get(fastpath.RedirectFastPath(fallback_wsgi), f"/{shortcut}/")
+    assert body == b"fallback"
+
+
+@pytest.mark.django_db
+def test_wsgi_fast_path_redirect_cache_policy(shortcut, original_url):
+    """Test `shortener.fastpath.RedirectFastPath`. Check that redirect follows the URL's cache policy."""
+    URLFactory(shortcut=shortcut, original=original_url, redirect_permanent=True, redirect_max_age=60)
+    status, headers, _ = wsgi_get(fastpath.RedirectFastPath(fallback_wsgi), f"/{shortcut}/")
+    assert status == "301 Moved Permanently"
+    assert headers["Cache-Control"] == "public, max-age=60"
+
+
+@pytest.mark.django_db
+def test_asgi_fast_path_redirect(shortcut, original_url, url_object):
+    """Test `shortener.fastpath.AsyncRedirectFastPath`. Check that redirect is served without the wrapped app."""
+    status, headers = asgi_get(fastpath.AsyncRedirectFastPath(fallback_asgi), f"/{shortcut}/")
+
+    assert status == 302
+    assert headers[b"location"] == original_url.encode()
+    url_object.refresh_from_db()
+    assert url_object.use_count == 1
+
+
+@pytest.mark.django_db
+def test_asgi_fast_path_fallback(url_object):
+    """Test `shortener.fastpath.AsyncRedirectFastPath`. Check that unknown shortcuts are passed to the wrapped app."""
+    status, _ = asgi_get(fastpath.AsyncRedirectFastPath(fallback_asgi), "/unknown/")
+    assert status == 404
+
+
+@pytest.mark.django_db
+def test_asgi_fast_path_error_after_recorded_use(shortcut, url_object):
+    """Test `shortener.fastpath.AsyncRedirectFastPath`. Check that request isn't passed on once its use is recorded."""
+    with mock.patch("shortener.analytics.record_click", side_effect=RuntimeError):
+        status, _ = asgi_get(fastpath.AsyncRedirectFastPath(fallback_asgi), f"/{shortcut}/")
+    assert status == 500
+    url_object.refresh_from_db()
+    assert url_object.use_count == 1
+
+
+def test_wrap_application(settings):
+    """Test `shortener.fastpath.wrap_wsgi_application`. Check that the fast path is used only if it's enabled."""
+    settings.SHORTENER_REDIRECT_FAST_PATH = False
+    assert fastpath.wrap_wsgi_application(fallback_wsgi) is fallback_wsgi
+    assert fastpath.wrap_asgi_application(fallback_asgi) is fallback_asgi
+
+    settings.SHORTENER_REDIRECT_FAST_PATH = True
+    assert isinstance(fastpath.wrap_wsgi_application(fallback_wsgi), fastpath.RedirectFastPath)
+    assert isinstance(fastpath.wrap_asgi_application(fallback_asgi), fastpath.AsyncRedirectFastPath)
+
+
+@pytest.mark.django_db
+def test_wsgi_fast_path_throttling(settings, shortcut, url_object):
+    """Test `shortener.fastpath.RedirectFastPath`. Check that redirects over the limit get 429 without Django."""
+    settings.SHORTENER_THROTTLE_REDIRECT_RATE = "1/s"
+    application = fastpath.RedirectFastPath(fallback_wsgi)
+
+    assert wsgi_get(application, f"/{shortcut}/")[0] == "302 Found"
+    status, headers, _ = wsgi_get(application, f"/{shortcut}/")
+    assert status == "429 Too Many Requests"
+    assert headers["Retry-After"] == "1"
+    url_object.refresh_from_db()
+    assert url_object.use_count == 1
+
+
+@pytest.mark.django_db
+def test_asgi_fast_path_throttling(settings, shortcut, url_object):
+    """Test `shortener.fastpath.AsyncRedirectFastPath`. Check that redirects over the limit get 429 without Django."""
+    settings.SHORTENER_THROTTLE_REDIRECT_RATE = "1/s"
+    application = fastpath.AsyncRedirectFastPath(fallback_asgi)
+
+    assert asgi_get(application, f"/{shortcut}/")[0] == 302
+    status, headers = asgi_get(application, f"/{shortcut}/")
+    assert status == 429
+    assert headers[b"retry-after"] == b"1"
+
+
+@pytest.mark.django_db
+def test_fast_path_throttles_before_lookup(settings, shortcut, url_object):
+    """Test `shortener.fastpath.RedirectFastPath`.
+
+    Check that throttled clients don't get to look shortcuts up, and that requests passed to Django take a single token.
+    """
+    settings.SHORTENER_THROTTLE_REDIRECT_RATE = "2/s"
+    application = fastpath.RedirectFastPath(get_wsgi_application())
+
+    assert wsgi_get(application, "/unknown/")[0] == "404 Not Found"
+    assert wsgi_get(application, f"/{shortcut}/")[0] == "302 Found"
+    with mock.patch("shortener.resolvers.resolve_shortcut") as resolve_shortcut:
+        assert wsgi_get(application, "/unknown/")[0] == "429 Too Many Requests"
+    resolve_shortcut.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_asgi_fast_path_throttles_before_lookup(settings, shortcut, url_object):
+    """Test `shortener.fastpath.AsyncRedirectFastPath`.
+
+    Check that throttled clients don't get to look shortcuts up, and that requests passed to Django take a single token.
+    """
+    settings.SHORTENER_THROTTLE_REDIRECT_RATE = "2/s"
+    application = fastpath.AsyncRedirectFastPath(get_asgi_application())
+
+    assert asgi_get(application, "/unknown/")[0] == 404
+    assert asgi_get(application, f"/{shortcut}/")[0] == 302
+    with mock.patch("shortener.resolvers.aresolve_shortcut") as aresolve_shortcut:
+        assert asgi_get(application, "/unknown/")[0] == 429
+    aresolve_shortcut.assert_not_called()
+
+
+def test_get_asgi_meta():
+    """Test `shortener.fastpath.get_asgi_meta`. Check that client address and X-Forwarded-For are taken from scope."""
+    scope = {"client": ("10.0.0.1", 1234), "headers": [(b"host", b"a.com"), (b"x-forwarded-for", b"1.1.1.1")]}
+    assert fastpath.get_asgi_meta(scope) == {"REMOTE_ADDR": "10.0.0.1", "HTTP_X_FORWARDED_FOR": "1.1.1.1"}
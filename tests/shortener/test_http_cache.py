@@ -0,0 +1,32 @@
+import pytest
+
+from shortener import http_cache
+from shortener.cache import ResolvedURL
+
+NOW = 1_693_999_140.0
+
+
+@pytest.mark.parametrize(
+    "url, cache_control",
+    [
+        (ResolvedURL(1, "https://example.com/", redirect_max_age=3600), "public, max-age=3600"),
+        (ResolvedURL(1, "https://example.com/", NOW + 100, redirect_max_age=3600), "public, max-age=100"),
+        (ResolvedURL(1, "https://example.com/", NOW + 7200, redirect_max_age=3600), "public, max-age=3600"),
+        (ResolvedURL(1, "https://example.com/", NOW - 1, redirect_max_age=3600), "no-store"),
+        (ResolvedURL(1, "https://example.com/", max_uses=5, redirect_max_age=3600), "no-store"),
+    ],
+)
+def test_get_redirect_policy_limited_urls(url, cache_control):
+    """Test `shortener.http_cache.get_redirect_policy`. Check that redirect is never cached past URL's limits."""
+    assert http_cache.get_redirect_policy(url, now=NOW).cache_control == cache_control
+
+
+@pytest.mark.django_db
+def test_get_etag(url_object):
+    """Test `shortener.http_cache.get_etag`. Check that ETag changes with usage data and with the variant."""
+    etag = http_cache.get_etag(url_object, "application/json")
+    assert etag.startswith('"') and etag.endswith('"')
+    assert http_cache.get_etag(url_object, "text/html") != etag
+
+    url_object.use_count += 1
+    assert http_cache.get_etag(url_object, "application/json") != etag
@@ -0,0 +1,131 @@
+from unittest import mock
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient
+from django.urls import reverse
+
+from shortener import constants, metrics, shortcuts
+
+RESOLVE_URL_VIEW_NAME = "resolve-url"
+METRICS_VIEW_NAME = "metrics"
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    metrics.REGISTRY.clear()
+    yield
+    metrics.REGISTRY.clear()
+
+
+def test_counter_render():
+    """Test `shortener.metrics.Counter`. Check that values are rendered per labels, with escaped label values."""
+    counter = metrics.Counter("test_total", "Test counter.", ("result",))
+    counter.inc("hit")
+    counter.inc("hit", amount=2)
+    counter.inc('mi"ss')
+
+    assert counter.render() == (
+        "# HELP test_total Test counter.\n"
+        "# TYPE test_total counter\n"
+        'test_total{result="hit"} 3\n'
+        'test_total{result="mi\\"ss"} 1'
+    )
+
+
+def test_histogram_render():
+    """Test `shortener.metrics.Histogram`. Check that buckets are rendered as cumulative counts with sum and count."""
+    histogram = metrics.Histogram("test_seconds", "Test histogram.", buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value)
+
+    assert histogram.render().splitlines()[2:] == [
+        'test_seconds_bucket{le="0.1"} 2',
+        'test_seconds_bucket{le="1"} 3',
+        'test_seconds_bucket{le="+Inf"} 4',
+        "test_seconds_sum 3.65",
+        "test_seconds_count 4",
+    ]
+
+
+def test_metric_wrong_labels():
+    """Test `shortener.metrics.Counter`. Check that values must have exactly the declared labels."""
+    with pytest.raises(ValueError):
+        metrics.Counter("test_total", "Test counter.", ("result",)).inc()
+
+
+@pytest.mark.django_db
+def test_middleware_records_requests(client, shortcut, url_object):
+    """Test `shortener.middleware.MetricsMiddleware`. Check that latency and queries are recorded per view."""
+    client.get(reverse(RESOLVE_URL_VIEW_NAME, args=(shortcut,)))
+    client.get(reverse(RESOLVE_URL_VIEW_NAME, args=(shortcut,)))
+    client.get("/unknown/path/")
+    client.generic("FOO", "/unknown/path/")
+
+    assert metrics.REQUEST_DURATION.get_count("resolve-url", "GET", "302") == 2
+    assert metrics.REQUEST_DURATION.get_count("unmatched", "GET", "404") == 1
+    assert metrics.REQUEST_DURATION.get_count("unmatched", "other", "404") == 1
+    # SELECT + UPDATE for the first request and only UPDATE for the second, cached one.
+    assert metrics.DB_QUERIES.get_count("resolve-url") == 2
+    assert metrics.DB_QUERIES.get_sum("resolve-url") == 3
+    assert metrics.URL_CACHE_LOOKUPS.get("hit") == 1
+    assert metrics.URL_CACHE_LOOKUPS.get("miss") == 1
+
+
+@pytest.mark.django_db
+def test_metrics_view(client, shortcut, url_object):
+    """Test that metrics are exposed in the Prometheus text format."""
+    client.get(reverse(RESOLVE_URL_VIEW_NAME, args=(shortcut,)))
+
+    response = client.get(reverse(METRICS_VIEW_NAME))
+
+    assert response.status_code == 200
+    assert response["Content-Type"] == "text/plain; version=0.0.4; charset=utf-8"
+    body = response.content.decode()
+    assert "# TYPE shortener_request_duration_seconds histogram" in body
+    assert 'shortener_request_duration_seconds_count{view="resolve-url",method="GET",status="302"} 1' in body
+    assert 'shortener_url_cache_lookups_total{result="miss"} 1' in body
+
+
+def test_metrics_view_disabled(client, settings):
+    """Test that metrics endpoint doesn't exist when metrics are disabled."""
+    settings.SHORTENER_METRICS_ENABLED = False
+    assert client.get(reverse(METRICS_VIEW_NAME)).status_code == 404
+
+
+@pytest.mark.django_db
+def test_get_random_shortcut_records_attempts(existing_shortcuts):
+    """Test `shortener.shortcuts.get_random_shortcut`. Check that attempts and length escalations are recorded."""
+    random_slugs = existing_shortcuts[: shortcuts.SAME_LENGTH_ATTEMPTS + 1] + ["x" * 6]
+    with mock.patch("shortener.shortcuts.get_random_slug", side_effect=random_slugs):
+        shortcuts.get_random_shortcut()
+
+    assert metrics.SHORTCUT_ATTEMPTS.get_count() == 1
+    assert metrics.SHORTCUT_ATTEMPTS.get_sum() == shortcuts.SAME_LENGTH_ATTEMPTS + 2
+    assert metrics.SHORTCUT_LENGTH_ESCALATIONS.get(str(constants.MIN_SHORTCUT_LENGTH + 1)) == 1
+
+
+@pytest.mark.django_db
+def test_get_random_shortcuts_records_attempts(existing_shortcuts):
+    """Test `shortener.shortcuts.get_random_shortcuts`. Check that attempts and length escalations are recorded."""
+    random_slugs = ["y" * 5] + existing_shortcuts[: shortcuts.SAME_LENGTH_ATTEMPTS] + ["x" * 6]
+    with mock.patch("shortener.shortcuts.get_random_slug", side_effect=random_slugs):
+        shortcuts.get_random_shortcuts(2)
+
+    assert metrics.SHORTCUT_ATTEMPTS.get_count() == 2
+    assert metrics.SHORTCUT_ATTEMPTS.get_sum() == 1 + shortcuts.SAME_LENGTH_ATTEMPTS + 1
+    assert metrics.SHORTCUT_LENGTH_ESCALATIONS.get(str(constants.MIN_SHORTCUT_LENGTH + 1)) == 1
+
+
+@pytest.mark.django_db
+def test_middleware_records_queries_asgi(shortcut, url_object):
+    """Test `shortener.middleware.MetricsMiddleware`. Check that queries of async requests are counted."""
+
+    async def request():
+        return await AsyncClient().get(reverse(RESOLVE_URL_VIEW_NAME, args=(shortcut,)))
+
+    response = async_to_sync(request)()
+
+    assert response.status_code == 302
+    assert metrics.DB_QUERIES.get_count("resolve-url") == 1
+    assert metrics.DB_QUERIES.get_sum("resolve-url") > 0
@@ -1,7 +1,20 @@
 import pytest
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import path
 
+from shortener import resolvers
 from shortener.factories import URLFactory
+from shortener.models import (
+    URL,
+    aget_by_shortcut,
+    get_by_shortcut,
+    get_shortcut_from_key,
+    get_shortcut_key,
+    get_shortcut_lookup,
+    get_shortcuts_filter,
+)
 from tests.utils import mock_url_patterns
 
 
@@ -29,3 +42,74 @@ def test_url_str():
     """Test `shortener.models.URL.__str__`. Check that it returns correct string representation of URL object."""
     url = URLFactory(shortcut="test1", original="https://www.google.com")
     assert str(url) == "test1 (https://www.google.com)"
+
+
+@pytest.mark.parametrize(
+    "shortcut, expected",
+    [
+        ("a", 0),
+        ("9", 61),
+        ("aa", 62),
+        ("ab", 63),
+        ("aaaaa", 62 + 62**2 + 62**3 + 62**4),
+        ("9" * 10, 62**11 // 61 - 2),
+    ],
+)
+def test_get_shortcut_key(shortcut, expected):
+    """Test `shortener.models.get_shortcut_key`. Check that keys of all lengths follow each other and fit in BIGINT."""
+    assert get_shortcut_key(shortcut) == expected
+    assert get_shortcut_key(shortcut) < 2**63
+    assert get_shortcut_from_key(expected) == shortcut
+
+
+@pytest.mark.parametrize("shortcut", ["", "a" * 11, "abc-d", "ábcde"])
+def test_get_shortcut_key_invalid(shortcut):
+    """Test `shortener.models.get_shortcut_key`. Check that shortcuts which can't be encoded have no key."""
+    assert get_shortcut_key(shortcut) is None
+
+
+@pytest.mark.django_db
+def test_url_shortcut_key():
+    """Test `shortener.models.URL.shortcut_key`. Check that it's set on save and bulk create."""
+    assert URLFactory(shortcut="abcde").shortcut_key == get_shortcut_key("abcde")
+    URL.objects.bulk_create([URL(shortcut="fghij", original="https://example.com/"), URL(shortcut="odd-one")])
+    assert dict(URL.objects.values_list("shortcut", "shortcut_key")) == {
+        "abcde": get_shortcut_key("abcde"),
+        "fghij": get_shortcut_key("fghij"),
+        "odd-one": None,
+    }
+
+
+@pytest.mark.parametrize("enabled", [False, True])
+@pytest.mark.django_db
+def test_shortcut_lookups(settings, enabled):
+    """Test `shortener.models.get_shortcut_lookup` and `get_shortcuts_filter`.
+
+    Check that URLs are looked up by keys when enabled, except for shortcuts which can't be encoded.
+    """
+    settings.SHORTENER_SHORTCUT_KEY_LOOKUPS = enabled
+    urls = [URLFactory(shortcut="abcde"), URLFactory(shortcut="odd-one")]
+
+    with CaptureQueriesContext(connection) as queries:
+        assert URL.objects.get(**get_shortcut_lookup("abcde")) == urls[0]
+        assert URL.objects.get(**get_shortcut_lookup("odd-one")) == urls[1]
+        assert list(URL.objects.filter(get_shortcuts_filter(["abcde", "odd-one", "zzzzz"])).order_by("id")) == urls
+    where_clauses = [query["sql"].partition("WHERE")[2] for query in queries]
+    assert ["shortcut_key" in where for where in where_clauses] == [enabled, False, enabled]
+
+
+@pytest.mark.django_db
+def test_lookups_of_urls_without_keys(settings):
+    """Test `shortener.models.get_by_shortcut` and `shortener.resolvers.get_urls`.
+
+    Check that URLs created without keys (e.g. by older processes) are still found when looking up by keys is enabled.
+    """
+    settings.SHORTENER_SHORTCUT_KEY_LOOKUPS = True
+    urls = [URLFactory(shortcut="abcde"), URLFactory(shortcut="fghij")]
+    URL.objects.filter(shortcut="fghij").update(shortcut_key=None)
+
+    assert get_by_shortcut(URL.objects.all(), "fghij") == urls[1]
+    assert async_to_sync(aget_by_shortcut)(URL.objects.all(), "fghij") == urls[1]
+    with pytest.raises(URL.DoesNotExist):
+        get_by_shortcut(URL.objects.all(), "zzzzz")
+    assert sorted(resolvers.get_urls(["abcde", "fghij", "zzzzz"]), key=lambda url: url.id) == urls
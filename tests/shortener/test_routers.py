@@ -0,0 +1,68 @@
+import pytest
+import pytest_django.asserts
+from django.db import transaction
+from django.urls import reverse
+
+from shortener import resolvers, routers
+from shortener.models import URL
+
+URL_DETAIL_VIEW_NAME = "url-detail"
+
+
+@pytest.fixture
+def replicas(settings):
+    """Pretend that the default database is a replica too, so that reads from "replicas" work in tests."""
+    settings.SHORTENER_DATABASE_REPLICAS = ["default"]
+
+
+def test_router_reads_from_primary_by_default(settings):
+    """Test `shortener.routers.PrimaryReplicaRouter`. Check that only reads within `replica_reads` go to replicas."""
+    settings.SHORTENER_DATABASE_REPLICAS = ["replica1", "replica2"]
+    router = routers.PrimaryReplicaRouter()
+
+    assert router.db_for_read(URL) == "default"
+    with routers.replica_reads():
+        assert router.db_for_read(URL) in ("replica1", "replica2")
+        assert router.db_for_write(URL) == "default"
+    assert router.db_for_read(URL) == "default"
+
+
+@pytest.mark.django_db
+def test_router_reads_from_primary_in_transaction(settings):
+    """Test `shortener.routers.PrimaryReplicaRouter`. Check that reads in a transaction see its writes."""
+    settings.SHORTENER_DATABASE_REPLICAS = ["replica1"]
+    with routers.replica_reads():
+        with transaction.atomic():
+            assert routers.PrimaryReplicaRouter().db_for_read(URL) == "default"
+
+
+def test_router_doesnt_migrate_replicas(settings):
+    """Test `shortener.routers.PrimaryReplicaRouter`. Check that migrations are applied only to the primary."""
+    settings.SHORTENER_DATABASE_REPLICAS = ["replica1"]
+    router = routers.PrimaryReplicaRouter()
+    assert router.allow_migrate("default", "shortener")
+    assert not router.allow_migrate("replica1", "shortener")
+
+
+@pytest.mark.django_db
+def test_get_url_falls_back_to_primary(replicas):
+    """Test `shortener.resolvers.get_url`. Check that URL missing on the replica is looked up on the primary."""
+    with pytest_django.asserts.assertNumQueries(2):
+        with pytest.raises(URL.DoesNotExist):
+            resolvers.get_url("unknown")
+
+
+@pytest.mark.django_db
+def test_get_url_from_replica(replicas, url_object, shortcut):
+    """Test `shortener.resolvers.get_url`. Check that URL found on the replica is returned right away."""
+    with pytest_django.asserts.assertNumQueries(1):
+        assert resolvers.get_url(shortcut) == url_object
+
+
+@pytest.mark.django_db
+def test_get_url_details_falls_back_to_primary(client, replicas, url_object, shortcut):
+    """Test that URL details missing on the replica are looked up on the primary."""
+    with pytest_django.asserts.assertNumQueries(1):
+        assert client.get(reverse(URL_DETAIL_VIEW_NAME, args=(shortcut,))).status_code == 200
+    with pytest_django.asserts.assertNumQueries(2):
+        assert client.get(reverse(URL_DETAIL_VIEW_NAME, args=("unknown",))).status_code == 404
@@ -1,9 +1,14 @@
+import datetime
 from unittest import mock
 
 import pytest
+import pytest_django.asserts
 from rest_framework.exceptions import APIException
+from rest_framework.serializers import ModelSerializer
 
+import shortener.serializers
 import shortener.shortcuts
+from shortener.factories import URLFactory
 from shortener.models import URL
 from shortener.serializers import URLSerializer
 
@@ -37,3 +42,214 @@ def test_url_serializer_generation_error():
             serializer.save()
     assert URL.objects.count() == 0
     assert str(exc_info.value) == "test"
+
+
+@pytest.mark.django_db
+def test_url_serializer_retries_on_shortcut_collision(url_object, shortcut):
+    """Test `shortener.serializers.URLSerializer`.
+
+    Check that URL is inserted with a new shortcut if the allocated one already exists.
+    """
+    serializer = URLSerializer(data={"url": "https://example.com/"})
+    serializer.is_valid()
+
+    with mock.patch("shortener.shortcuts.get_shortcut", side_effect=[shortcut, "unique"]):
+        obj = serializer.save()
+
+    assert obj.shortcut == "unique"
+    assert URL.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_url_serializer_gives_up_on_shortcut_collisions(url_object, shortcut):
+    """Test `shortener.serializers.URLSerializer`.
+
+    Check that insert is retried only a limited number of times, and then API error is raised.
+    """
+    serializer = URLSerializer(data={"url": "https://example.com/"})
+    serializer.is_valid()
+
+    side_effect = [shortcut] * shortener.serializers.CREATE_ATTEMPTS
+    with mock.patch("shortener.shortcuts.get_shortcut", side_effect=side_effect):
+        with pytest.raises(APIException, match="Couldn't find a free shortcut"):
+            serializer.save()
+    assert URL.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_bulk_url_serializer_creates_urls_in_batches():
+    """Test `shortener.serializers.BulkURLSerializer`. Check that URLs are inserted in batches with few queries."""
+    data = [{"url": f"https://example.com/{i}"} for i in range(5)]
+    serializer = URLSerializer(data=data, many=True)
+    assert serializer.is_valid()
+
+    get_shortcuts_spy = mock.Mock(wraps=shortener.shortcuts.get_shortcuts)
+    with mock.patch("shortener.constants.BULK_CREATE_BATCH_SIZE", 2):
+        with mock.patch("shortener.shortcuts.get_shortcuts", get_shortcuts_spy):
+            urls = serializer.save()
+
+    get_shortcuts_spy.assert_called_once_with(5)
+    assert [url.original for url in urls] == [item["url"] for item in data]
+    assert all(url.id is not None for url in urls)
+    assert URL.objects.count() == 5
+
+
+@pytest.mark.django_db
+def test_bulk_url_serializer_replaces_colliding_shortcuts(url_object, shortcut):
+    """Test `shortener.serializers.BulkURLSerializer`. Check that shortcuts which are already taken are replaced."""
+    serializer = URLSerializer(data=[{"url": "https://example.com/1"}, {"url": "https://example.com/2"}], many=True)
+    assert serializer.is_valid()
+
+    with mock.patch("shortener.shortcuts.get_shortcuts", side_effect=[[shortcut, "first"], ["second"]]):
+        urls = serializer.save()
+
+    assert sorted(url.shortcut for url in urls) == ["first", "second"]
+    assert URL.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_bulk_url_serializer_redraws_colliding_shortcuts(url_object, shortcut):
+    """Test `shortener.serializers.BulkURLSerializer`.
+
+    Check that only shortcuts which are taken are drawn again, as many times as needed, before the insert.
+    """
+    URLFactory(shortcut="taken")
+    serializer = URLSerializer(data=[{"url": "https://example.com/1"}, {"url": "https://example.com/2"}], many=True)
+    assert serializer.is_valid()
+
+    side_effect = [[shortcut, "first"], ["taken"], [shortcut], ["second"]]
+    with mock.patch("shortener.shortcuts.get_shortcuts", side_effect=side_effect) as get_shortcuts:
+        urls = serializer.save()
+
+    assert sorted(url.shortcut for url in urls) == ["first", "second"]
+    assert [call.args for call in get_shortcuts.call_args_list] == [(2,), (1,), (1,), (1,)]
+
+
+@pytest.mark.django_db
+def test_bulk_url_serializer_gives_up_on_shortcut_collisions(url_object, shortcut):
+    """Test `shortener.serializers.BulkURLSerializer`. Check that API error is raised if shortcuts keep colliding."""
+    serializer = URLSerializer(data=[{"url": "https://example.com/1"}], many=True)
+    assert serializer.is_valid()
+
+    with mock.patch("shortener.shortcuts.get_shortcuts", return_value=[shortcut]):
+        with pytest.raises(APIException, match="Couldn't find free shortcuts"):
+            serializer.save()
+    assert URL.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_url_serializer_reuses_existing_url(settings, url_object):
+    """Test `shortener.serializers.URLSerializer`.
+
+    Check that existing URL with the same normalized original is returned when reusing shortcuts is enabled.
+    """
+    settings.SHORTENER_REUSE_EXISTING_SHORTCUTS = True
+    serializer = URLSerializer(data={"url": "HTTPS://Example.com:443"})
+    serializer.is_valid()
+
+    with pytest_django.asserts.assertNumQueries(1):
+        obj = serializer.save()
+
+    assert obj == url_object
+    assert URL.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_url_serializer_doesnt_reuse_limited_urls(settings, original_url):
+    """Test `shortener.serializers.URLSerializer`. Check that URLs which expire are never reused."""
+    settings.SHORTENER_REUSE_EXISTING_SHORTCUTS = True
+    limited = URLFactory(original=original_url, max_uses=1)
+
+    serializer = URLSerializer(data={"url": original_url})
+    serializer.is_valid()
+    unlimited = serializer.save()
+    serializer = URLSerializer(data={"url": original_url, "max_uses": 1})
+    serializer.is_valid()
+
+    assert unlimited != limited
+    assert serializer.save() not in (limited, unlimited)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("policy", [{"redirect_permanent": False}, {"redirect_max_age": 0}])
+def test_url_serializers_dont_reuse_urls_with_redirect_policy(settings, original_url, policy):
+    """Test `shortener.serializers.URLSerializer`. Check that URLs with their own redirect policy are never reused."""
+    settings.SHORTENER_REUSE_EXISTING_SHORTCUTS = True
+    custom = URLFactory(original=original_url, **policy)
+
+    serializer = URLSerializer(data={"url": original_url})
+    serializer.is_valid()
+    default = serializer.save()
+    serializer = URLSerializer(data=[{"url": original_url, **policy}, {"url": original_url}], many=True)
+    serializer.is_valid()
+    urls = serializer.save()
+
+    assert default != custom
+    assert urls[0] not in (custom, default)
+    assert [getattr(urls[0], name) for name in policy] == list(policy.values())
+    assert urls[1] == default
+
+
+@pytest.mark.django_db
+def test_url_serializer_doesnt_reuse_existing_url_by_default(url_object, original_url):
+    """Test `shortener.serializers.URLSerializer`. Check that a new URL is created for a known original by default."""
+    serializer = URLSerializer(data={"url": original_url})
+    serializer.is_valid()
+    obj = serializer.save()
+
+    assert obj != url_object
+    assert obj.original_hash == url_object.original_hash
+
+
+@pytest.mark.django_db
+def test_bulk_url_serializer_reuses_existing_urls(settings, url_object, original_url):
+    """Test `shortener.serializers.BulkURLSerializer`.
+
+    Check that URLs known from the database or repeated in the same request are created only once.
+    """
+    settings.SHORTENER_REUSE_EXISTING_SHORTCUTS = True
+    data = [{"url": original_url}, {"url": "https://example.com/new"}, {"url": "https://EXAMPLE.com/new"}]
+    serializer = URLSerializer(data=data, many=True)
+    assert serializer.is_valid()
+    urls = serializer.save()
+
+    assert urls[0] == url_object
+    assert urls[1] is urls[2]
+    assert URL.objects.count() == 2
+
+
+@pytest.mark.parametrize(
+    "attrs",
+    [
+        {},
+        {
+            "expires_at": datetime.datetime(2030, 1, 2, 3, 4, 5, 678000, tzinfo=datetime.timezone.utc),
+            "max_uses": 10,
+            "redirect_permanent": True,
+            "redirect_max_age": 60,
+            "last_accessed": datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc),
+            "use_count": 5,
+        },
+    ],
+)
+@pytest.mark.django_db
+def test_url_serializer_representation(attrs, settings):
+    """Test `shortener.serializers.URLSerializer.to_representation`.
+
+    Check that it returns the same data, in the same order, as building it from serializer fields does.
+    """
+    settings.TIME_ZONE = "Europe/Warsaw"
+    url = URLFactory(**attrs)
+    serializer = URLSerializer(url)
+
+    data = serializer.data
+    assert list(data.items()) == list(ModelSerializer.to_representation(serializer, url).items())
+    assert list(data) == URLSerializer.Meta.fields
+
+
+def test_url_serializer_fields_are_not_shared():
+    """Test `shortener.serializers.URLSerializer.get_fields`. Check that every serializer gets its own fields."""
+    first, second = URLSerializer(), URLSerializer()
+    assert list(first.fields) == URLSerializer.Meta.fields
+    assert first.fields["url"] is not second.fields["url"]
+    assert first.fields["url"].parent is first
@@ -2,8 +2,11 @@ from unittest import mock
 
 import pytest
 import pytest_django.asserts
+from django.core.exceptions import ImproperlyConfigured
 
 from shortener import constants, shortcuts
+from shortener.factories import URLFactory
+from shortener.models import ShortcutSequence
 
 
 @pytest.mark.parametrize("length", [-1, 0, 1, 10, 100])
@@ -23,8 +26,8 @@ def test_get_random_slug(length):
 
 
 @pytest.mark.django_db
-def test_get_shortcut_shortcut_found(existing_shortcuts, faker):
-    """Test `shortener.shortcuts.get_shortcut`.
+def test_get_random_shortcut_shortcut_found(existing_shortcuts, faker):
+    """Test `shortener.shortcuts.get_random_shortcut`.
 
     Check that it returns unique, non-existing shortcut
     """
@@ -37,14 +40,14 @@ def test_get_shortcut_shortcut_found(existing_shortcuts, faker):
     with mock.patch("shortener.shortcuts.get_random_slug", side_effect=random_slugs):
         # Each shortcut had to be tested if it exists
         with pytest_django.asserts.assertNumQueries(len(random_slugs)):
-            shortcut = shortcuts.get_shortcut()
+            shortcut = shortcuts.get_random_shortcut()
 
     assert shortcut == non_existing_shortcut
 
 
 @pytest.mark.django_db
-def test_get_shortcut_shortcut_not_found(existing_shortcuts):
-    """Test `shortener.shortcuts.get_shortcut`.
+def test_get_random_shortcut_shortcut_not_found(existing_shortcuts):
+    """Test `shortener.shortcuts.get_random_shortcut`.
 
     Check that it raises `GenerationError` if it was unable to find shortcut in several attempts.
     """
@@ -53,4 +56,216 @@ def test_get_shortcut_shortcut_not_found(existing_shortcuts):
         # Each shortcut had to be tested if it exists
         with pytest_django.asserts.assertNumQueries(len(existing_shortcuts)):
             with pytest.raises(shortcuts.GenerationError):
-                shortcuts.get_shortcut()
+                shortcuts.get_random_shortcut()
+
+
+@pytest.mark.parametrize("length", [constants.MIN_SHORTCUT_LENGTH, 7, constants.MAX_SHORTCUT_LENGTH])
+def test_permute_is_reversible(length):
+    """Test `shortener.shortcuts.permute`. Check that permuted values stay in the keyspace and can be reversed."""
+    keyspace = len(shortcuts.CHARSET) ** length
+    for value in [0, 1, 2, 1000, keyspace - 1]:
+        permuted = shortcuts.permute(value, length)
+        assert 0 <= permuted < keyspace
+        assert shortcuts.unpermute(permuted, length) == value
+
+
+def test_encode_decode():
+    """Test `shortener.shortcuts.encode` and `shortener.shortcuts.decode`."""
+    assert shortcuts.encode(0, 5) == "aaaaa"
+    assert shortcuts.encode(61, 5) == "aaaa9"
+    assert shortcuts.decode(shortcuts.encode(123456789, 6)) == 123456789
+    with pytest.raises(ValueError):
+        shortcuts.encode(len(shortcuts.CHARSET) ** 5, 5)
+
+
+@pytest.mark.django_db
+def test_sequence_allocator_reserves_blocks():
+    """Test `shortener.shortcuts.SequenceAllocator`.
+
+    Check that it hands out unique shortcuts and queries the database only once per block.
+    """
+    allocator = shortcuts.SequenceAllocator(block_size=10)
+    allocated = allocator.allocate(4)
+    with pytest_django.asserts.assertNumQueries(0):
+        allocated += allocator.allocate(6)
+    # Remaining count bigger than the block size is reserved at once.
+    allocated += allocator.allocate(25)
+
+    assert len(set(allocated)) == 35
+    assert all(len(shortcut) == constants.MIN_SHORTCUT_LENGTH for shortcut in allocated)
+    assert ShortcutSequence.objects.get(length=constants.MIN_SHORTCUT_LENGTH).next_value == 35
+
+
+@pytest.mark.django_db
+def test_sequence_allocator_processes_dont_collide():
+    """Test `shortener.shortcuts.SequenceAllocator`. Check that separate allocators get disjoint blocks."""
+    first, second = shortcuts.SequenceAllocator(block_size=5), shortcuts.SequenceAllocator(block_size=5)
+    allocated = first.allocate(3) + second.allocate(3) + first.allocate(3)
+    assert len(set(allocated)) == 9
+
+
+@pytest.mark.django_db
+def test_sequence_allocator_moves_to_longer_shortcuts():
+    """Test `shortener.shortcuts.SequenceAllocator`. Check that it uses longer shortcuts once keyspace is exhausted."""
+    keyspace = len(shortcuts.CHARSET) ** constants.MIN_SHORTCUT_LENGTH
+    ShortcutSequence.objects.create(length=constants.MIN_SHORTCUT_LENGTH, next_value=keyspace - 1)
+
+    allocated = shortcuts.SequenceAllocator(block_size=10).allocate(2)
+    assert [len(shortcut) for shortcut in allocated] == [
+        constants.MIN_SHORTCUT_LENGTH,
+        constants.MIN_SHORTCUT_LENGTH + 1,
+    ]
+
+
+@pytest.mark.django_db
+def test_sequence_allocator_skips_disallowed_shortcuts():
+    """Test `shortener.shortcuts.SequenceAllocator`. Check that disallowed shortcuts are never handed out."""
+    disallowed = shortcuts.encode(shortcuts.permute(0, constants.MIN_SHORTCUT_LENGTH), constants.MIN_SHORTCUT_LENGTH)
+    with mock.patch("shortener.constants.DISALLOWED_SHORTCUTS", (disallowed,)):
+        allocated = shortcuts.SequenceAllocator(block_size=10).allocate(3)
+    assert disallowed not in allocated
+    assert len(allocated) == 3
+
+
+@pytest.mark.django_db
+def test_sequence_allocator_exhausted():
+    """Test `shortener.shortcuts.SequenceAllocator`. Check that `GenerationError` is raised when there's no space."""
+    for length in range(constants.MIN_SHORTCUT_LENGTH, constants.MAX_SHORTCUT_LENGTH + 1):
+        ShortcutSequence.objects.create(length=length, next_value=len(shortcuts.CHARSET) ** length)
+
+    with pytest.raises(shortcuts.GenerationError):
+        shortcuts.SequenceAllocator(block_size=10).allocate()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("allocator", shortcuts.ALLOCATORS)
+def test_get_shortcut(allocator, settings):
+    """Test `shortener.shortcuts.get_shortcut`. Check that shortcut is generated with the configured allocator."""
+    settings.SHORTENER_SHORTCUT_ALLOCATOR = allocator
+    shortcut = shortcuts.get_shortcut()
+    assert constants.MIN_SHORTCUT_LENGTH <= len(shortcut) <= constants.MAX_SHORTCUT_LENGTH
+
+
+def test_get_shortcut_invalid_allocator(settings):
+    """Test `shortener.shortcuts.get_shortcut`. Check that unknown allocator is reported."""
+    settings.SHORTENER_SHORTCUT_ALLOCATOR = "invalid"
+    with pytest.raises(ImproperlyConfigured):
+        shortcuts.get_shortcut()
+
+
+@pytest.mark.django_db
+def test_get_random_shortcuts(existing_shortcuts):
+    """Test `shortener.shortcuts.get_random_shortcuts`. Check that only non-existing shortcuts are returned."""
+    random_slugs = existing_shortcuts[:2] + ["first", "second", "third"]
+    with mock.patch("shortener.shortcuts.get_random_slug", side_effect=random_slugs):
+        with pytest_django.asserts.assertNumQueries(2):
+            generated = shortcuts.get_random_shortcuts(3)
+
+    assert sorted(generated) == ["first", "second", "third"]
+
+
+@pytest.mark.django_db
+def test_count_shortcuts_by_length():
+    """Test `shortener.shortcuts.count_shortcuts_by_length`. Check that shortcuts are counted per length."""
+    for shortcut in ["abcde", "bcdef", "abcdef"]:
+        URLFactory(shortcut=shortcut)
+    assert shortcuts.count_shortcuts_by_length() == {5: 2, 6: 1}
+
+
+@pytest.mark.django_db
+def test_keyspace_occupancy_start_length():
+    """Test `shortener.shortcuts.KeyspaceOccupancy`. Check that it starts at the shortest length which isn't crowded."""
+    for shortcut in ["abcde", "bcdef", "abcdef"]:
+        URLFactory(shortcut=shortcut)
+    occupancy = shortcuts.KeyspaceOccupancy(ttl=60, max_occupancy=0.1)
+
+    with mock.patch("shortener.shortcuts.get_keyspace_size", return_value=20):
+        assert occupancy.get_start_length() == 6
+        with pytest_django.asserts.assertNumQueries(0):
+            occupancy.record(["cdefgh"], start_length=6)
+            assert occupancy.get_start_length() == 7
+
+
+@pytest.mark.django_db
+def test_keyspace_occupancy_learns_from_escalations():
+    """Test `shortener.shortcuts.KeyspaceOccupancy`. Check that lengths skipped by the generator are treated as full."""
+    occupancy = shortcuts.KeyspaceOccupancy(ttl=60, max_occupancy=0.1)
+    start_length = occupancy.get_start_length()
+    assert start_length == constants.MIN_SHORTCUT_LENGTH
+
+    occupancy.record(["x" * (start_length + 1)], start_length)
+
+    assert occupancy.get_occupancy(start_length) == 1
+    assert occupancy.get_start_length() == start_length + 1
+
+
+@pytest.mark.django_db
+def test_get_shortcut_random_allocator_starts_at_free_length(settings):
+    """Test `shortener.shortcuts.get_shortcut`. Check that random allocator skips lengths known to be crowded."""
+    settings.SHORTENER_SHORTCUT_ALLOCATOR = "random"
+    # Changed setting gives this test its own process-wide occupancy, which is dropped again once it's restored.
+    settings.SHORTENER_KEYSPACE_STATS_TTL = 60
+    occupancy = shortcuts.get_keyspace_occupancy()
+    occupancy.refresh()
+    occupancy.record(["x" * (constants.MIN_SHORTCUT_LENGTH + 1)], constants.MIN_SHORTCUT_LENGTH)
+
+    # Only the existence check of the generated shortcut.
+    with pytest_django.asserts.assertNumQueries(1):
+        shortcut = shortcuts.get_shortcut()
+
+    assert len(shortcut) == constants.MIN_SHORTCUT_LENGTH + 1
+
+
+@pytest.mark.parametrize("length", [constants.MIN_SHORTCUT_LENGTH, constants.MAX_SHORTCUT_LENGTH])
+def test_get_shard(length):
+    """Test `shortener.shortcuts.get_shard`. Check that shortcuts are mapped back onto shards they come from."""
+    for shard in range(3):
+        for index in (0, 1, 1000):
+            shortcut = shortcuts.get_shard_shortcut(index, length, shard, 3)
+            assert len(shortcut) == length
+            assert shortcuts.get_shard(shortcut, 3) == shard
+
+
+@pytest.mark.parametrize("shortcut", ["abc-_", "abcd", "abcdefghijk"])
+def test_get_shard_not_generated(shortcut):
+    """Test `shortener.shortcuts.get_shard`. Check that shortcuts which couldn't have been generated have no shard."""
+    assert shortcuts.get_shard(shortcut, 3) is None
+
+
+def test_get_shard_shortcut_single_shard():
+    """Test `shortener.shortcuts.get_shard_shortcut`. Check that a single shard uses the whole keyspace."""
+    length = constants.MIN_SHORTCUT_LENGTH
+    assert shortcuts.get_shard_shortcut(42, length, 0, 1) == shortcuts.encode(shortcuts.permute(42, length), length)
+
+
+@pytest.mark.django_db
+def test_sequence_allocator_shards_dont_collide():
+    """Test `shortener.shortcuts.SequenceAllocator`. Check that allocators of different shards use separate counters."""
+    first = shortcuts.SequenceAllocator(block_size=5, shard=0, shard_count=2)
+    second = shortcuts.SequenceAllocator(block_size=5, shard=1, shard_count=2)
+    allocated_first, allocated_second = first.allocate(7), second.allocate(3)
+
+    assert not set(allocated_first) & set(allocated_second)
+    assert {shortcuts.get_shard(shortcut, 2) for shortcut in allocated_first} == {0}
+    assert {shortcuts.get_shard(shortcut, 2) for shortcut in allocated_second} == {1}
+    assert dict(ShortcutSequence.objects.values_list("shard", "next_value")) == {0: 7, 1: 5}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("allocator", shortcuts.ALLOCATORS)
+def test_get_shortcuts_from_node_shard(allocator, settings):
+    """Test `shortener.shortcuts.get_shortcuts`. Check that both allocators use the shard owned by the node only."""
+    settings.SHORTENER_SHORTCUT_ALLOCATOR = allocator
+    settings.SHORTENER_SHARD_COUNT = 4
+    settings.SHORTENER_SHARD = 3
+
+    allocated = [shortcuts.get_shortcut(), *shortcuts.get_shortcuts(20)]
+    assert {shortcuts.get_shard(shortcut, 4) for shortcut in allocated} == {3}
+
+
+def test_get_node_shard_invalid(settings):
+    """Test `shortener.shortcuts.get_node_shard`. Check that shard out of range is rejected."""
+    settings.SHORTENER_SHARD_COUNT = 2
+    settings.SHORTENER_SHARD = 2
+    with pytest.raises(ImproperlyConfigured):
+        shortcuts.get_node_shard()
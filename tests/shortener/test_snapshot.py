@@ -0,0 +1,159 @@
+import os
+import struct
+from datetime import datetime, timezone
+
+import pytest
+import pytest_django.asserts
+from asgiref.sync import async_to_sync
+from django.core.management import CommandError, call_command
+
+from shortener import resolvers, snapshot
+from shortener.cache import ResolvedURL
+from shortener.factories import URLFactory
+from shortener.models import URL
+
+
+@pytest.fixture
+def snapshot_path(tmp_path) -> str:
+    return str(tmp_path / "urls.snapshot")
+
+
+def test_write_snapshot(snapshot_path):
+    """Test `shortener.snapshot.Snapshot`. Check that written rows are found by shortcut and iterated in order."""
+    rows = [
+        ("A", ResolvedURL(3, "https://a.com/")),
+        ("a", ResolvedURL(1, "https://example.com/ü", 1700000000.5, 10, True, 60)),
+        ("ab", ResolvedURL(2, "https://b.com/", None, None, False, 0)),
+    ]
+    assert snapshot.write_snapshot(snapshot_path, rows, last_id=3) == 3
+
+    urls = snapshot.Snapshot(snapshot_path)
+    assert (len(urls), urls.last_id) == (3, 3)
+    assert list(urls) == rows
+    for shortcut, url in rows:
+        assert urls.get(shortcut) == url
+    for shortcut in ("", "b", "AB", "a" * 100):
+        assert urls.get(shortcut) is None
+
+
+def test_snapshot_record_large_offset():
+    """Test `shortener.snapshot.RECORD_FIELDS`. Check that offsets into blobs larger than 4 GiB fit in records."""
+    record = struct.Struct(f"<5s{snapshot.RECORD_FIELDS}")
+    values = (b"abcde", 1, 2**32 + 5, 100, 1700000000.5, -1, -1, -1)
+    assert record.unpack(record.pack(*values)) == values
+
+
+def test_empty_snapshot(snapshot_path):
+    """Test `shortener.snapshot.Snapshot`. Check that nothing is found in a snapshot without rows."""
+    snapshot.write_snapshot(snapshot_path, [], last_id=0)
+    assert snapshot.Snapshot(snapshot_path).get("abc") is None
+
+
+def test_invalid_snapshot(snapshot_path):
+    """Test `shortener.snapshot.Snapshot`. Check that SnapshotError is raised for other files and truncated ones."""
+    with open(snapshot_path, "wb") as file:
+        file.write(b"not a snapshot at all")
+    with pytest.raises(snapshot.SnapshotError):
+        snapshot.Snapshot(snapshot_path)
+
+    snapshot.write_snapshot(snapshot_path, [("abc", ResolvedURL(1, "https://a.com/"))], last_id=1)
+    with open(snapshot_path, "r+b") as file:
+        file.truncate(snapshot.HEADER.size + 1)
+    with pytest.raises(snapshot.SnapshotError, match="truncated"):
+        snapshot.Snapshot(snapshot_path)
+
+
+def test_sort_in_runs():
+    """Test `shortener.snapshot.sort_in_runs` and `merge_rows`. Check that rows spilled in runs are merged in order."""
+    rows = [(shortcut, ResolvedURL(index, f"https://{shortcut}.com/")) for index, shortcut in enumerate("dbeacf")]
+    with snapshot.ExitStack() as stack:
+        runs = snapshot.sort_in_runs(rows, run_size=4, stack=stack)
+        assert len(runs) == 2
+        assert [shortcut for shortcut, _ in snapshot.merge_rows(*runs)] == list("abcdef")
+
+
+def test_merge_rows_keeps_last_source():
+    """Test `shortener.snapshot.merge_rows`. Check that a shortcut in many sources is taken from the last one."""
+    old = [("a", ResolvedURL(1, "https://old.com/")), ("b", ResolvedURL(2, "https://b.com/"))]
+    new = [("a", ResolvedURL(3, "https://new.com/"))]
+    assert list(snapshot.merge_rows(old, new)) == [new[0], old[1]]
+
+
+@pytest.mark.django_db
+def test_build_snapshot_incremental(snapshot_path):
+    """Test `shortener.snapshot.build_snapshot`. Check that only new URLs are read and merged into the snapshot."""
+    first = URLFactory(shortcut="bbbbb", expires_at=datetime(2100, 1, 1, tzinfo=timezone.utc), max_uses=5)
+    assert snapshot.build_snapshot(snapshot_path) == 1
+
+    URL.objects.filter(id=first.id).update(original="https://changed.com/")
+    second = URLFactory(shortcut="aaaaa")
+    # The highest id, then a chunk with the new URL and an empty one.
+    with pytest_django.asserts.assertNumQueries(3):
+        assert snapshot.build_snapshot(snapshot_path, chunk_size=1) == 2
+
+    urls = snapshot.Snapshot(snapshot_path)
+    assert urls.last_id == second.id
+    assert urls.get("aaaaa") == resolvers.to_resolved_url(second)
+    assert urls.get("bbbbb") == resolvers.to_resolved_url(first)
+
+    # Full build picks up changed URLs.
+    snapshot.build_snapshot(snapshot_path, incremental=False)
+    assert snapshot.Snapshot(snapshot_path).get("bbbbb").original == "https://changed.com/"
+
+
+@pytest.mark.django_db
+def test_build_snapshot_command(snapshot_path, settings):
+    """Test `build_snapshot` management command. Check that snapshot is written to the configured file."""
+    URLFactory.create_batch(3)
+    with pytest.raises(CommandError):
+        call_command("build_snapshot")
+
+    settings.SHORTENER_REDIRECT_SNAPSHOT = snapshot_path
+    call_command("build_snapshot", "--run-size", "2")
+    assert len(snapshot.Snapshot(snapshot_path)) == 3
+
+
+@pytest.mark.django_db
+def test_resolve_shortcut_from_snapshot(settings, snapshot_path, url_object, shortcut):
+    """Test `shortener.resolvers.resolve_shortcut`. Check that shortcuts in the snapshot don't touch the database."""
+    snapshot.build_snapshot(snapshot_path)
+    settings.SHORTENER_REDIRECT_SNAPSHOT = snapshot_path
+    new_url = URLFactory()
+
+    with pytest_django.asserts.assertNumQueries(0):
+        assert resolvers.resolve_shortcut(shortcut) == resolvers.to_resolved_url(url_object)
+        assert async_to_sync(resolvers.aresolve_shortcut)(shortcut) == resolvers.to_resolved_url(url_object)
+    # Missing shortcuts are looked up as usual.
+    with pytest_django.asserts.assertNumQueries(1):
+        assert resolvers.resolve_shortcut(new_url.shortcut) == resolvers.to_resolved_url(new_url)
+
+    settings.SHORTENER_REDIRECT_SNAPSHOT_FALLBACK = False
+    with pytest_django.asserts.assertNumQueries(0):
+        assert resolvers.resolve_shortcut("unknown") is None
+
+
+@pytest.mark.django_db
+def test_snapshot_resolver_reload(snapshot_path, mocker):
+    """Test `shortener.snapshot.SnapshotResolver`. Check that the snapshot is reopened once the file is replaced."""
+    resolver = snapshot.SnapshotResolver(snapshot_path, check_interval=10)
+    monotonic = mocker.patch("time.monotonic", return_value=100)
+    assert resolver.get("abc") is None
+
+    snapshot.write_snapshot(snapshot_path, [("abc", ResolvedURL(1, "https://a.com/"))], last_id=1)
+    assert resolver.get("abc") is None
+    monotonic.return_value = 110
+    assert resolver.get("abc") == ResolvedURL(1, "https://a.com/")
+
+
+def test_snapshot_resolver_keeps_previous_snapshot(snapshot_path, mocker):
+    """Test `shortener.snapshot.SnapshotResolver`. Check that a broken file doesn't replace the snapshot in use."""
+    snapshot.write_snapshot(snapshot_path, [("abc", ResolvedURL(1, "https://a.com/"))], last_id=1)
+    resolver = snapshot.SnapshotResolver(snapshot_path, check_interval=10)
+    monotonic = mocker.patch("time.monotonic", return_value=100)
+    assert resolver.get("abc") == ResolvedURL(1, "https://a.com/")
+
+    with open(f"{snapshot_path}.new", "wb") as file:
+        file.write(b"partial")
+    os.replace(f"{snapshot_path}.new", snapshot_path)
+    monotonic.return_value = 110
+    assert resolver.get("abc") == ResolvedURL(1, "https://a.com/")
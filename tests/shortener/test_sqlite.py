@@ -0,0 +1,63 @@
+import pytest
+from django.db import OperationalError, connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
+
+
+@pytest.fixture
+def connect(settings, tmp_path, django_db_blocker):
+    """Open connections with given alias to a sqlite3 database file."""
+    settings.SHORTENER_SQLITE_TUNING = True
+    settings.SHORTENER_DATABASE_REPLICAS = ["readonly"]
+    wrappers = []
+    django_db_blocker.unblock()
+
+    def connect(alias: str) -> DatabaseWrapper:
+        wrapper = DatabaseWrapper({**connection.settings_dict, "NAME": str(tmp_path / "db.sqlite3")}, alias)
+        wrapper.ensure_connection()
+        wrappers.append(wrapper)
+        return wrapper
+
+    yield connect
+    for wrapper in wrappers:
+        wrapper.close()
+    django_db_blocker.restore()
+
+
+def get_pragma(wrapper: DatabaseWrapper, name: str):
+    with wrapper.cursor() as cursor:
+        cursor.execute(f"PRAGMA {name}")
+        return cursor.fetchone()[0]
+
+
+def test_tune_sqlite_connection(connect, settings):
+    """Test `shortener.sqlite.tune_sqlite_connection`. Check that pragmas are set on new connections."""
+    settings.SHORTENER_SQLITE_BUSY_TIMEOUT = 1234
+    settings.SHORTENER_SQLITE_CACHE_SIZE = 2048
+    wrapper = connect("default")
+
+    assert get_pragma(wrapper, "journal_mode") == "wal"
+    assert get_pragma(wrapper, "synchronous") == 1  # NORMAL
+    assert get_pragma(wrapper, "busy_timeout") == 1234
+    assert get_pragma(wrapper, "cache_size") == -2048
+    assert get_pragma(wrapper, "query_only") == 0
+
+
+def test_tune_sqlite_connection_read_only(connect):
+    """Test `shortener.sqlite.tune_sqlite_connection`. Check that connections of replicas can't write."""
+    primary = connect("default")
+    with primary.cursor() as cursor:
+        cursor.execute("CREATE TABLE example (id INTEGER)")
+    replica = connect("readonly")
+
+    assert get_pragma(replica, "query_only") == 1
+    with replica.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM example")
+        with pytest.raises(OperationalError):
+            cursor.execute("INSERT INTO example VALUES (1)")
+
+
+def test_tune_sqlite_connection_disabled(connect, settings):
+    """Test `shortener.sqlite.tune_sqlite_connection`. Check that connections are left alone unless it's enabled."""
+    settings.SHORTENER_SQLITE_TUNING = False
+    wrapper = connect("default")
+    assert get_pragma(wrapper, "journal_mode") == "delete"
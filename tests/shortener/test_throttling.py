@@ -0,0 +1,166 @@
+from unittest import mock
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.urls import reverse
+
+from shortener import throttling
+from shortener.factories import URLFactory
+
+URL_LIST_VIEW_NAME = "url-list"
+URL_DETAIL_VIEW_NAME = "url-detail"
+URL_BULK_CREATE_VIEW_NAME = "url-bulk-create"
+URL_BATCH_RESOLVE_VIEW_NAME = "url-batch-resolve"
+
+
+@pytest.mark.parametrize(
+    "rate, expected",
+    [("10/s", (10, 10)), ("60/min", (60, 1)), ("7200/hour", (7200, 2)), ("1/d", (1, 1 / 86400))],
+)
+def test_parse_rate(rate, expected):
+    """Test `shortener.throttling.parse_rate`. Check that rate is parsed into capacity and tokens per second."""
+    assert throttling.parse_rate(rate) == expected
+
+
+@pytest.mark.parametrize("rate", ["10", "ten/s", "0/s", "10/week", "10/"])
+def test_parse_invalid_rate(rate):
+    """Test `shortener.throttling.parse_rate`. Check that ValueError is raised for invalid rates."""
+    with pytest.raises(ValueError):
+        throttling.parse_rate(rate)
+
+
+@pytest.mark.parametrize(
+    "num_proxies, meta, expected",
+    [
+        (None, {"REMOTE_ADDR": "10.0.0.1"}, "10.0.0.1"),
+        (None, {"REMOTE_ADDR": "10.0.0.1", "HTTP_X_FORWARDED_FOR": "1.1.1.1, 2.2.2.2"}, "10.0.0.1"),
+        (1, {"REMOTE_ADDR": "10.0.0.1"}, "10.0.0.1"),
+        (0, {"REMOTE_ADDR": "10.0.0.1", "HTTP_X_FORWARDED_FOR": "1.1.1.1"}, "10.0.0.1"),
+        (1, {"REMOTE_ADDR": "10.0.0.1", "HTTP_X_FORWARDED_FOR": "1.1.1.1, 2.2.2.2"}, "2.2.2.2"),
+        (5, {"REMOTE_ADDR": "10.0.0.1", "HTTP_X_FORWARDED_FOR": "1.1.1.1, 2.2.2.2"}, "1.1.1.1"),
+    ],
+)
+def test_get_client_ident(settings, num_proxies, meta, expected):
+    """Test `shortener.throttling.get_client_ident`. Check that X-Forwarded-For is used only behind proxies."""
+    settings.REST_FRAMEWORK = {"NUM_PROXIES": num_proxies}
+    assert throttling.get_client_ident(meta) == expected
+
+
+@pytest.mark.parametrize(
+    "buckets",
+    [lambda: throttling.LocalTokenBuckets(max_size=10), lambda: throttling.DjangoTokenBuckets("default")],
+    ids=["local", "django"],
+)
+def test_token_buckets(buckets):
+    """Test token buckets. Check that burst up to capacity is allowed and tokens are refilled with the rate."""
+    buckets = buckets()
+    with mock.patch("time.monotonic", return_value=1000), mock.patch("time.time", return_value=1000):
+        assert [buckets.consume("a", 2, 0.5) for _ in range(3)] == [0, 0, 2]
+        assert buckets.consume("b", 2, 0.5) == 0
+
+    with mock.patch("time.monotonic", return_value=1001), mock.patch("time.time", return_value=1001):
+        assert buckets.consume("a", 2, 0.5) == 1
+
+    with mock.patch("time.monotonic", return_value=1002), mock.patch("time.time", return_value=1002):
+        assert buckets.consume("a", 2, 0.5) == 0
+        assert buckets.consume("a", 2, 0.5) == 2
+
+    with mock.patch("time.monotonic", return_value=1100), mock.patch("time.time", return_value=1100):
+        assert [buckets.consume("a", 2, 0.5) for _ in range(3)] == [0, 0, 2]
+
+
+def test_token_buckets_cost():
+    """Test `shortener.throttling.BaseTokenBuckets.take`. Check that many tokens are taken at once, at most capacity."""
+    bucket, wait = throttling.LocalTokenBuckets.take(None, 1000, 10, 1, cost=4)
+    assert (bucket, wait) == ((6, 1000), 0)
+    bucket, wait = throttling.LocalTokenBuckets.take(bucket, 1000, 10, 1, cost=8)
+    assert (bucket, wait) == ((6, 1000), 2)
+    assert throttling.LocalTokenBuckets.take(None, 1000, 10, 1, cost=100) == ((0, 1000), 0)
+
+
+def test_django_token_buckets_async():
+    """Test `shortener.throttling.DjangoTokenBuckets.aconsume`. Check that it shares buckets with `consume`."""
+    buckets = throttling.DjangoTokenBuckets("default")
+    assert buckets.consume("c", 1, 1) == 0
+    assert async_to_sync(buckets.aconsume)("c", 1, 1) > 0
+
+
+def test_local_token_buckets_eviction():
+    """Test `shortener.throttling.LocalTokenBuckets`. Check that the least recently used bucket is dropped first."""
+    buckets = throttling.LocalTokenBuckets(max_size=2)
+    for key in ("a", "b", "a", "c"):
+        buckets.consume(key, 1, 0.001)
+
+    assert len(buckets) == 2
+    assert buckets.consume("a", 1, 0.001) > 0
+    assert buckets.consume("b", 1, 0.001) == 0
+
+
+def test_build_token_buckets(settings):
+    """Test `shortener.throttling.get_token_buckets`. Check that the store follows settings."""
+    assert isinstance(throttling.get_token_buckets(), throttling.LocalTokenBuckets)
+    settings.SHORTENER_THROTTLE_BACKEND = "default"
+    assert isinstance(throttling.get_token_buckets(), throttling.DjangoTokenBuckets)
+
+
+@pytest.mark.django_db
+def test_create_throttling(settings, client, original_url):
+    """Test that creating URLs is limited per client, counting bulk creation, but not reading URL details."""
+    settings.SHORTENER_THROTTLE_CREATE_RATE = "2/min"
+    url = URLFactory()
+
+    assert client.post(reverse(URL_LIST_VIEW_NAME), {"url": original_url}).status_code == 201
+    response = client.post(reverse(URL_BULK_CREATE_VIEW_NAME), [{"url": original_url}], content_type="application/json")
+    assert response.status_code == 201
+    response = client.post(reverse(URL_LIST_VIEW_NAME), {"url": original_url})
+    assert response.status_code == 429
+    assert response["Retry-After"] == "30"
+    assert client.get(reverse(URL_DETAIL_VIEW_NAME, args=[url.shortcut])).status_code == 200
+
+    # Another client has its own bucket.
+    assert client.post(reverse(URL_LIST_VIEW_NAME), {"url": original_url}, REMOTE_ADDR="10.0.0.2").status_code == 201
+
+
+@pytest.mark.django_db
+def test_batch_throttling(settings, client, original_url, shortcut):
+    """Test that bulk creation and batch resolving take a token per item."""
+    settings.SHORTENER_THROTTLE_CREATE_RATE = "3/min"
+    settings.SHORTENER_THROTTLE_RETRIEVE_RATE = "3/min"
+    data = [{"url": original_url}] * 2
+    bulk_create_url = reverse(URL_BULK_CREATE_VIEW_NAME)
+    assert client.post(bulk_create_url, data, content_type="application/json").status_code == 201
+    response = client.post(bulk_create_url, data, content_type="application/json")
+    assert response.status_code == 429
+    assert response["Retry-After"] == "20"
+
+    data = {"shortcuts": [shortcut] * 2}
+    assert client.post(reverse(URL_BATCH_RESOLVE_VIEW_NAME), data, content_type="application/json").status_code == 200
+    response = client.post(reverse(URL_BATCH_RESOLVE_VIEW_NAME), data, content_type="application/json")
+    assert response.status_code == 429
+
+
+@pytest.mark.django_db
+def test_retrieve_throttling(settings, client, url_object, shortcut):
+    """Test that reading URL details and stats is limited separately from creating URLs."""
+    settings.SHORTENER_THROTTLE_RETRIEVE_RATE = "2/h"
+
+    assert client.get(reverse(URL_DETAIL_VIEW_NAME, args=[shortcut])).status_code == 200
+    assert client.get(reverse("url-stats", args=[shortcut])).status_code == 200
+    response = client.get(reverse(URL_DETAIL_VIEW_NAME, args=[shortcut]))
+    assert response.status_code == 429
+    assert response["Retry-After"] == "1800"
+    assert client.post(reverse(URL_LIST_VIEW_NAME), {"url": "https://example.com/"}).status_code == 201
+
+
+@pytest.mark.django_db
+def test_redirect_throttling(settings, client, url_object, shortcut):
+    """Test that redirects are limited per client, unknown shortcuts included, and 429 is returned with Retry-After."""
+    settings.SHORTENER_THROTTLE_REDIRECT_RATE = "2/s"
+
+    assert client.get(f"/{shortcut}/").status_code == 302
+    assert client.get("/unknown/").status_code == 404
+    response = client.get(f"/{shortcut}/")
+    assert response.status_code == 429
+    assert response["Retry-After"] == "1"
+    url_object.refresh_from_db()
+    assert url_object.use_count == 1
@@ -1,16 +1,22 @@
-from datetime import datetime
+import json
+from datetime import datetime, timezone
 from unittest import mock
 
 import freezegun
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from shortener.factories import URLFactory
 from shortener.models import URL
+from shortener.serializers import URLSerializer
 from shortener.shortcuts import GenerationError
 
 URL_LIST_VIEW_NAME = "url-list"
 URL_DETAIL_VIEW_NAME = "url-detail"
+URL_BULK_CREATE_VIEW_NAME = "url-bulk-create"
+URL_BATCH_RESOLVE_VIEW_NAME = "url-batch-resolve"
 RESOLVE_URL_VIEW_NAME = "resolve-url"
 
 
@@ -32,6 +38,30 @@ def test_post_invalid_url(client):
     assert URL.objects.count() == 0
 
 
+@pytest.mark.django_db
+def test_post_url_with_limits(client, original_url):
+    """Test that URL can be created with expiration date and max number of uses."""
+    data = {"url": original_url, "expires_at": "2100-01-01T00:00:00Z", "max_uses": 10}
+    response = client.post(reverse(URL_LIST_VIEW_NAME), data)
+    assert response.status_code == 201
+    assert response.json()["expires_at"] == "2100-01-01T00:00:00Z"
+    assert response.json()["max_uses"] == 10
+    url = URL.objects.get()
+    assert (url.expires_at, url.max_uses) == (datetime(2100, 1, 1, tzinfo=timezone.utc), 10)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "data, field",
+    [({"expires_at": "2023-09-06T11:19:00Z"}, "expires_at"), ({"max_uses": 0}, "max_uses")],
+)
+def test_post_url_invalid_limits(client, original_url, data, field):
+    """Test that URL is not created if it would be expired right away."""
+    response = client.post(reverse(URL_LIST_VIEW_NAME), {"url": original_url, **data})
+    assert response.status_code == 400
+    assert list(response.json()) == [field]
+
+
 def test_post_generation_error(client, original_url):
     """Test that nice error is returned when there was shortcut generation error."""
     with mock.patch("shortener.shortcuts.get_shortcut", side_effect=GenerationError("Generation error test msg")):
@@ -58,9 +88,46 @@ def test_get_url_details(client, settings, shortcut, original_url):
         "last_accessed": None,
         "use_count": 0,
         "shortened_url": settings.SITE_URL + shortcut + "/",
+        "expires_at": None,
+        "max_uses": None,
+        "redirect_permanent": None,
+        "redirect_max_age": None,
     }
 
 
+@pytest.mark.django_db
+def test_get_url_details_not_modified(client, mocker, shortcut, url_object):
+    """Test that 304 is returned without serializing the URL if it didn't change since the ETag has been issued."""
+    response = client.get(reverse(URL_DETAIL_VIEW_NAME, args=(shortcut,)))
+    assert response["Cache-Control"] == "no-cache"
+    etag = response["ETag"]
+
+    to_representation = mocker.spy(URLSerializer, "to_representation")
+    response = client.get(reverse(URL_DETAIL_VIEW_NAME, args=(shortcut,)), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert response["ETag"] == etag
+    assert response.content == b""
+    to_representation.assert_not_called()
+
+    client.get(reverse(RESOLVE_URL_VIEW_NAME, args=(shortcut,)))
+    response = client.get(reverse(URL_DETAIL_VIEW_NAME, args=(shortcut,)), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+
+
+@pytest.mark.django_db
+def test_get_url_details_if_modified_since(client, shortcut):
+    """Test that URL details are returned regardless of If-Modified-Since, as changes of URLs aren't dated."""
+    with freezegun.freeze_time("2023-09-06T11:19:05Z"):
+        URLFactory(shortcut=shortcut)
+
+    response = client.get(
+        reverse(URL_DETAIL_VIEW_NAME, args=(shortcut,)), HTTP_IF_MODIFIED_SINCE="Wed, 06 Sep 2023 11:19:05 GMT"
+    )
+    assert response.status_code == 200
+    assert "Last-Modified" not in response
+
+
 @pytest.mark.django_db
 def test_get_url_not_found(client, url_object):
     """Test that 404 is returned if the shortcut is wrong."""
@@ -76,6 +143,31 @@ def test_redirect(client, shortcut, original_url, url_object):
     assert response.url == original_url
 
 
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "url_policy, default_policy, status, cache_control",
+    [
+        ({}, {}, 302, "no-store"),
+        ({}, {"SHORTENER_REDIRECT_PERMANENT": True, "SHORTENER_REDIRECT_MAX_AGE": 60}, 301, "public, max-age=60"),
+        ({"redirect_permanent": True, "redirect_max_age": 3600}, {}, 301, "public, max-age=3600"),
+        ({"redirect_permanent": False, "redirect_max_age": 0}, {"SHORTENER_REDIRECT_MAX_AGE": 60}, 302, "no-store"),
+        ({"redirect_max_age": 3600, "max_uses": 10}, {}, 302, "no-store"),
+    ],
+)
+def test_redirect_cache_policy(
+    client, settings, shortcut, original_url, url_policy, default_policy, status, cache_control
+):
+    """Test that redirect status and cache headers follow the URL's policy and settings."""
+    for name, value in default_policy.items():
+        setattr(settings, name, value)
+    URLFactory(shortcut=shortcut, original=original_url, **url_policy)
+
+    response = client.get(reverse(RESOLVE_URL_VIEW_NAME, args=(shortcut,)), follow=False)
+    assert response.status_code == status
+    assert response["Cache-Control"] == cache_control
+    assert response.url == original_url
+
+
 @pytest.mark.django_db
 def test_redirect_invalid_shortcut(client, url_object):
     """Test that 404 is raised if non-existing shortcut is attempted to be resolved."""
@@ -100,3 +192,149 @@ def test_redirect_update_url_usage(client, n_uses, shortcut, url_object):
         assert url_object.last_accessed is not None
         assert isinstance(url_object.last_accessed, datetime)
     assert url_object.use_count == n_uses
+
+
+@pytest.mark.django_db
+def test_redirect_cached_shortcut_skips_read_query(client, shortcut, original_url, url_object):
+    """Test that redirect for a cached shortcut runs only the usage UPDATE and no SELECT query."""
+    client.get(reverse(RESOLVE_URL_VIEW_NAME, args=(shortcut,)), follow=False)
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(reverse(RESOLVE_URL_VIEW_NAME, args=(shortcut,)), follow=False)
+
+    assert response.status_code == 302
+    assert response.url == original_url
+    assert [query["sql"].split()[0] for query in queries] == ["UPDATE"]
+
+
+@pytest.mark.django_db
+def test_redirect_expired_url(client, shortcut):
+    """Test that 410 is returned for URL past its expiration date."""
+    URLFactory(shortcut=shortcut, expires_at=datetime(2023, 9, 6, tzinfo=timezone.utc))
+    response = client.get(reverse(RESOLVE_URL_VIEW_NAME, args=(shortcut,)), follow=False)
+    assert response.status_code == 410
+
+
+@pytest.mark.django_db
+def test_redirect_used_up_url(client, shortcut):
+    """Test that URL can be used only max uses times and that limit is checked by the usage UPDATE alone."""
+    url = URLFactory(shortcut=shortcut, max_uses=2)
+    assert client.get(reverse(RESOLVE_URL_VIEW_NAME, args=(shortcut,)), follow=False).status_code == 302
+
+    with CaptureQueriesContext(connection) as queries:
+        assert client.get(reverse(RESOLVE_URL_VIEW_NAME, args=(shortcut,)), follow=False).status_code == 302
+        assert client.get(reverse(RESOLVE_URL_VIEW_NAME, args=(shortcut,)), follow=False).status_code == 410
+
+    assert [query["sql"].split()[0] for query in queries] == ["UPDATE", "UPDATE"]
+    url.refresh_from_db()
+    assert url.use_count == 2
+
+
+@pytest.mark.django_db
+def test_bulk_create_urls(client):
+    """Test that many URLs can be created at once and that errors are returned in place of invalid items."""
+    data = [{"url": "https://example.com/1"}, {"url": "invalid_url"}, {"url": "https://example.com/2"}]
+    response = client.post(reverse(URL_BULK_CREATE_VIEW_NAME), data, content_type="application/json")
+
+    assert response.status_code == 201
+    results = response.json()
+    assert [result.get("url") for result in results] == ["https://example.com/1", None, "https://example.com/2"]
+    assert results[1] == {"errors": {"url": ["Enter a valid URL."]}}
+    assert URL.objects.count() == 2
+    assert {result["shortcut"] for result in (results[0], results[2])} == set(
+        URL.objects.values_list("shortcut", flat=True)
+    )
+
+
+@pytest.mark.django_db
+def test_bulk_create_urls_all_invalid(client):
+    """Test that 400 is returned with per-item errors if none of the posted URLs is valid."""
+    response = client.post(reverse(URL_BULK_CREATE_VIEW_NAME), [{"url": "invalid"}], content_type="application/json")
+    assert response.status_code == 400
+    assert response.json() == [{"errors": {"url": ["Enter a valid URL."]}}]
+    assert URL.objects.count() == 0
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("data", [{"url": "https://example.com/"}, []])
+def test_bulk_create_urls_not_a_list(client, data):
+    """Test that 400 is returned if posted data is not a non-empty list."""
+    response = client.post(reverse(URL_BULK_CREATE_VIEW_NAME), data, content_type="application/json")
+    assert response.status_code == 400
+    assert "non_field_errors" in response.json()
+
+
+@pytest.mark.django_db
+def test_bulk_create_urls_too_many(client):
+    """Test that 400 is returned if too many URLs are posted at once."""
+    data = [{"url": "https://example.com/"}] * 3
+    with mock.patch("shortener.constants.MAX_BULK_CREATE_SIZE", 2):
+        response = client.post(reverse(URL_BULK_CREATE_VIEW_NAME), data, content_type="application/json")
+    assert response.status_code == 400
+    assert URL.objects.count() == 0
+
+
+def batch_resolve(client, data) -> list[dict]:
+    response = client.post(reverse(URL_BATCH_RESOLVE_VIEW_NAME), data, content_type="application/json")
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/x-ndjson"
+    return [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+
+@pytest.mark.django_db
+def test_batch_resolve(client):
+    """Test that many shortcuts are resolved at once, in the posted order, without counting their uses."""
+    URLFactory(shortcut="aaaaa", original="https://a.com/")
+    URLFactory(shortcut="bbbbb", original="https://b.com/", expires_at=datetime(2020, 1, 1, tzinfo=timezone.utc))
+
+    results = batch_resolve(client, {"shortcuts": ["bbbbb", "unknown", "aaaaa", "aaaaa"]})
+
+    assert results == [
+        {"shortcut": "bbbbb", "found": True, "url": "https://b.com/", "expired": True},
+        {"shortcut": "unknown", "found": False},
+        {"shortcut": "aaaaa", "found": True, "url": "https://a.com/", "expired": False},
+        {"shortcut": "aaaaa", "found": True, "url": "https://a.com/", "expired": False},
+    ]
+    assert set(URL.objects.values_list("use_count", flat=True)) == {0}
+
+
+@pytest.mark.django_db
+def test_batch_resolve_record_use(client):
+    """Test that uses of resolved URLs are counted with `record_use` and used up URLs are reported as expired."""
+    URLFactory(shortcut="aaaaa", max_uses=1)
+
+    results = batch_resolve(client, {"shortcuts": ["aaaaa", "aaaaa"], "record_use": True})
+
+    assert [result["expired"] for result in results] == [False, True]
+    assert URL.objects.get().use_count == 1
+
+
+@pytest.mark.django_db
+def test_batch_resolve_queries(client, mocker):
+    """Test that shortcuts are read in chunks with a query per chunk, and cached shortcuts aren't read at all."""
+    mocker.patch("shortener.constants.BATCH_RESOLVE_CHUNK_SIZE", 2)
+    urls = URLFactory.create_batch(5)
+    client.get(f"/{urls[0].shortcut}/")
+
+    with CaptureQueriesContext(connection) as queries:
+        results = batch_resolve(client, {"shortcuts": [url.shortcut for url in urls]})
+    assert [result["found"] for result in results] == [True] * 5
+    assert len(queries) == 3
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        {},
+        {"shortcuts": []},
+        {"shortcuts": "aaaaa"},
+        {"shortcuts": ["a" * 11]},
+        {"shortcuts": [1]},
+        {"shortcuts": ["aaaaa"] * 100_001},
+    ],
+)
+@pytest.mark.django_db
+def test_batch_resolve_invalid(client, data):
+    """Test that 400 is returned for anything but a list of 1 to 100 000 shortcuts."""
+    response = client.post(reverse(URL_BATCH_RESOLVE_VIEW_NAME), data, content_type="application/json")
+    assert response.status_code == 400